@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import duckdb
 
 # --- 页面配置 ---
 st.set_page_config(
@@ -28,10 +27,63 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("💡 量化策略调优区")
     strategy_type = st.selectbox("选择测试策略", options=["经典双均线策略", "进阶 MACD + RSI 震荡策略"])
+    run_mode = st.radio("运行模式", options=["单次回测", "参数扫描 (全网格)", "滚动前推 (Walk-forward)", "条件选股 (全部缓存)"],
+                        horizontal=True,
+                        help="参数扫描会一次性评估滑块范围内的所有参数组合，并按累计收益率排名；"
+                             "滚动前推在每个训练段上寻优、在随后的测试段上检验，输出样本外净值；"
+                             "条件选股在所选市场全部已缓存的标的上用一条 SQL 筛出当天满足条件的股票")
+    
+    # K 线周期：周线 / 月线 / N 日线由日线缓存物化聚合 (utils/resample.py)，切换周期只读预先算好的几百行；
+    # 分钟线读内存映射的列式存储 (utils/intraday.py)
+    timeframe = 'D'
+    if "条件选股" not in run_mode:
+        timeframe_options = {'D': "日线", 'W': "周线", 'M': "月线", 'ND': "自定义 N 日线",
+                             '5min': "5 分钟线", '1min': "1 分钟线"}
+        timeframe = st.selectbox("K 线周期", options=list(timeframe_options), format_func=timeframe_options.get,
+                                 help="均线、MACD、RSI 与回测都在所选周期的 K 线上计算，周期参数的单位随之变为根")
+        if timeframe == 'ND':
+            timeframe = f"{st.number_input('每根 K 线包含的交易日数', min_value=2, max_value=250, value=5)}D"
     
     # 动态渲染炼丹（参数调优）滑块
     strategy_params = {}
-    if "双均线" in strategy_type:
+    sweep_params = {}
+    wf_params = {}
+    screen_params = {}
+    screen_as_of = None
+    if "条件选股" in run_mode:
+        screen_labels = {
+            'golden_cross': "均线金叉", 'death_cross': "均线死叉", 'ma_above': "快线在慢线上方",
+            'rsi_below': "RSI 低于阈值 (超卖)", 'rsi_above': "RSI 高于阈值 (超买)", 'rsi_falls_below': "RSI 从超买区回落",
+        }
+        screen_name = st.selectbox("选股条件", options=list(screen_labels), format_func=screen_labels.get)
+        if screen_name in ('golden_cross', 'death_cross', 'ma_above'):
+            screen_params['fast'] = st.slider("短线周期 (快线)", 1, 30, 5)
+            screen_params['slow'] = st.slider("长线周期 (慢线)", 10, 200, 20)
+        else:
+            screen_params['period'] = st.slider("RSI 判断周期", 2, 30, 14)
+            screen_params['threshold'] = st.slider("RSI 阈值", 5, 95, 30 if screen_name == 'rsi_below' else 70)
+        if st.checkbox("指定筛选交易日", value=False, help="默认使用缓存中最新的交易日"):
+            screen_as_of = st.date_input("筛选交易日", pd.to_datetime("today"))
+    elif "参数扫描" in run_mode or "滚动前推" in run_mode:
+        # 扫描模式：每个参数给出一个区间，区间内所有整数组合都会被评估
+        if "双均线" in strategy_type:
+            st.caption("均线周期扫描区间 (天)")
+            sweep_params['ma_short'] = st.slider("短线周期区间", 1, 30, (1, 30))
+            sweep_params['ma_long'] = st.slider("长线周期区间", 10, 200, (10, 200))
+        elif "MACD" in strategy_type:
+            st.caption("MACD 趋势周期扫描区间")
+            sweep_params['macd_fast'] = st.slider("MACD 快线区间", 1, 50, (8, 16))
+            sweep_params['macd_slow'] = st.slider("MACD 慢线区间", 1, 100, (20, 32))
+            st.caption("RSI 扫描区间 (当前规则中超卖界限不参与买卖判断，故不纳入扫描)")
+            sweep_params['rsi_period'] = st.slider("RSI 周期区间", 2, 30, (10, 18))
+            sweep_params['rsi_overbought'] = st.slider("超买界限区间", 50, 95, (65, 80))
+        if "滚动前推" in run_mode:
+            from utils.walkforward import TRAIN_DAYS, TEST_DAYS
+            st.caption("滚动前推切分 (交易日)，日期范围需覆盖多个训练 + 测试段")
+            wf_params['train_days'] = st.slider("训练段长度", 126, 1260, TRAIN_DAYS, step=21)
+            wf_params['test_days'] = st.slider("测试段长度", 21, 252, TEST_DAYS, step=21)
+            wf_params['anchored'] = st.checkbox("锚定训练起点 (训练段逐折累积)", value=False)
+    elif "双均线" in strategy_type:
         st.caption("均线周期设置 (天)")
         strategy_params['ma_short'] = st.slider("短线周期 (快线)", 1, 30, 5)
         strategy_params['ma_long'] = st.slider("长线周期 (慢线)", 10, 200, 20)
@@ -51,7 +103,25 @@ with st.sidebar:
         with rsi_col2:
             strategy_params['rsi_oversold'] = st.slider("超卖界限(做多区)", 5, 50, 30)
 
+    from utils.chart_data import DEFAULT_POINT_BUDGET
+    chart_budget = st.select_slider("图表点数上限", options=[500, 1000, 2000, 5000, 10000, "不抽稀"],
+                                    value=DEFAULT_POINT_BUDGET,
+                                    help="K 线超过该数量时按桶聚合、指标线按 LTTB 抽稀后再发送给浏览器，买卖点与区间极值完整保留")
+    chart_budget = 0 if chart_budget == "不抽稀" else chart_budget
+    robust_paths = 0
+    if "单次回测" in run_mode:
+        from utils.resample import is_intraday
+        from utils.robustness import DEFAULT_PATHS
+        # 分钟线动辄十万根 K 线，检验默认关闭，需要时再手动开启
+        robust_paths = st.select_slider("稳健性检验路径数", options=["关闭", 1000, 10000, 100000],
+                                        value="关闭" if is_intraday(timeframe) else DEFAULT_PATHS,
+                                        help="对回测收益做平稳分块 Bootstrap、随机入场与信号置换检验，输出 p 值与置信区间")
+        robust_paths = 0 if robust_paths == "关闭" else robust_paths
+
     st.markdown("---")
+    from utils.tracing import tracing_enabled
+    trace_on = st.checkbox("⏱️ 记录各阶段耗时", value=tracing_enabled(),
+                           help="在侧边栏展示本次运行的耗时分解，并追加写入 data/trace.jsonl")
     submit_btn = st.button("开始投研分析", use_container_width=True, type="primary")
 
 # --- 主页面 ---
@@ -59,231 +129,364 @@ st.title("📈 AI 极速量化投研平台")
 st.markdown("欢迎使用基于 `Streamlit` + `uv` + `DuckDB` + `Lightweight Charts` 打造的现代量化开发环境。")
 
 # --- 核心逻辑 ---
-from utils.data_loader import get_a_share_daily, get_us_share_daily
+from utils.data_loader import sync_symbol
+from utils.shared_store import file_version, shared_frame
+from utils.resample import is_intraday, timeframe_label
+from utils.cache import cached_sync, cached_indicator, sync_cache
+from utils.strategy import build_strategy, run_strategy
+from utils.backtest import backtest_frame
+from utils.tracing import start_trace, stage
+from utils.chart_data import build_markers, candle_view, lttb_frame, set_markers
 
-# 当用户点击侧边栏的按钮时触发
+# 当用户点击侧边栏的按钮后进入分析状态，之后拖动滑块会直接用新参数重算
 if submit_btn:
-    with st.spinner(f"正在获取 {symbol} 的 {market_type} 历史数据，请稍候..."):
-        # 将 date 对象转为字符串格式
-        start_str = start_date.strftime("%Y-%m-%d")
-        end_str = end_date.strftime("%Y-%m-%d")
-        
-        # 调用核心获取函数
-        if "A股" in market_type:
-            df = get_a_share_daily(symbol, start_str, end_str)
+    st.session_state['analysis_active'] = True
+
+trace = start_trace("app.run", enabled=False)
+try:
+    if st.session_state.get('analysis_active') and "条件选股" in run_mode:
+        # --- 条件选股模式：所选市场的全部缓存一次 SQL 扫描，不逐个加载标的 ---
+        from utils.screener import run_screen
+    
+        market = "A" if "A股" in market_type else "US"
+        trace = start_trace("app.run", enabled=trace_on, market=market_type, mode=run_mode, screen=screen_name)
+        st.subheader(f"🔍 条件选股：{screen_labels[screen_name]} ({market_type})")
+        stage("screen.compute", **screen_params)
+        with st.spinner("正在扫描全部已缓存标的..."):
+            picks = run_screen(market, screen_name, as_of=screen_as_of, **screen_params)
+        stage("screen.render", matches=len(picks))
+        if picks.empty:
+            st.warning("当天没有满足条件的标的 (或该市场还没有本地缓存，可先用 prefetch.py 批量预热)。")
         else:
-            df = get_us_share_daily(symbol, start_str, end_str)
+            st.success(f"✅ {picks['date'].iloc[0]:%Y-%m-%d} 共 {len(picks)} 只标的满足条件，按信号强度排序。")
+            st.dataframe(picks.rename(columns={
+                'rank': '排名', 'symbol': '代码', 'date': '交易日', 'close': '收盘价', 'ma_fast': '快线',
+                'ma_slow': '慢线', 'rsi': 'RSI', 'score': '信号强度'
+            }), hide_index=True, use_container_width=True)
+            st.caption("信号强度：均线条件为快线相对慢线的偏离，RSI 条件为 RSI 数值 (回落条件为当日回落幅度)。")
+    elif st.session_state.get('analysis_active'):
+        trace = start_trace("app.run", enabled=trace_on, market=market_type, symbol=symbol, timeframe=timeframe,
+                            strategy=strategy_type, mode=run_mode, start=str(start_date), end=str(end_date))
+        with st.spinner(f"正在获取 {symbol} 的 {market_type} 历史数据，请稍候..."):
+            # 将 date 对象转为字符串格式
+            start_str = start_date.strftime("%Y-%m-%d")
+            end_str = end_date.strftime("%Y-%m-%d")
         
-        if df.empty:
-            st.error(f"❌ 未能获取到股票代码为 {symbol} 的数据。请检查代码是否正确（例如：贵州茅台是 600519）。")
-        else:
-            st.success(f"✅ 数据加载成功！共获取 {len(df)} 个交易日数据。")
-            
-            # 计算简单的统计信息
-            st.subheader("💡 基础统计信息")
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("区间起始价", f"{df['开盘'].iloc[0]:.2f}")
-            with col2:
-                st.metric("区间最新价", f"{df['收盘'].iloc[-1]:.2f}")
-            with col3:
-                change = df['收盘'].iloc[-1] - df['开盘'].iloc[0]
-                pct = (change / df['开盘'].iloc[0]) * 100
-                st.metric("区间涨幅", f"{pct:.2f}%", f"{change:.2f}")
-            with col4:
-                st.metric("期间最高价", f"{df['最高'].max():.2f}")
-                
-            # 准备画图数据，转换 Pandas 列名
-            chart_df = df.copy()
-            chart_df = chart_df.rename(columns={
-                '日期': 'time',
-                '开盘': 'open',
-                '最高': 'high',
-                '最低': 'low',
-                '收盘': 'close',
-                '成交量': 'volume'
-            })
-            chart_df['time'] = pd.to_datetime(chart_df['time'])
+            # 调用核心获取函数：缺口检查按区间跨会话缓存，数据直接从进程级共享 Arrow 表零拷贝切片 (已是英文列名)
+            market = "A" if "A股" in market_type else "US"
+            sync_key = (market, symbol.strip().upper(), start_str, end_str)
+        
+            stage("load.frame")
+            if is_intraday(timeframe):
+                # 分钟线：补抓缺口后直接包装内存映射的列数组 (零拷贝)，版本取存储的 manifest
+                from utils.data_loader import clean_symbol_for
+                from utils.intraday import get_intraday, store_version
+                clean_symbol = clean_symbol_for(market, symbol)
+                df = get_intraday(market, symbol, start_str, end_str, timeframe).to_frame()
+                frame_key = (*sync_key, timeframe, store_version(market, clean_symbol, timeframe))
+            else:
+                clean_symbol, _ = cached_sync(sync_key, lambda: sync_symbol(market, symbol, start_str, end_str))
+                df = shared_frame(market, clean_symbol, start_str, end_str, timeframe)
+                # 指标缓存键带上周期与缓存文件版本，增量补抓后旧指标不会被误用
+                frame_key = (*sync_key, timeframe, file_version(market, clean_symbol, timeframe))
+        
+            if df.empty:
+                sync_cache.invalidate(lambda k: k == sync_key)
+                st.error(f"❌ 未能获取到股票代码为 {symbol} 的数据。请检查代码是否正确（例如：贵州茅台是 600519）。")
+            elif "滚动前推" in run_mode:
+                # --- 滚动前推模式：训练段寻优、测试段检验，各折并行计算 ---
+                from utils.walkforward import walk_forward
             
-            # --- 核心量化策略实现 ---
+                def span(bounds):
+                    return range(bounds[0], bounds[1] + 1)
             
-            markers = []
+                strategy_key = 'dual_ma' if "双均线" in strategy_type else 'macd_rsi'
+                grid = {name: span(bounds) for name, bounds in sweep_params.items()}
+                stage("walkforward.compute", rows=len(df), **wf_params)
+                try:
+                    wf = walk_forward(df, strategy_key, grid, **wf_params)
+                except ValueError as e:
+                    wf = None
+                    st.error(f"❌ {e}。请拉长日期范围或缩短训练/测试段。")
             
-            if "双均线" in strategy_type:
-                # 提取参数
-                ma_short_period = strategy_params['ma_short']
-                ma_long_period = strategy_params['ma_long']
+                if wf is not None:
+                    stage("walkforward.render", folds=wf.summary['folds'])
+                    summary = wf.summary
+                    st.success(f"✅ 滚动前推完成！共 {summary['folds']} 折，每折评估 {summary['combos']} 组参数，"
+                               f"样本外 {summary['oos_days']} 个交易日。")
                 
-                chart_df['MA_Short'] = chart_df['close'].rolling(window=ma_short_period).mean()
-                chart_df['MA_Long'] = chart_df['close'].rolling(window=ma_long_period).mean()
+                    st.subheader("🧪 样本外 (Out-of-Sample) 绩效")
+                    m1, m2, m3, m4 = st.columns(4)
+                    with m1:
+                        st.metric("样本外累计收益", f"{summary['oos_return']:.2f}%",
+                                  f"{summary['oos_return'] - summary['benchmark_return']:.2f}% vs 基准")
+                    with m2:
+                        st.metric("样本外最大回撤", f"{summary['max_drawdown']:.2f}%")
+                    with m3:
+                        st.metric("盈利折数", f"{summary['positive_folds']} / {summary['folds']}",
+                                  f"跑赢基准 {summary['beat_benchmark_folds']} 折", delta_color="off")
+                    with m4:
+                        st.metric("前推效率 (WFE)", f"{summary['efficiency']:.2f}",
+                                  help="测试段平均年化收益 / 训练段平均年化收益，接近 1 说明样本内的优势能延续到样本外")
                 
-                # --- 寻找买卖点 (金叉/死叉) 并在图表上打 Tag ---
-                chart_df['prev_MA_Short'] = chart_df['MA_Short'].shift(1)
-                chart_df['prev_MA_Long'] = chart_df['MA_Long'].shift(1)
+                    st.markdown("##### 样本外净值 (各测试段首尾拼接) vs 基准")
+                    nav_df = wf.equity.set_index('time')[['nav', 'benchmark_nav']].rename(
+                        columns={'nav': '策略净值(样本外)', 'benchmark_nav': '基准净值'})
+                    st.line_chart(lttb_frame(nav_df, list(nav_df.columns), chart_budget), height=300)
                 
-                golden_cross = chart_df[(chart_df['prev_MA_Short'] < chart_df['prev_MA_Long']) & (chart_df['MA_Short'] > chart_df['MA_Long'])]
-                death_cross = chart_df[(chart_df['prev_MA_Short'] > chart_df['prev_MA_Long']) & (chart_df['MA_Short'] < chart_df['MA_Long'])]
+                    st.markdown("##### 参数稳定性")
+                    st.dataframe(wf.stability.rename(columns={
+                        'param': '参数', 'mean': '均值', 'std': '标准差', 'min': '最小', 'max': '最大',
+                        'mode': '众数', 'mode_share': '众数占比', 'changes': '相邻折变化次数'
+                    }), use_container_width=True)
                 
-                for _, row in golden_cross.iterrows():
-                    markers.append({
-                        "time": row['time'].strftime('%Y-%m-%d'),
-                        "position": "below",
-                        "shape": "arrow_up",
-                        "color": "#ef5350",
-                        "text": "买入(金叉)"
-                    })
-                    
-                for _, row in death_cross.iterrows():
-                    markers.append({
-                        "time": row['time'].strftime('%Y-%m-%d'),
-                        "position": "above",
-                        "shape": "arrow_down",
-                        "color": "#26a69a",
-                        "text": "卖出(死叉)"
-                    })
-                    
-                # 信号生成: 快线大于慢线时持仓
-                chart_df['Signal'] = 0
-                chart_df.loc[chart_df['MA_Short'] > chart_df['MA_Long'], 'Signal'] = 1
-                
-            elif "MACD" in strategy_type:
-                # 提取 MACD 参数
-                fast = strategy_params['macd_fast']
-                slow = strategy_params['macd_slow']
-                signal_period = 9  # 默认平滑
-                
-                # 提取 RSI 参数
-                rsi_p = strategy_params['rsi_period']
-                rsi_overbought = strategy_params['rsi_overbought']
-                rsi_oversold = strategy_params['rsi_oversold']
-                
-                # 计算 MACD
-                exp1 = chart_df['close'].ewm(span=fast, adjust=False).mean()
-                exp2 = chart_df['close'].ewm(span=slow, adjust=False).mean()
-                chart_df['DIF'] = exp1 - exp2
-                chart_df['DEA'] = chart_df['DIF'].ewm(span=signal_period, adjust=False).mean()
-                chart_df['MACD'] = 2 * (chart_df['DIF'] - chart_df['DEA'])
-                
-                # 计算 RSI
-                delta = chart_df['close'].diff()
-                gain = (delta.where(delta > 0, 0)).rolling(window=rsi_p).mean()
-                loss = (-delta.where(delta < 0, 0)).rolling(window=rsi_p).mean()
-                rs = gain / loss
-                chart_df['RSI'] = 100 - (100 / (1 + rs))
-                
-                # 买卖点逻辑：RSI 从超卖区回升（前一天<=oversold，今天>oversold） 或 MACD 金叉 (且RSI不能在超买区)
-                chart_df['prev_RSI'] = chart_df['RSI'].shift(1)
-                chart_df['prev_DIF'] = chart_df['DIF'].shift(1)
-                chart_df['prev_DEA'] = chart_df['DEA'].shift(1)
-                
-                # 买入条件：MACD金叉，且非超买
-                buy_cond = (chart_df['prev_DIF'] < chart_df['prev_DEA']) & (chart_df['DIF'] > chart_df['DEA']) & (chart_df['RSI'] < rsi_overbought)
-                # 卖出条件：MACD死叉，或者 RSI 极度超买断头铡
-                sell_cond = ((chart_df['prev_DIF'] > chart_df['prev_DEA']) & (chart_df['DIF'] < chart_df['DEA'])) | ((chart_df['prev_RSI'] >= rsi_overbought) & (chart_df['RSI'] < rsi_overbought))
-                
-                buy_points = chart_df[buy_cond]
-                sell_points = chart_df[sell_cond]
-                
-                for _, row in buy_points.iterrows():
-                    markers.append({"time": row['time'].strftime('%Y-%m-%d'), "position": "below", "shape": "arrow_up", "color": "#ef5350", "text": "买入(趋势启动)"})
-                for _, row in sell_points.iterrows():
-                    markers.append({"time": row['time'].strftime('%Y-%m-%d'), "position": "above", "shape": "arrow_down", "color": "#26a69a", "text": "卖出(离场)"})
-                
-                # 信号生成：使用前值填充状态机
-                chart_df['Signal'] = 0
-                chart_df.loc[buy_cond, 'Signal'] = 1
-                chart_df.loc[sell_cond, 'Signal'] = -1
-                # 将信号 1 和 -1 铺满期间，遇到 1 买入，遇到 -1 卖出，期间持仓不变
-                chart_df['Signal'] = chart_df['Signal'].replace(0, pd.NA).ffill().fillna(-1)
-                chart_df['Signal'] = chart_df['Signal'].apply(lambda x: 1 if x == 1 else 0)
+                    st.markdown("##### 各折最优参数与绩效")
+                    st.dataframe(wf.folds.rename(columns={
+                        'fold': '折', 'train_start': '训练起', 'train_end': '训练止', 'test_start': '测试起',
+                        'test_end': '测试止', 'train_return': '训练收益(%)', 'test_return': '测试收益(%)',
+                        'benchmark_return': '基准收益(%)', 'trades': '开仓次数'
+                    }), use_container_width=True)
+            elif "参数扫描" in run_mode:
+                # --- 参数扫描模式：整张网格一次算完，输出排名表与热力图 ---
+                import altair as alt
+                from utils.sweep import sweep_dual_ma, sweep_macd_rsi
             
-            # 延后 1 天交易（避免用到未来函数）
-            chart_df['Signal'] = chart_df['Signal'].shift(1).fillna(0)
+                def span(bounds):
+                    return range(bounds[0], bounds[1] + 1)
             
-            # --- 构建专业的交互式 K 线图 ---
-            st.subheader(f"📈 股票历史走势分析 ({strategy_type})")
+                stage("sweep.compute", rows=len(df))
+                close = df['close'].reset_index(drop=True)
+                if "双均线" in strategy_type:
+                    result = sweep_dual_ma(close, span(sweep_params['ma_short']), span(sweep_params['ma_long']))
+                    heat_x, heat_y = 'ma_long', 'ma_short'
+                else:
+                    result = sweep_macd_rsi(close, span(sweep_params['macd_fast']), span(sweep_params['macd_slow']),
+                                            span(sweep_params['rsi_period']), span(sweep_params['rsi_overbought']))
+                    heat_x, heat_y = 'macd_slow', 'macd_fast'
             
-            from lightweight_charts.widgets import StreamlitChart
+                stage("sweep.render", combos=len(result))
+                benchmark_return = (close.iloc[-1] / close.iloc[0] - 1) * 100
+                st.success(f"✅ 参数扫描完成！共评估 {len(result)} 组参数，区间 {len(df)} 个交易日。")
+                st.subheader(f"🏆 参数排名 Top 20 ({strategy_type})")
+                st.caption(f"基准(一直持有)收益：{benchmark_return:.2f}%")
+                st.dataframe(result.head(20).rename(columns={
+                    'total_return': '累计收益率(%)',
+                    'win_rate': '按日胜率(%)',
+                    'holding_days': '持仓天数',
+                    'trades': '开仓次数'
+                }), use_container_width=True)
             
-            # 初始化图表
-            chart = StreamlitChart(height=500)
-            chart.layout(background_color='#131722', text_color='white')
-            chart.grid(vert_enabled=True, horz_enabled=True, color='rgba(42, 46, 57, 0.5)')
-            chart.candle_style(up_color='#ef5350', down_color='#26a69a', wick_up_color='#ef5350', wick_down_color='#26a69a', border_visible=False)
-            chart.volume_config(scale_margin_top=0.8, scale_margin_bottom=0, up_color='#ef5350', down_color='#26a69a')
-            chart.set(chart_df)
+                # 热力图：对其余参数维度取最优值，观察参数平原是否稳定
+                metric_labels = {'total_return': '累计收益率(%)', 'win_rate': '按日胜率(%)', 'holding_days': '持仓天数'}
+                heat_tabs = st.tabs(list(metric_labels.values()))
+                for tab, (metric, label) in zip(heat_tabs, metric_labels.items()):
+                    with tab:
+                        heat_df = result.groupby([heat_y, heat_x], as_index=False)[metric].max()
+                        heatmap = alt.Chart(heat_df).mark_rect().encode(
+                            x=alt.X(f'{heat_x}:O'),
+                            y=alt.Y(f'{heat_y}:O'),
+                            color=alt.Color(f'{metric}:Q', scale=alt.Scale(scheme='redyellowgreen'), title=label),
+                            tooltip=[heat_y, heat_x, alt.Tooltip(f'{metric}:Q', format='.2f')]
+                        ).properties(height=400)
+                        st.altair_chart(heatmap, use_container_width=True)
+            else:
+                st.success(f"✅ 数据加载成功！共获取 {len(df)} 个交易日数据。")
             
-            if "双均线" in strategy_type:
-                ma_short_name = f"MA{ma_short_period}"
-                ma_long_name = f"MA{ma_long_period}"
-                
-                ma_short_data = chart_df[['time', 'MA_Short']].dropna().rename(columns={'MA_Short': ma_short_name})
-                ma_long_data = chart_df[['time', 'MA_Long']].dropna().rename(columns={'MA_Long': ma_long_name})
+                # 计算简单的统计信息
+                st.subheader("💡 基础统计信息")
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("区间起始价", f"{df['open'].iloc[0]:.2f}")
+                with col2:
+                    st.metric("区间最新价", f"{df['close'].iloc[-1]:.2f}")
+                with col3:
+                    change = df['close'].iloc[-1] - df['open'].iloc[0]
+                    pct = (change / df['open'].iloc[0]) * 100
+                    st.metric("区间涨幅", f"{pct:.2f}%", f"{change:.2f}")
+                with col4:
+                    st.metric("期间最高价", f"{df['high'].max():.2f}")
                 
-                line_short = chart.create_line(name=ma_short_name, color="rgba(255, 192, 0, 1.0)", width=2)
-                line_short.set(ma_short_data)
-                
-                line_long = chart.create_line(name=ma_long_name, color="rgba(41, 98, 255, 1.0)", width=2)
-                line_long.set(ma_long_data)
+                # 画图数据直接使用共享切片 (列名已在加载时转换)，本次运行只在其上追加策略列
+                chart_df = df
+            
+                # --- 核心量化策略实现 ---
+                # 策略在 utils/strategy.py 中声明，编译为去重后的表达式图，在 NumPy 数组上一次算完；
+                # 收盘价上的指标经跨会话缓存复用，只改阈值时不需要重算
+                stage("strategy.graph")
+                strategy_name = 'dual_ma' if "双均线" in strategy_type else 'macd_rsi'
+                spec = build_strategy(strategy_name, **strategy_params)
+                result = run_strategy(spec, chart_df,
+                                      cache=lambda name, params, compute: cached_indicator(frame_key, name, params, compute))
+                for name, values in result.series.items():
+                    chart_df[name] = values
+
+                # 按掩码一次性生成 Marker，不再逐行遍历
+                stage("chart.markers", markers=int(result.buy.sum() + result.sell.sum()))
+                markers = build_markers(chart_df['time'], result.buy, "below", "arrow_up", "#ef5350", spec.buy_label)
+                markers += build_markers(chart_df['time'], result.sell, "above", "arrow_down", "#26a69a", spec.sell_label)
 
-            # 打 Marker 并渲染
-            chart.marker_list(markers)
-            chart.load()
+                # 延后 1 天交易（避免用到未来函数）
+                chart_df['Signal'] = result.signal
             
-            # --- 渲染附图 MACD / RSI (如果是对应策略) ---
-            if "MACD" in strategy_type:
-                st.write("📊 **附图：MACD (趋势发现) & RSI (震荡辅助)**")
-                # 因为 Lightweight in Streamlit 目前无法像 JS 那样直接添加独立附图窗口(pane)，
-                # 我们利用 Streamlit 原生的图表展示这两个核心数值线作为下方的 Dashboard。
-                
-                macd_data = chart_df[['time', 'DIF', 'DEA', 'MACD']].set_index('time')
-                st.line_chart(macd_data[['DIF', 'DEA']], color=["#ef5350", "#26a69a"], height=200)
-                
-                rsi_data = chart_df[['time', 'RSI']].set_index('time')
-                st.area_chart(rsi_data, height=150, color="#FFC107")
+                # --- 构建专业的交互式 K 线图 ---
+                stage("chart.render", rows=len(chart_df))
+                st.subheader(f"📈 股票历史走势分析 ({strategy_type} · {timeframe_label(timeframe)})")
             
-            # --- 阶段四：构建极速自动化回测流水线 (Native Pandas 版) ---
-            st.markdown("---")
-            st.subheader(f"🤖 极速自动回测研究流水线 ({strategy_type})")
+                from lightweight_charts.widgets import StreamlitChart
             
-            # 2. 计算标的每日基准收益率 (Benchmark Return)
-            chart_df['Daily_Return'] = chart_df['close'].pct_change().fillna(0)
+                # 初始化图表
+                chart = StreamlitChart(height=500)
+                chart.layout(background_color='#131722', text_color='white')
+                chart.grid(vert_enabled=True, horz_enabled=True, color='rgba(42, 46, 57, 0.5)')
+                chart.candle_style(up_color='#ef5350', down_color='#26a69a', wick_up_color='#ef5350', wick_down_color='#26a69a', border_visible=False)
+                chart.volume_config(scale_margin_top=0.8, scale_margin_bottom=0, up_color='#ef5350', down_color='#26a69a')
             
-            # 3. 计算策略每日收益率 (只有在持仓 signal=1 时才吃到当天的涨跌幅)
-            chart_df['Strategy_Return'] = chart_df['Signal'] * chart_df['Daily_Return']
+                # 只发送 K 线所需字段；超出点数预算时按桶聚合，叠加线在同一组桶上用 LTTB 选点
+                candles, overlay_lines, _ = candle_view(chart_df, chart_budget, tuple(spec.overlays))
+                chart.set(candles)
             
-            # 4. 计算累计净值 (Cumulative Wealth)
-            # 假设初始资金为 1 块钱
-            chart_df['Cumulative_Benchmark'] = (1 + chart_df['Daily_Return']).cumprod()
-            chart_df['Cumulative_Strategy'] = (1 + chart_df['Strategy_Return']).cumprod()
+                overlay_colors = ["rgba(255, 192, 0, 1.0)", "rgba(41, 98, 255, 1.0)", "rgba(171, 71, 188, 1.0)"]
+                for i, (column, line_name) in enumerate(spec.overlays.items()):
+                    line = chart.create_line(name=line_name, color=overlay_colors[i % len(overlay_colors)], width=2)
+                    line.set(overlay_lines[column].rename(columns={column: line_name}))
+
+                # 打 Marker 并渲染 (Marker 吸附到抽稀后所在的 K 线上)
+                set_markers(chart, markers, candles['time'])
+                chart.load()
+                if len(candles) < len(chart_df):
+                    st.caption(f"🔎 图表已抽稀：{len(chart_df)} 根 K 线 → {len(candles)} 个点，买卖点与区间最高/最低价完整保留。")
             
-            # 5. 绩效统计指标
-            total_strategy_return = (chart_df['Cumulative_Strategy'].iloc[-1] - 1) * 100
-            total_benchmark_return = (chart_df['Cumulative_Benchmark'].iloc[-1] - 1) * 100
+                # --- 渲染附图 MACD / RSI (如果是对应策略) ---
+                if "MACD" in strategy_type:
+                    stage("chart.subplots")
+                    st.write("📊 **附图：MACD (趋势发现) & RSI (震荡辅助)**")
+                    # 因为 Lightweight in Streamlit 目前无法像 JS 那样直接添加独立附图窗口(pane)，
+                    # 我们利用 Streamlit 原生的图表展示这两个核心数值线作为下方的 Dashboard。
+                
+                    macd_data = lttb_frame(chart_df[['time', 'DIF', 'DEA']].set_index('time'), ['DIF', 'DEA'], chart_budget)
+                    st.line_chart(macd_data, color=["#ef5350", "#26a69a"], height=200)
+                
+                    rsi_data = lttb_frame(chart_df[['time', 'RSI']].set_index('time'), ['RSI'], chart_budget)
+                    st.area_chart(rsi_data, height=150, color="#FFC107")
             
-            # 胜率计算：统计产生交易信号且吃到正收益的天数 / 持仓总天数
-            holding_days = chart_df[chart_df['Signal'] == 1].shape[0]
-            winning_days = chart_df[(chart_df['Signal'] == 1) & (chart_df['Strategy_Return'] > 0)].shape[0]
-            win_rate = (winning_days / holding_days * 100) if holding_days > 0 else 0
+                # --- 阶段四：构建极速自动化回测流水线 (Native Pandas 版) ---
+                st.markdown("---")
+                st.subheader(f"🤖 极速自动回测研究流水线 ({strategy_type})")
             
-            # 渲染回测面板的指标卡片
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric(label="策略累计收益率", value=f"{total_strategy_return:.2f}%", 
-                          delta=f"跑赢基准：{total_strategy_return - total_benchmark_return:.2f}%")
-            with col2:
-                st.metric(label="基准(一直持有)收益", value=f"{total_benchmark_return:.2f}%")
-            with col3:
-                st.metric(label="持仓天数", value=f"{holding_days} 天")
-            with col4:
-                st.metric(label="按日胜率", value=f"{win_rate:.2f}%")
-                
-            # 绘制资金净值曲线比对图
-            st.write("📊 **策略净值 vs 基准净值 (1元起投)**")
-            wealth_df = chart_df[['time', 'Cumulative_Strategy', 'Cumulative_Benchmark']].set_index('time')
-            st.line_chart(wealth_df, color=["#ef5350", "#26a69a"])
+                # 收益率、1 元起投的累计净值与绩效指标 (utils/backtest.py，与无界面批量回测同一实现)
+                stage("backtest.cumprod")
+                metrics = backtest_frame(chart_df)
+                total_strategy_return = metrics['total_return']
+                total_benchmark_return = metrics['benchmark_return']
+                holding_days = metrics['holding_days']
+                win_rate = metrics['win_rate']
             
-            st.success("✅ **阶段四（自动化回测）与阶段三已全部通过原生 Pandas 流水线成功构建！**")
+                # 渲染回测面板的指标卡片
+                stage("backtest.render")
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric(label="策略累计收益率", value=f"{total_strategy_return:.2f}%", 
+                              delta=f"跑赢基准：{total_strategy_return - total_benchmark_return:.2f}%")
+                with col2:
+                    st.metric(label="基准(一直持有)收益", value=f"{total_benchmark_return:.2f}%")
+                with col3:
+                    if timeframe == 'D':
+                        st.metric(label="持仓天数", value=f"{holding_days} 天")
+                    else:
+                        st.metric(label="持仓 K 线数", value=f"{holding_days} 根{timeframe_label(timeframe)}")
+                with col4:
+                    st.metric(label="按日胜率", value=f"{win_rate:.2f}%")
+                
+                # 绘制资金净值曲线比对图
+                st.write("📊 **策略净值 vs 基准净值 (1元起投)**")
+                wealth_df = lttb_frame(chart_df[['time', 'Cumulative_Strategy', 'Cumulative_Benchmark']].set_index('time'),
+                                       ['Cumulative_Strategy', 'Cumulative_Benchmark'], chart_budget)
+                st.line_chart(wealth_df, color=["#ef5350", "#26a69a"])
 
-else:
-    st.info("👈 请在左侧面板输入股票代码并点击【获取分析数据】。")
+                # --- 阶段五：稳健性检验 (Monte Carlo / Bootstrap) ---
+                if robust_paths and len(chart_df) > 1:
+                    from utils.robustness import run_robustness
+                    import altair as alt
+                    import numpy as np
+
+                    st.markdown("---")
+                    st.subheader("🎲 稳健性检验：策略收益是运气还是能力？")
+                    stage("backtest.robustness", paths=robust_paths, days=len(chart_df))
+                    report = run_robustness(chart_df['Strategy_Return'], chart_df['Daily_Return'], chart_df['Signal'],
+                                            times=chart_df['time'], n_paths=robust_paths)
+                    stage("robustness.render")
+                    st.caption("平稳分块 Bootstrap 的 p 值为重采样后不跑赢基准的概率；随机入场与信号置换的 p 值为"
+                               "零假设路径收益不低于实际策略的概率。p 值越小，越难用运气解释。区间为 95% 置信区间。")
+                    tests_df = report.tests
+
+                    def interval(metric):
+                        # 被跳过的检验没有路径，区间显示为 —
+                        return [f"{lo:.2f} ~ {hi:.2f}" if pd.notna(lo) else "—" for lo, hi in
+                                zip(tests_df[f'{metric}_low'], tests_df[f'{metric}_high'])]
+
+                    st.dataframe(pd.DataFrame({
+                        '检验': tests_df['label'],
+                        '路径数': tests_df['paths'],
+                        'p 值': tests_df['p_value'].round(4),
+                        '累计收益 95% 区间(%)': interval('total_return'),
+                        '最大回撤 95% 区间(%)': interval('max_drawdown'),
+                        '按日胜率 95% 区间(%)': interval('win_rate'),
+                        '说明': tests_df['note'],
+                    }), hide_index=True, use_container_width=True)
+
+                    if not report.bands.empty:
+                        st.write("📈 **Bootstrap 策略净值 95% 置信带**")
+                        band_df = report.bands.merge(chart_df[['time', 'Cumulative_Strategy']], on='time', how='left')
+                        band = alt.Chart(band_df).mark_area(opacity=0.25, color="#ef5350").encode(
+                            x=alt.X('time:T', title=None), y=alt.Y('lower:Q', title='净值'), y2='upper:Q')
+                        lines = alt.Chart(band_df).transform_fold(
+                            ['median', 'Cumulative_Strategy'], as_=['series', 'nav']).mark_line().encode(
+                            x='time:T', y='nav:Q',
+                            color=alt.Color('series:N', scale=alt.Scale(domain=['median', 'Cumulative_Strategy'],
+                                                                        range=['#ffb74d', '#ef5350']), title=None))
+                        st.altair_chart(band + lines, use_container_width=True)
+
+                    st.write("📊 **零假设下的累计收益分布** (竖线为实际策略)")
+                    hist_cols = st.columns(len(report.distributions))
+                    for col, (name, dist) in zip(hist_cols, report.distributions.items()):
+                        with col:
+                            st.caption(tests_df.set_index('test').loc[name, 'label'])
+                            # 先在本地分箱，只把直方图的柱子发给浏览器
+                            values = dist['total_return'].dropna().to_numpy()
+                            lo, hi = np.percentile(values, [0.5, 99.5])
+                            counts, edges = np.histogram(np.clip(values, lo, hi), bins=60)
+                            hist = alt.Chart(pd.DataFrame({'left': edges[:-1], 'right': edges[1:], 'count': counts})).mark_bar(
+                                color="#26a69a").encode(x=alt.X('left:Q', title='累计收益(%)'), x2='right:Q',
+                                                        y=alt.Y('count:Q', title=None))
+                            rule = alt.Chart(pd.DataFrame({'observed': [report.observed['total_return']]})).mark_rule(
+                                color="#ef5350", size=2).encode(x='observed:Q')
+                            st.altair_chart(hist + rule, use_container_width=True)
+
+                st.success("✅ **阶段四（自动化回测）与阶段三已全部通过原生 Pandas 流水线成功构建！**")
+
+    else:
+        st.info("👈 请在左侧面板输入股票代码并点击【获取分析数据】。")
+finally:
+    # st.stop() 与参数变化触发的重新运行都会以异常打断脚本，Trace 照样结束并恢复上下文
+    trace.finish()
+
+# --- 侧边栏底部：本次运行耗时分解 (开启追踪时) ---
+if trace:
+    with st.sidebar:
+        with st.expander(f"⏱️ 本次运行耗时 {trace.duration_ms:.0f} ms", expanded=False):
+            st.dataframe(pd.DataFrame([{
+                '阶段': "　" * row['depth'] + row['stage'],
+                '耗时(ms)': round(row['ms'], 2),
+                '占比': f"{row['share']:.0%}",
+                '详情': ", ".join(f"{k}={v}" for k, v in row['attrs'].items()),
+            } for row in trace.breakdown()]), hide_index=True, use_container_width=True)
+            st.caption(f"Trace {trace.trace_id} 已追加写入 `{trace.log_path}`")
+
+# --- 侧边栏底部：缓存命中统计 (所有会话共享，放在页面末尾渲染以包含本次运行的结果) ---
+from utils.cache import cache_stats
+with st.sidebar:
+    with st.expander("🗃️ 缓存命中统计", expanded=False):
+        for stat in cache_stats():
+            st.caption(f"**{stat['name']}**：命中 {stat['hits']} / 未命中 {stat['misses']} "
+                       f"(命中率 {stat['hit_rate']:.0%})，{stat['entries']} 条，"
+                       f"{stat['used_mb']:.1f} / {stat['budget_mb']:.0f} MB，淘汰 {stat['evictions']} 次")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# benchmark.py —— 性能基准命令，对数据加载、指标信号、回测与图表准备各阶段计时
+#
+# 用法示例：
+#   uv run python benchmark.py                                   # 内置行情 + 1k ~ 1M 行合成数据
+#   uv run python benchmark.py --full --output bench_v1.json     # 包含 10M 行
+#   uv run python benchmark.py --baseline bench_v1.json          # 与历史结果对比，回退时返回非零退出码
+#   uv run python benchmark.py --sizes 100000 --stages strategy backtest
+import argparse
+import json
+import sys
+
+from utils.benchmark import (DEFAULT_SIZES, MAX_REPEAT, MIN_SECONDS, SIZES, check_budgets, compare,
+                             run_benchmarks)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="量化平台性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", help=f"合成数据行数 (默认 {DEFAULT_SIZES})")
+    parser.add_argument("--full", action="store_true", help=f"使用全部规模 {SIZES}")
+    parser.add_argument("--no-bundled", action="store_true", help="跳过仓库自带的真实行情")
+    parser.add_argument("--stages", nargs="+", help="只运行这些前缀的阶段，如 load strategy.dual_ma")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS, help="每个阶段至少累计计时的秒数")
+    parser.add_argument("--max-repeat", type=int, default=MAX_REPEAT, help="每个阶段最多重复次数")
+    parser.add_argument("--output", help="把结果写入该 JSON 文件")
+    parser.add_argument("--baseline", help="历史结果 JSON，用于回退检测")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对变慢比例")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="低于该绝对差值的变化视为计时噪声")
+    parser.add_argument("--no-budgets", action="store_true", help="不检查 README 宣称的各阶段耗时上限")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    sizes = SIZES if args.full else (args.sizes or DEFAULT_SIZES)
+
+    def progress(entry):
+        print(f"⏱️ {entry['stage']:<24} {entry['dataset']:<18} {entry['rows']:>10} 行  "
+              f"中位 {entry['median_ms']:>10.3f} ms  最快 {entry['min_ms']:>10.3f} ms  ×{entry['repeat']}")
+
+    print(f"🚀 开始性能基准 (合成规模: {sizes}{'' if args.no_bundled else ' + 内置行情'})")
+    report = run_benchmarks(sizes, bundled=not args.no_bundled, stages=args.stages,
+                            min_seconds=args.min_seconds, max_repeat=args.max_repeat, progress=progress)
+
+    failed = False
+    if not args.no_budgets:
+        violations = check_budgets(report)
+        report['budget_violations'] = violations
+        for v in violations:
+            print(f"⚠️ 超出 README 耗时上限：{v['stage']} @ {v['dataset']} "
+                  f"{v['current_ms']:.3f} ms > {v['budget_ms']} ms")
+        failed |= bool(violations)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        report['baseline'] = {'file': args.baseline, 'meta': baseline.get('meta'), 'regressions': regressions}
+        for r in regressions:
+            print(f"❌ 性能回退：{r['stage']} @ {r['dataset']} "
+                  f"{r['baseline_ms']:.3f} ms -> {r['current_ms']:.3f} ms (×{r['ratio']:.2f})")
+        if not regressions:
+            print(f"✅ 与基线 {args.baseline} 相比没有超过 {args.tolerance:.0%} 的回退。")
+        failed |= bool(regressions)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 结果已写入 {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        sys.stdout.reconfigure(encoding="utf-8")
+        sys.stderr.reconfigure(encoding="utf-8")
+    sys.exit(main())
@@ -1,21 +1,120 @@
 # -*- coding: utf-8 -*-
 # main.py
+#
+# 用法示例：
+#   uv run python main.py                                         # 启动 Streamlit 页面
+#   uv run python main.py backtest --market A 600519 --start 2015-01-01 --end 2024-01-01 --out results
+#   uv run python main.py backtest --config runs.json --out results --workers 4 --offline
+#   uv run python main.py backtest --market US TSLA --timeframe W --strategy macd_rsi
+#   uv run python main.py backtest --market A 600519 --start 2024-01-01 --end 2024-03-31 --timeframe 5min
+#
+# backtest 子命令不依赖 Streamlit：每个任务输出一个净值 CSV，汇总指标写入 <out>/metrics.json 与 metrics.csv。
+# 重量级模块在子命令内部才导入，只读本地缓存 (--offline 或缓存已覆盖区间) 时不会导入任何网络库。
+import argparse
+import json
 import subprocess
 import sys
 import os
+from datetime import datetime
 env = os.environ.copy()
 
-def main():
+
+def launch_app():
     app_path = os.path.join(os.path.dirname(__file__), "app.py")
     cmd = ["uv", "run", "streamlit", "run", app_path]
 
     print("启动命令：", " ".join(cmd))
     subprocess.run(cmd, env=env, check=True)
 
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AI 量化投研平台：不带子命令时启动页面")
+    sub = parser.add_subparsers(dest="command")
+    bt = sub.add_parser("backtest", help="无界面批量回测，输出指标与净值文件")
+    bt.add_argument("symbols", nargs="*", help="股票代码 (与 --config 二选一)")
+    bt.add_argument("--config", help="任务配置 JSON：任务列表，或 {\"defaults\": {...}, \"runs\": [...]}")
+    bt.add_argument("--market", choices=["A", "US"], default="A", help="市场：A 股 或 美股")
+    bt.add_argument("--start", default="2023-01-01", help="起始日期 YYYY-MM-DD")
+    bt.add_argument("--end", default=datetime.now().strftime("%Y-%m-%d"), help="截止日期 YYYY-MM-DD")
+    bt.add_argument("--timeframe", default="D", help="K 线周期：D (日线) / W (周线) / M (月线) / <N>D (N 日线) / 1min / 5min (分钟线)")
+    bt.add_argument("--strategy", choices=["dual_ma", "macd_rsi"], default="dual_ma", help="内置策略")
+    bt.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                    help="策略参数，可重复，例如 --param ma_short=10 --param ma_long=60")
+    bt.add_argument("--out", default="backtest_results", help="输出目录")
+    bt.add_argument("--workers", type=int, default=1, help="并行进程数")
+    bt.add_argument("--offline", action="store_true", help="只使用本地缓存，不联网补抓")
+    return parser
+
+
+def _parse_params(items: list) -> dict:
+    params = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if not value:
+            raise SystemExit(f"❌ 参数格式应为 NAME=VALUE：{item}")
+        try:
+            number = float(value)
+        except ValueError:
+            raise SystemExit(f"❌ 参数值应为数字：{item}") from None
+        # 整数值 (含 1e1 这样的写法) 按 int 传入，窗口类参数要求整数
+        params[name.strip()] = int(number) if number.is_integer() else number
+    return params
+
+
+def run_backtests(args) -> int:
+    from utils.backtest import expand_jobs, load_config, run_jobs
+
+    if not args.config and not args.symbols:
+        print("❌ 没有需要回测的任务，请直接传入代码或使用 --config 指定配置。")
+        return 2
+    try:
+        if args.config:
+            jobs = load_config(args.config)
+        else:
+            jobs = expand_jobs({
+                'defaults': {'market': args.market, 'start': args.start, 'end': args.end,
+                             'timeframe': args.timeframe, 'strategy': args.strategy,
+                             'params': _parse_params(args.param)},
+                'runs': [{'symbols': args.symbols}],
+            })
+    except ValueError as e:
+        print(f"❌ 任务配置有误：{e}")
+        return 2
+
+    def progress(done, total, record):
+        icon = {"ok": "✅", "empty": "⚠️", "failed": "❌"}[record["status"]]
+        detail = (f"策略 {record['total_return']:.2f}% / 基准 {record['benchmark_return']:.2f}%"
+                  if record["status"] == "ok" else record["error"])
+        print(f"{icon} [{done}/{total}] {record['name']} ({record['seconds']:.2f}s) {detail}")
+
+    print(f"🚀 开始回测 {len(jobs)} 个任务 (并行: {args.workers}{', 仅本地缓存' if args.offline else ''})")
+    records = run_jobs(jobs, out_dir=args.out, workers=args.workers, offline=args.offline, progress=progress)
+
+    import pandas as pd
+    with open(os.path.join(args.out, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    summary = pd.DataFrame(records)
+    summary['params'] = summary['params'].map(lambda p: json.dumps(p, sort_keys=True))
+    summary.to_csv(os.path.join(args.out, "metrics.csv"), index=False)
+
+    failed = sum(r["status"] == "failed" for r in records)
+    print(f"📊 成功 {sum(r['status'] == 'ok' for r in records)} / 无数据 {sum(r['status'] == 'empty' for r in records)}"
+          f" / 失败 {failed}，结果已写入 {args.out}")
+    return 0 if failed == 0 else 1
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "backtest":
+        return run_backtests(args)
+    launch_app()
+    return 0
+
+
 if __name__ == "__main__":
     if sys.platform.startswith("win"):
         env["PYTHONUTF8"] = "1"
         sys.stdin.reconfigure(encoding="utf-8")
         sys.stdout.reconfigure(encoding="utf-8")
         sys.stderr.reconfigure(encoding="utf-8")
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# prefetch.py —— 无界面批量预取命令，夜间预热整个股票池的本地缓存
+#
+# 用法示例：
+#   uv run python prefetch.py --market A 600519 000001 000858
+#   uv run python prefetch.py --market US --file universe_us.txt --workers 16 --report report.json
+#   uv run python prefetch.py --market A --file universe.txt --provider stub   # 离线桩数据源联调
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from utils.prefetch import prefetch_universe, read_symbol_file, DEFAULT_STATE_FILE
+from utils.providers import StubProvider, default_provider
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="批量预取行情数据到本地 Parquet 缓存")
+    parser.add_argument("symbols", nargs="*", help="股票代码，可与 --file 同时使用")
+    parser.add_argument("--file", help="代码清单文件，每行一个代码 (支持逗号分隔与 # 注释)")
+    parser.add_argument("--market", choices=["A", "US"], default="A", help="市场：A 股 或 美股")
+    parser.add_argument("--start", default="1990-01-01", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", default=datetime.now().strftime("%Y-%m-%d"), help="截止日期 YYYY-MM-DD")
+    parser.add_argument("--provider", choices=["default", "stub"], default="default",
+                        help="数据源：default 为 AkShare/yfinance，stub 为本地合成数据")
+    parser.add_argument("--workers", type=int, default=8, help="并发下载线程数")
+    parser.add_argument("--rate", type=float, help="每秒请求数上限 (默认按数据源配置)")
+    parser.add_argument("--burst", type=int, help="令牌桶突发容量")
+    parser.add_argument("--retries", type=int, default=4, help="单次请求失败后的最大重试次数")
+    parser.add_argument("--base-delay", type=float, default=1.0, help="退避基准秒数")
+    parser.add_argument("--max-delay", type=float, default=60.0, help="单次退避上限秒数")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE, help="进度文件路径 (JSONL)")
+    parser.add_argument("--no-resume", action="store_true", help="忽略进度文件，全部重新同步")
+    parser.add_argument("--report", help="把汇总报告写入该 JSON 文件")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="桩数据源模拟的请求耗时 (秒)")
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0, help="桩数据源随机失败概率")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    symbols = list(args.symbols)
+    if args.file:
+        symbols.extend(read_symbol_file(args.file))
+    if not symbols:
+        print("❌ 没有需要预取的代码，请直接传入代码或使用 --file 指定清单。")
+        return 2
+
+    if args.provider == "stub":
+        provider = StubProvider(args.market, latency=args.stub_latency, failure_rate=args.stub_failure_rate)
+    else:
+        provider = default_provider(args.market)
+
+    def progress(done, total, record):
+        icon = {"ok": "✅", "empty": "⚠️", "failed": "❌"}[record["status"]]
+        print(f"{icon} [{done}/{total}] {record['symbol']} ({record['seconds']:.2f}s)"
+              + (f" {record['error']}" if record["error"] else ""))
+
+    print(f"🚀 开始预取 {len(symbols)} 个{args.market}标的 (数据源: {provider.name}, 并发: {args.workers})")
+    report = prefetch_universe(
+        symbols, args.market, provider, args.start, args.end,
+        workers=args.workers, rate=args.rate, burst=args.burst, retries=args.retries,
+        base_delay=args.base_delay, max_delay=args.max_delay,
+        state_file=args.state, resume=not args.no_resume, progress=progress,
+    )
+
+    print("📊 预取汇总：")
+    print(f"   成功 {report['ok']} / 无数据 {report['empty']} / 失败 {report['failed']} / 已跳过 {report['skipped']}"
+          f"，共 {report['total']} 个")
+    print(f"   请求 {report['requests']} 次 (重试 {report['retries']} 次)，"
+          f"耗时 {report['elapsed_seconds']:.1f}s，{report['symbols_per_second']:.1f} 个/秒")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已写入 {args.report}")
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        sys.stdout.reconfigure(encoding="utf-8")
+        sys.stderr.reconfigure(encoding="utf-8")
+    sys.exit(main())
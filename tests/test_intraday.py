@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from utils import data_loader, intraday
+from utils.synthetic import synthetic_intraday_range
+
+
+class CountingFetcher:
+    """按合成分钟线应答并记录调用次数；fail=True 时模拟连接错误"""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, fetch_start, fetch_end):
+        self.calls.append((fetch_start, fetch_end))
+        if self.fail:
+            raise ConnectionError("simulated connection reset")
+        return synthetic_intraday_range("SYN", fetch_start, fetch_end, 1, "A")
+
+
+class IntradaySyncTest(unittest.TestCase):
+    """分钟线缺口补抓：休市区间记为已覆盖，抓取失败不推进覆盖区间，旧读者不受写入影响"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._data_dir = data_loader.DATA_DIR
+        data_loader.DATA_DIR = self.tmp
+
+    def tearDown(self):
+        data_loader.DATA_DIR = self._data_dir
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def sync(self, start, end, fetcher):
+        return intraday.sync_intraday("A", "SYN", "1min", start, end, fetcher)
+
+    def test_weekend_request_is_fetched_once(self):
+        fetcher = CountingFetcher()
+        for _ in range(3):
+            self.assertTrue(self.sync("2024-01-06", "2024-01-07", fetcher))
+        self.assertEqual(len(fetcher.calls), 1)
+        self.assertEqual(len(intraday.IntradayStore("A", "SYN", "1min").window()), 0)
+
+    def test_window_ending_on_holiday_is_fetched_once(self):
+        fetcher = CountingFetcher()
+        # 合成行情按工作日生成，请求截止在周末 (休市)
+        for _ in range(3):
+            self.assertTrue(self.sync("2024-01-02", "2024-01-07", fetcher))
+        self.assertEqual(len(fetcher.calls), 1)
+        # 之后向后延伸到另一个周末：只抓一次尾部缺口
+        for _ in range(3):
+            self.assertTrue(self.sync("2024-01-02", "2024-01-14", fetcher))
+        self.assertEqual(len(fetcher.calls), 2)
+        bars = intraday.IntradayStore("A", "SYN", "1min").window("2024-01-02", "2024-01-14")
+        self.assertEqual(len(set(bars.datetimes.astype('datetime64[D]'))), 9)
+
+    def test_empty_head_gap_advances_coverage(self):
+        fetcher = CountingFetcher()
+        self.assertTrue(self.sync("2024-01-08", "2024-01-12", fetcher))
+        # 头部缺口落在周末，没有数据也推进起点
+        for _ in range(2):
+            self.assertTrue(self.sync("2024-01-06", "2024-01-12", fetcher))
+        self.assertEqual(len(fetcher.calls), 2)
+
+    def test_failed_fetch_keeps_coverage(self):
+        failing = CountingFetcher(fail=True)
+        self.assertFalse(self.sync("2024-01-08", "2024-01-12", failing))
+        self.assertFalse(self.sync("2024-01-08", "2024-01-12", failing))
+        self.assertEqual(len(failing.calls), 2)
+
+        fetcher = CountingFetcher()
+        self.assertTrue(self.sync("2024-01-08", "2024-01-12", fetcher))
+        self.assertTrue(self.sync("2024-01-08", "2024-01-12", fetcher))
+        self.assertEqual(len(fetcher.calls), 1)
+
+    def test_open_store_survives_rewrite(self):
+        self.sync("2024-01-08", "2024-01-12", CountingFetcher())
+        store = intraday.IntradayStore("A", "SYN", "1min")
+        # 重写同一月份：旧版本目录退役但保留，已打开的实例仍能映射
+        intraday.write_intraday("A", "SYN", "1min", synthetic_intraday_range(
+            "SYN", pd.Timestamp("2024-01-09"), pd.Timestamp("2024-01-09 23:59"), 1, "A"))
+        self.assertEqual(len(store.window("2024-01-08", "2024-01-12")), 5 * 240)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import data_loader
+from utils.backtest import load_frame, run_backtest
+from utils.portfolio import load_panel, run_portfolio_backtest
+from utils.synthetic import synthetic_daily_range
+
+START, END = "2018-01-01", "2022-12-30"
+DELISTED = "2020-06-30"
+PARAMS = {'ma_short': 5, 'ma_long': 20}
+
+
+def _write_cache(symbol: str, start: str, end: str, drop_every: int = 0) -> pd.DataFrame:
+    """把一段合成日线写入临时缓存；drop_every > 0 时每隔若干行删掉一行，模拟停牌"""
+    df = synthetic_daily_range(symbol, pd.Timestamp(start), pd.Timestamp(end))
+    if drop_every:
+        df = df[np.arange(len(df)) % drop_every != drop_every - 1].reset_index(drop=True)
+    data_loader.sync_daily("A", symbol, start, end, lambda fetch_start, fetch_end: df)
+    return df
+
+
+class PortfolioBacktestTest(unittest.TestCase):
+    """组合回测：单标的与单标的流水线一致，不同交易日历的标的压紧计算，退市后清仓并移出 N"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._data_dir = data_loader.DATA_DIR
+        data_loader.DATA_DIR = self.tmp
+        _write_cache("AAA", START, END)
+        _write_cache("BBB", START, DELISTED)
+        _write_cache("CCC", "2019-01-01", END, drop_every=37)
+
+    def tearDown(self):
+        data_loader.DATA_DIR = self._data_dir
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def single(self, symbol: str):
+        frame = load_frame("A", symbol, START, END, offline=True)
+        return run_backtest(frame.copy(deep=False), 'dual_ma', PARAMS).frame
+
+    def test_single_symbol_matches_run_backtest(self):
+        panel = load_panel([("A", "AAA")], START, END)
+        result = run_portfolio_backtest(panel, 'dual_ma', PARAMS, allocation='equal')
+        expected = self.single("AAA")
+        self.assertEqual(len(result.nav), len(expected))
+        np.testing.assert_array_equal(result.nav['time'].to_numpy(), expected['time'].to_numpy())
+        np.testing.assert_allclose(result.nav['nav'].to_numpy(), expected['Cumulative_Strategy'].to_numpy(), rtol=1e-12)
+        np.testing.assert_allclose(result.nav['benchmark_nav'].to_numpy(),
+                                   expected['Cumulative_Benchmark'].to_numpy(), rtol=1e-12)
+
+    def test_mixed_calendars_are_packed_and_delisted_symbols_dropped(self):
+        panel = load_panel([("A", "AAA"), ("A", "BBB"), ("A", "CCC")], START, END)
+        self.assertEqual(panel.symbols, ["A:AAA", "A:BBB", "A:CCC"])
+        close = panel.close
+        delisted = panel.dates > pd.Timestamp(DELISTED)
+        self.assertTrue(np.isnan(close[delisted, 1]).all())
+        self.assertTrue(np.isnan(close[panel.dates < pd.Timestamp("2019-01-01"), 2]).all())
+
+        for allocation in ('equal', 'signal'):
+            result = run_portfolio_backtest(panel, 'dual_ma', PARAMS, allocation=allocation)
+            contribution = result.contribution.set_index('symbol')
+            # 停牌日不打断信号：CCC 在自己的交易日序列上与单标的回测一致
+            ccc = self.single("CCC")
+            self.assertAlmostEqual(contribution.loc["A:CCC", 'strategy_return'],
+                                   (ccc['Cumulative_Strategy'].iloc[-1] - 1) * 100, places=9)
+            self.assertEqual(contribution.loc["A:CCC", 'holding_days'], int((ccc['Signal'] > 0).sum()))
+
+            # BBB 退市后清仓，不再占用资金
+            holdings = result.nav['holdings'].to_numpy()
+            aaa, bbb = self.single("AAA"), self.single("BBB")
+            self.assertLessEqual(holdings[delisted].max(), 2)
+            if allocation == 'equal':
+                # 退市后只剩 AAA 与 CCC 两个在市标的，各占 1/2
+                after = result.nav[delisted].set_index('time')['daily_return']
+                a = aaa.set_index('time').loc[after.index, 'Strategy_Return']
+                c = ccc.set_index('time')['Strategy_Return'].reindex(after.index, fill_value=0.0)
+                np.testing.assert_allclose(after.to_numpy(), ((a + c) / 2).to_numpy(), rtol=1e-12, atol=1e-15)
+            self.assertGreater(int((bbb['Signal'] > 0).sum()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
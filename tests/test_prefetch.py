@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils import data_loader, prefetch
+from utils.providers import StubProvider
+
+SYMBOLS = ["600519", "000001", "000858", "601318", "300750"]
+
+
+class PrefetchTest(unittest.TestCase):
+    """用本地桩数据源跑通批量预取：并发同步、断点续传、失败重试与限速配置"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._data_dir = data_loader.DATA_DIR
+        data_loader.DATA_DIR = self.tmp
+        self.state_file = os.path.join(self.tmp, "prefetch_state.jsonl")
+
+    def tearDown(self):
+        data_loader.DATA_DIR = self._data_dir
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_prefetch(self, provider, end="2024-01-31", **kwargs):
+        return prefetch.prefetch_universe(SYMBOLS, "A", provider, "2023-01-01", end, workers=4, rate=1000,
+                                          burst=1000, base_delay=0, state_file=self.state_file, **kwargs)
+
+    def test_prefetch_and_resume(self):
+        provider = StubProvider("A", seed=1)
+        report = self.run_prefetch(provider)
+        self.assertEqual((report["ok"], report["failed"], report["skipped"]), (5, 0, 0))
+        self.assertEqual(provider.calls, len(SYMBOLS))
+        for symbol in SYMBOLS:
+            self.assertTrue(os.path.exists(data_loader.daily_file_path("A", symbol)))
+
+        # 同一区间重跑：全部跳过，不再请求数据源
+        report = self.run_prefetch(provider)
+        self.assertEqual((report["ok"], report["skipped"]), (0, 5))
+        # 截止日默认是“今天”，跨过午夜重启也视为已完成
+        report = self.run_prefetch(provider, end="2024-02-01")
+        self.assertEqual(report["skipped"], 5)
+        self.assertEqual(provider.calls, len(SYMBOLS))
+        # 关闭续传时重新走增量同步，缓存已覆盖区间，同样不会请求数据源
+        report = self.run_prefetch(provider, resume=False)
+        self.assertEqual((report["ok"], report["skipped"]), (5, 0))
+        self.assertEqual(provider.calls, len(SYMBOLS))
+
+    def test_failures_are_retried_then_reported(self):
+        provider = StubProvider("A", failure_rate=1.0, seed=1)
+        report = self.run_prefetch(provider, retries=2)
+        self.assertEqual(report["failed"], 5)
+        self.assertEqual(report["retries"], 2 * len(SYMBOLS))
+        self.assertEqual(provider.calls, 3 * len(SYMBOLS))
+        self.assertIn("ConnectionError", report["failures"]["600519"])
+
+        # 失败的标的不记为完成，下次续传会重新预取
+        provider = StubProvider("A", seed=1)
+        report = self.run_prefetch(provider)
+        self.assertEqual((report["ok"], report["skipped"]), (5, 0))
+
+    def test_bucket_follows_latest_rate(self):
+        bucket = prefetch.get_bucket("stub-test", rate=1.0, capacity=1)
+        self.assertIs(prefetch.get_bucket("stub-test", rate=50.0, capacity=5), bucket)
+        self.assertEqual((bucket.rate, bucket.capacity), (50.0, 5))
+        # 不传限速参数时沿用已有配置
+        prefetch.get_bucket("stub-test")
+        self.assertEqual((bucket.rate, bucket.capacity), (50.0, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from utils.robustness import _entry_exit_rates, run_robustness
+
+
+def _returns(n: int, seed: int = 1) -> np.ndarray:
+    return np.random.default_rng(seed).normal(0.0005, 0.02, n)
+
+
+class RobustnessTest(unittest.TestCase):
+    def test_flat_strategy_skips_random_and_shuffle(self):
+        # 全程空仓：不能用 1/n 的下限凭空造出开仓，随机入场与信号置换应跳过并记 p = 1
+        n = 500
+        daily = _returns(n)
+        position = np.zeros(n)
+        self.assertEqual(_entry_exit_rates(position > 0)[0], 0.0)
+
+        report = run_robustness(np.zeros(n), daily, position, n_paths=200, n_jobs=1)
+        rows = report.tests.set_index('test')
+        for name in ('random', 'shuffle'):
+            self.assertNotIn(name, report.distributions)
+            self.assertEqual(rows.loc[name, 'paths'], 0)
+            self.assertEqual(rows.loc[name, 'p_value'], 1.0)
+            self.assertTrue(rows.loc[name, 'note'])
+            self.assertTrue(np.isnan(rows.loc[name, 'total_return_mean']))
+        self.assertEqual(rows.loc['bootstrap', 'paths'], 200)
+        self.assertEqual(rows.loc['bootstrap', 'note'], '')
+
+    def test_trading_strategy_runs_every_test(self):
+        n = 500
+        daily = _returns(n)
+        position = (np.arange(n) // 20 % 2).astype(np.float64)
+        report = run_robustness(daily * position, daily, position, n_paths=200, n_jobs=1)
+        self.assertEqual(set(report.distributions), {'bootstrap', 'random', 'shuffle'})
+        self.assertTrue((report.tests['paths'] == 200).all())
+        self.assertTrue(report.tests['p_value'].between(0, 1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
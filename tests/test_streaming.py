@@ -0,0 +1,77 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import data_loader
+from utils.backtest import DEFAULT_PARAMS
+from utils.streaming import SignalMonitor, replay
+from utils.strategy import build_strategy, run_strategy
+from utils.synthetic import synthetic_daily_range
+
+# 除默认参数外，再测一组窗口较短、交叉更频繁的参数
+PARAMS = {
+    'dual_ma': [DEFAULT_PARAMS['dual_ma'], {'ma_short': 3, 'ma_long': 7}],
+    'macd_rsi': [DEFAULT_PARAMS['macd_rsi'], {'macd_fast': 5, 'macd_slow': 13, 'rsi_period': 6, 'rsi_overbought': 60}],
+}
+
+
+def _synthetic_close(symbol: str) -> pd.Series:
+    df = synthetic_daily_range(symbol, pd.Timestamp("2010-01-01"), pd.Timestamp("2024-01-01"))
+    return pd.Series(df['收盘'].to_numpy(dtype=np.float64), name='close')
+
+
+def _bundled_close(market: str, symbol: str) -> pd.Series:
+    df = data_loader.read_daily(market, symbol, "1990-01-01", "2100-01-01", ['收盘'])
+    return pd.Series(df['收盘'].to_numpy(dtype=np.float64), name='close')
+
+
+class StreamingParityTest(unittest.TestCase):
+    """流式引擎逐根回放历史，指标值、买卖点与 Signal 必须与批量计算逐位一致"""
+
+    def assert_parity(self, close: pd.Series, strategy: str, params: dict):
+        batch = run_strategy(build_strategy(strategy, **params), pd.DataFrame({'close': close}))
+        streamed = replay(close, strategy, params)
+        msg = f"{strategy} {params}"
+        for name, values in batch.series.items():
+            np.testing.assert_array_equal(streamed[name].to_numpy(dtype=np.float64), values, err_msg=f"{msg} {name}")
+        np.testing.assert_array_equal(streamed['buy'].to_numpy(dtype=bool), batch.buy, err_msg=f"{msg} buy")
+        np.testing.assert_array_equal(streamed['sell'].to_numpy(dtype=bool), batch.sell, err_msg=f"{msg} sell")
+        np.testing.assert_array_equal(streamed['Signal'].to_numpy(dtype=np.float64), batch.signal,
+                                      err_msg=f"{msg} Signal")
+        # 延后 1 根后的持仓即前一根收盘后的目标持仓
+        np.testing.assert_array_equal(streamed['Signal'].to_numpy()[1:] > 0, batch.position[:-1], err_msg=msg)
+        self.assertGreater(int(batch.buy.sum()), 0, msg)
+
+    def test_synthetic_replay_matches_batch(self):
+        close = _synthetic_close("SYN")
+        for strategy, param_sets in PARAMS.items():
+            for params in param_sets:
+                self.assert_parity(close, strategy, params)
+
+    @unittest.skipUnless(os.path.exists(data_loader.daily_file_path("US", "TSLA")), "没有自带的 TSLA 日线缓存")
+    def test_bundled_replay_matches_batch(self):
+        close = _bundled_close("US", "TSLA")
+        for strategy, param_sets in PARAMS.items():
+            for params in param_sets:
+                self.assert_parity(close, strategy, params)
+
+    def test_monitor_keeps_symbols_independent(self):
+        closes = {s: _synthetic_close(s).iloc[:600] for s in ("AAA", "BBB", "CCC")}
+        for strategy in PARAMS:
+            params = PARAMS[strategy][0]
+            monitor = SignalMonitor(strategy, params)
+            pushed = {s: [] for s in closes}
+            # 各标的的 K 线交错到达
+            for i in range(600):
+                for symbol, close in closes.items():
+                    pushed[symbol].append(monitor.on_bar(symbol, close.iloc[i])['Signal'])
+            self.assertEqual(sorted(monitor.symbols()), sorted(closes))
+            for symbol, close in closes.items():
+                batch = run_strategy(build_strategy(strategy, **params), pd.DataFrame({'close': close}))
+                np.testing.assert_array_equal(np.asarray(pushed[symbol], dtype=np.float64), batch.signal)
+
+
+if __name__ == "__main__":
+    unittest.main()
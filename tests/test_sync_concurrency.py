@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from utils import data_loader
+from utils.synthetic import synthetic_daily_range
+
+START, END = "2015-01-01", "2024-01-01"
+
+
+def _file_fetcher(counter_path: str, delay: float = 0.3):
+    """每次调用向计数文件追加一行 (跨进程计数)，模拟一次较慢的网络请求"""
+    def fetcher(fetch_start, fetch_end):
+        with open(counter_path, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(delay)
+        return synthetic_daily_range("SYN", fetch_start, fetch_end)
+    return fetcher
+
+
+def _count_writes(counter_path: str):
+    """包装 _merge_into_cache，每次写缓存向计数文件追加一行"""
+    merge = data_loader._merge_into_cache
+
+    def counting(*args, **kwargs):
+        with open(counter_path, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+        return merge(*args, **kwargs)
+    data_loader._merge_into_cache = counting
+    return merge
+
+
+def _burst(n_threads: int, fetcher) -> tuple:
+    """n_threads 个线程同时发起相同的同步请求，期间另有线程持续读缓存；返回 (同步结果, 读取异常)"""
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                data_loader.read_daily("A", "SYN", START, END, data_loader.OHLCV_COLUMNS)
+            except Exception as e:
+                errors.append(repr(e))
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for t in readers:
+        t.start()
+    barrier = threading.Barrier(n_threads)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(data_loader.sync_daily("A", "SYN", START, END, fetcher))
+
+    threads = [threading.Thread(target=request) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    return results, errors
+
+
+def _process_worker(data_dir: str, n_threads: int, fetch_log: str, write_log: str, error_log: str, start):
+    data_loader.DATA_DIR = data_dir
+    _count_writes(write_log)
+    # 各进程导入完成后同时开始，保证请求真正重叠
+    start.wait()
+    results, errors = _burst(n_threads, _file_fetcher(fetch_log))
+    with open(error_log, "a", encoding="utf-8") as f:
+        for e in errors + [f"sync returned {r}" for r in results if r is not True]:
+            f.write(e + "\n")
+
+
+def _lines(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+class SyncConcurrencyTest(unittest.TestCase):
+    """相同的同步请求并发到达时只抓取、写入一次，读者不会读到写了一半的缓存"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._data_dir = data_loader.DATA_DIR
+        data_loader.DATA_DIR = os.path.join(self.tmp, "data")
+        self.fetch_log = os.path.join(self.tmp, "fetches.log")
+        self.write_log = os.path.join(self.tmp, "writes.log")
+        self.error_log = os.path.join(self.tmp, "errors.log")
+
+    def tearDown(self):
+        data_loader.DATA_DIR = self._data_dir
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def assert_single_sync(self):
+        self.assertEqual(len(_lines(self.fetch_log)), 1)
+        self.assertEqual(len(_lines(self.write_log)), 1)
+        self.assertEqual(_lines(self.error_log), [])
+        leftovers = [f for _, _, files in os.walk(data_loader.DATA_DIR) for f in files if f.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+
+    def test_thread_burst_fetches_once(self):
+        merge = _count_writes(self.write_log)
+        try:
+            results, errors = _burst(50, _file_fetcher(self.fetch_log))
+        finally:
+            data_loader._merge_into_cache = merge
+        self.assertEqual(results, [True] * 50)
+        self.assertEqual(errors, [])
+        self.assert_single_sync()
+
+        # 区间已覆盖：再次请求不抓取、不写入
+        self.assertTrue(data_loader.sync_daily("A", "SYN", START, END, _file_fetcher(self.fetch_log)))
+        self.assert_single_sync()
+
+    def test_failed_fetch_is_shared_then_retried(self):
+        calls = []
+
+        def failing(fetch_start, fetch_end):
+            calls.append(1)
+            time.sleep(0.2)
+            raise ConnectionError("simulated connection reset")
+
+        barrier = threading.Barrier(20)
+        outcomes = []
+
+        def request():
+            barrier.wait()
+            try:
+                outcomes.append(data_loader.sync_daily("A", "SYN", START, END, failing))
+            except ConnectionError as e:
+                outcomes.append(type(e).__name__)
+
+        threads = [threading.Thread(target=request) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(map(str, outcomes))), 1)
+        self.assertNotEqual(outcomes[0], True)
+
+        # 失败结果不会被记住，下一次请求重新抓取
+        self.assertTrue(data_loader.sync_daily("A", "SYN", START, END, _file_fetcher(self.fetch_log, delay=0)))
+        self.assertEqual(len(_lines(self.fetch_log)), 1)
+
+    def test_processes_share_one_fetch(self):
+        ctx = multiprocessing.get_context("spawn")
+        # 与 README 中的实测场景一致：4 进程 × 12 线程
+        args = (data_loader.DATA_DIR, 12, self.fetch_log, self.write_log, self.error_log, ctx.Barrier(4))
+        procs = [ctx.Process(target=_process_worker, args=args) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=120)
+            self.assertEqual(p.exitcode, 0)
+        self.assert_single_sync()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import pandas as pd
+
+from utils.resample import is_intraday, normalize_timeframe
+from utils.strategy import StrategySpec, StrategyResult, build_strategy, run_strategy, strategy_params
+
+# --- 单标的回测流水线 (无界面) ---
+# 行情加载 -> 策略表达式图 -> 净值连乘回测，与页面上的“单次回测”同一套计算，不依赖 Streamlit，
+# 可以在脚本、批处理 (main.py backtest) 或进程池中直接调用。
+# 只用本地缓存时不会导入任何网络库；只有缓存缺口需要补抓时，数据源才在抓取函数内部按需导入。
+
+# 各策略的默认参数 (与侧边栏滑块的默认值一致)
+DEFAULT_PARAMS = {
+    'dual_ma': {'ma_short': 5, 'ma_long': 20},
+    'macd_rsi': {'macd_fast': 12, 'macd_slow': 26, 'rsi_period': 14, 'rsi_overbought': 70},
+}
+# 净值文件中输出的列
+EQUITY_COLUMNS = ['time', 'close', 'Signal', 'Daily_Return', 'Strategy_Return', 'Cumulative_Strategy', 'Cumulative_Benchmark']
+
+
+@dataclass
+class BacktestResult:
+    spec: StrategySpec
+    strategy: StrategyResult
+    frame: pd.DataFrame     # 行情 + 策略序列 + Signal / 收益 / 净值列
+    metrics: dict
+
+
+def load_frame(market: str, symbol: str, start_date: str, end_date: str, offline: bool = False,
+               timeframe: str = 'D') -> pd.DataFrame:
+    """
+    读取 [start_date, end_date] 的 K 线 (英文列名，周期见 utils.resample)。缓存不覆盖请求区间时增量补抓，
+    offline=True 时只读本地缓存，不发起任何网络请求。
+    分钟线直接包装内存映射的列数组，不经过 Arrow 共享表，也不拷贝。
+    """
+    from utils.data_loader import clean_symbol_for, sync_symbol
+    from utils.shared_store import shared_frame
+
+    if is_intraday(timeframe):
+        from utils.intraday import IntradayStore, get_intraday
+
+        freq = normalize_timeframe(timeframe)
+        if offline:
+            bars = IntradayStore(market, clean_symbol_for(market, symbol), freq).window(start_date, end_date)
+        else:
+            bars = get_intraday(market, symbol, start_date, end_date, freq)
+        return bars.to_frame()
+    if offline:
+        clean_symbol = clean_symbol_for(market, symbol)
+    else:
+        clean_symbol, _ = sync_symbol(market, symbol, start_date, end_date)
+    return shared_frame(market, clean_symbol, start_date, end_date, timeframe)
+
+
+def backtest_frame(frame: pd.DataFrame) -> dict:
+    """
+    在带 close 与 Signal (已延后 1 天) 列的行情上追加收益与净值列，返回绩效指标 (百分比)。
+    初始资金为 1 元，只有持仓 (Signal=1) 的交易日才吃到当天涨跌幅。
+    """
+    # 标的每日基准收益率与策略每日收益率 (分钟线价格为 float32，收益与净值统一按 float64 累乘)
+    frame['Daily_Return'] = frame['close'].astype('float64').pct_change().fillna(0)
+    frame['Strategy_Return'] = frame['Signal'] * frame['Daily_Return']
+
+    # 累计净值 (Cumulative Wealth)
+    frame['Cumulative_Benchmark'] = (1 + frame['Daily_Return']).cumprod()
+    frame['Cumulative_Strategy'] = (1 + frame['Strategy_Return']).cumprod()
+
+    # 胜率：持仓且吃到正收益的天数 / 持仓总天数
+    holding_days = frame[frame['Signal'] == 1].shape[0]
+    winning_days = frame[(frame['Signal'] == 1) & (frame['Strategy_Return'] > 0)].shape[0]
+    nav = frame['Cumulative_Strategy']
+    total_return = (nav.iloc[-1] - 1) * 100
+    benchmark_return = (frame['Cumulative_Benchmark'].iloc[-1] - 1) * 100
+    return {
+        'total_return': float(total_return),
+        'benchmark_return': float(benchmark_return),
+        'excess_return': float(total_return - benchmark_return),
+        'holding_days': int(holding_days),
+        'win_rate': (winning_days / holding_days * 100) if holding_days > 0 else 0.0,
+        'max_drawdown': float((1 - nav / nav.cummax()).max() * 100),
+        'trading_days': len(frame),
+    }
+
+
+def run_backtest(frame: pd.DataFrame, strategy: str, params: dict = None, cache=None) -> BacktestResult:
+    """
+    在行情 frame 上运行内置策略并回测。params 缺省的参数取 DEFAULT_PARAMS；
+    cache 与 run_strategy 的同名参数一致。frame 会被追加策略与回测列。
+    """
+    spec = build_strategy(strategy, **{**DEFAULT_PARAMS.get(strategy, {}), **(params or {})})
+    result = run_strategy(spec, frame, cache=cache)
+    for name, values in result.series.items():
+        frame[name] = values
+    # 延后 1 天交易（避免用到未来函数）
+    frame['Signal'] = result.signal
+    metrics = backtest_frame(frame) if len(frame) else {}
+    return BacktestResult(spec=spec, strategy=result, frame=frame, metrics=metrics)
+
+
+# --- 批量任务 ---
+# 任务为字典：{"symbol": "600519", "market": "A", "start": "2015-01-01", "end": "2024-01-01", "timeframe": "W",
+#             "strategy": "dual_ma", "params": {"ma_short": 5, "ma_long": 20}, "name": "可选的输出文件名"}
+# timeframe 可省略 (日线)，也可为 W / M / <N>D 或分钟线 1min / 5min。
+# 每个任务输出一个净值 CSV，汇总指标由调用方写入 JSON / CSV。
+
+def job_name(job: dict) -> str:
+    """任务的输出文件名 (不含扩展名)，未指定 name 时由市场、代码、策略与参数拼成"""
+    if job.get('name'):
+        return job['name']
+    params = "_".join(f"{k}{v}" for k, v in sorted(job.get('params', {}).items()))
+    timeframe = job.get('timeframe', 'D')
+    return "_".join(filter(None, [job['market'], job['symbol'], None if timeframe == 'D' else timeframe,
+                                  job['strategy'], params]))
+
+
+def run_job(job: dict, out_dir: str = None, offline: bool = False) -> dict:
+    """执行一个批量任务，返回 (任务 + 指标 + 状态) 组成的一行汇总；out_dir 不为空时写出净值 CSV"""
+    started = time.perf_counter()
+    record = {'name': job_name(job), 'market': job['market'], 'symbol': job['symbol'], 'strategy': job['strategy'],
+              'timeframe': job.get('timeframe', 'D'), 'start': job['start'], 'end': job['end'],
+              'params': job.get('params', {})}
+    try:
+        frame = load_frame(job['market'], job['symbol'], job['start'], job['end'], offline=offline,
+                           timeframe=record['timeframe'])
+        if frame.empty:
+            record.update(status='empty', error="区间内没有行情数据")
+        else:
+            # 共享切片的列只读，回测列追加在浅拷贝上
+            result = run_backtest(frame.copy(deep=False), job['strategy'], job.get('params'))
+            record.update(status='ok', error=None, **result.metrics)
+            if out_dir:
+                path = os.path.join(out_dir, f"{record['name']}.csv")
+                result.frame[EQUITY_COLUMNS].to_csv(path, index=False, float_format="%.8g")
+                record['equity_file'] = path
+    except Exception as e:
+        record.update(status='failed', error=f"{type(e).__name__}: {e}")
+    record['seconds'] = time.perf_counter() - started
+    return record
+
+
+def run_jobs(jobs: list, out_dir: str = None, workers: int = 1, offline: bool = False, progress=None) -> list:
+    """
+    按顺序 (workers=1) 或在进程池中并行执行一批任务，返回与 jobs 同序的汇总行。
+    progress(done, total, record) 在每个任务完成时调用。
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    records = [None] * len(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        for i, job in enumerate(jobs):
+            records[i] = run_job(job, out_dir, offline)
+            if progress:
+                progress(i + 1, len(jobs), records[i])
+        return records
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job, out_dir, offline): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            records[futures[future]] = future.result()
+            if progress:
+                progress(done, len(jobs), records[futures[future]])
+    return records
+
+
+def expand_jobs(config: dict) -> list:
+    """
+    把配置展开为任务列表。配置可以是任务列表，或 {"defaults": {...}, "runs": [...]}，
+    runs 中未给出的字段取 defaults，symbols 字段可一次展开多个代码。
+    策略不接受的参数名 (多半是拼写错误) 直接报错，不会悄悄退回默认值。
+    """
+    if isinstance(config, list):
+        config = {'runs': config}
+    defaults = {'market': "A", 'timeframe': "D", 'strategy': "dual_ma", 'params': {}, **config.get('defaults', {})}
+    jobs = []
+    for run in config.get('runs', [{}]):
+        merged = {**defaults, **run, 'params': {**defaults.get('params', {}), **run.get('params', {})}}
+        symbols = merged.pop('symbols', None) or [merged.get('symbol')]
+        for symbol in symbols:
+            if not symbol:
+                raise ValueError(f"任务缺少 symbol: {run}")
+            job = {**merged, 'symbol': str(symbol), 'timeframe': normalize_timeframe(merged['timeframe'])}
+            unknown = sorted(set(job['params']) - set(strategy_params(job['strategy'])))
+            if unknown:
+                raise ValueError(f"策略 {job['strategy']} 不接受参数 {unknown}，"
+                                 f"可选 {strategy_params(job['strategy'])}")
+            if len(symbols) > 1:
+                job.pop('name', None)
+            for key in ('start', 'end'):
+                if not job.get(key):
+                    raise ValueError(f"任务 {symbol} 缺少 {key} 日期")
+            jobs.append(job)
+    return jobs
+
+
+def load_config(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return expand_jobs(json.load(f))
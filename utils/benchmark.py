@@ -0,0 +1,282 @@
+import contextlib
+import io
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+import utils.data_loader as data_loader
+from utils.data_loader import OHLCV_COLUMNS, daily_file_path, get_a_share_daily, read_daily, sync_daily
+from utils.shared_store import shared_frame
+from utils.chart_data import DEFAULT_POINT_BUDGET, build_markers, candle_view
+from utils.strategy import build_strategy, run_strategy
+from utils.backtest import backtest_frame
+from utils.synthetic import synthetic_ohlcv
+
+# --- 性能基准 (Benchmark) ---
+# 对 README 中“数据流转全景”的每个阶段计时：缓存读取 -> 共享表切片 -> 指标与信号 -> 净值回测 -> Marker 构建。
+# 数据集包括 1k ~ 10M 行的合成行情 (固定种子，结果可复现) 与仓库自带的两份真实日线缓存。
+# 结果输出为 JSON，可与历史版本的结果对比，超出容忍度的阶段视为性能回退。
+
+# 合成数据规模
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_SIZES = SIZES[:4]
+# 合成日线从 2000 年起按工作日推算，行数再多就会越过今天 (加载入口会去补抓“缺口”)，更大的规模改用分钟线
+DAILY_MAX_ROWS = 5_000
+# 分钟线的单根波动率 (约合日波动 2%)，不加漂移，避免千万根 K 线累计后价格溢出
+MINUTE_VOLATILITY = 0.02 / np.sqrt(240)
+SYNTHETIC_SEED = 42
+
+# 仓库自带的真实行情 (市场, 代码)
+BUNDLED = [("A", "600519"), ("US", "TSLA")]
+
+# 默认策略参数，与 app.py 滑块默认值一致
+DUAL_MA_PARAMS = {'ma_short': 5, 'ma_long': 20}
+MACD_RSI_PARAMS = {'macd_fast': 12, 'macd_slow': 26, 'rsi_period': 14, 'rsi_overbought': 70, 'rsi_oversold': 30}
+
+# README 中各阶段宣称的耗时上限 (毫秒)，只对真实行情检查
+README_BUDGETS_MS = {
+    'load.read_daily': 10,
+    'load.get_daily': 10,
+    'strategy.dual_ma': 50,
+    'strategy.macd_rsi': 50,
+    'backtest.cumprod': 10,
+    'chart.markers': 100,
+    'chart.decimate': 100,
+}
+
+# 单个阶段的计时预算：至少重复到这么多秒 (或达到最大次数) 再取中位数
+MIN_SECONDS = 0.2
+MAX_REPEAT = 20
+
+
+# --- 被测阶段：与 app.py 单次回测流水线逐段同口径 ---
+
+def _strategy_block(chart_df: pd.DataFrame, name: str, params: dict):
+    """编译并执行声明式策略，写入指标列与延后 1 天的 Signal，返回 (chart_df, 买点掩码, 卖点掩码)"""
+    chart_df = chart_df.copy(deep=False)
+    result = run_strategy(build_strategy(name, **params), chart_df)
+    for column, values in result.series.items():
+        chart_df[column] = values
+    chart_df['Signal'] = result.signal
+    return chart_df, result.buy, result.sell
+
+
+def dual_ma_block(chart_df: pd.DataFrame, ma_short: int, ma_long: int):
+    """双均线：指标 + 金叉死叉 + 持仓信号"""
+    return _strategy_block(chart_df, 'dual_ma', {'ma_short': ma_short, 'ma_long': ma_long})
+
+
+def macd_rsi_block(chart_df: pd.DataFrame, macd_fast: int, macd_slow: int, rsi_period: int,
+                   rsi_overbought: float, rsi_oversold: float = None, signal_period: int = 9):
+    """MACD + RSI：指标 + 买卖点 + 持仓状态机"""
+    return _strategy_block(chart_df, 'macd_rsi', {
+        'macd_fast': macd_fast, 'macd_slow': macd_slow, 'rsi_period': rsi_period,
+        'rsi_overbought': rsi_overbought, 'signal_period': signal_period,
+    })
+
+
+def marker_block(chart_df: pd.DataFrame, buy, sell) -> list:
+    return (build_markers(chart_df['time'], buy, "below", "arrow_up", "#ef5350", "买入")
+            + build_markers(chart_df['time'], sell, "above", "arrow_down", "#26a69a", "卖出"))
+
+
+def cumprod_backtest(chart_df: pd.DataFrame) -> dict:
+    return backtest_frame(chart_df.copy(deep=False))
+
+
+# --- 计时工具 ---
+
+def time_call(fn, min_seconds: float = MIN_SECONDS, max_repeat: int = MAX_REPEAT) -> dict:
+    """先预热一次，再重复调用直到累计耗时超过 min_seconds，返回各次耗时统计 (毫秒)"""
+    fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeat:
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+        if time.perf_counter() - started >= min_seconds:
+            break
+    samples = np.array(samples)
+    return {
+        'repeat': len(samples),
+        'min_ms': float(samples.min()),
+        'median_ms': float(np.median(samples)),
+        'mean_ms': float(samples.mean()),
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    """屏蔽加载函数打印的进度日志"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def _data_dir(path: str):
+    """临时把缓存根目录切换到 path，结束后恢复"""
+    original = data_loader.DATA_DIR
+    data_loader.DATA_DIR = path
+    try:
+        yield
+    finally:
+        data_loader.DATA_DIR = original
+
+
+def _size_label(n_rows: int) -> str:
+    for unit, scale in (("M", 1_000_000), ("k", 1_000)):
+        if n_rows >= scale and n_rows % scale == 0:
+            return f"{n_rows // scale}{unit}"
+    return str(n_rows)
+
+
+def _run_stages(dataset: str, market: str, symbol: str, start: str, end: str, stages: list | None,
+                record, min_seconds: float, max_repeat: int):
+    """在当前缓存目录下对一个标的依次计时全部阶段"""
+    def want(stage):
+        return stages is None or any(stage.startswith(s) for s in stages)
+
+    def bench(stage, fn, rows):
+        if not want(stage):
+            return
+        with _quiet():
+            stats = time_call(fn, min_seconds, max_repeat)
+        record(stage, dataset, rows, stats)
+
+    df = read_daily(market, symbol, start, end, OHLCV_COLUMNS)
+    rows = len(df)
+    # 请求区间收敛到缓存实际覆盖的首尾交易日，保证完整加载入口不会触发网络补抓
+    start, end = str(df['日期'].iloc[0]), str(df['日期'].iloc[-1])
+    window_start = df['日期'].iloc[int(rows * 0.9)]
+    window_rows = int((df['日期'] >= window_start).sum())
+
+    bench('load.read_daily', lambda: read_daily(market, symbol, start, end, OHLCV_COLUMNS), rows)
+    bench('load.read_daily_window', lambda: read_daily(market, symbol, str(window_start), end, OHLCV_COLUMNS), window_rows)
+    # 进程级共享表：首次调用 (预热) 加载整表，之后每次只是零拷贝切片
+    bench('load.shared_frame', lambda: shared_frame(market, symbol, start, end), rows)
+    # 周线：物化文件已与日线一致时，只是共享表上的切片 (首次调用时物化)
+    if want('load.shared_frame_weekly'):
+        weekly_rows = len(shared_frame(market, symbol, start, end, 'W'))
+        bench('load.shared_frame_weekly', lambda: shared_frame(market, symbol, start, end, 'W'), weekly_rows)
+    if market == "A":
+        # 完整的加载入口：覆盖区间检查 + 读取 (缓存已覆盖，不会触发网络请求)
+        bench('load.get_daily', lambda: get_a_share_daily(symbol, start, end, columns=OHLCV_COLUMNS), rows)
+
+    # 与 app.py 相同：策略直接在共享表切片 (已是英文列名) 上运行，不再做列名转换
+    chart_df = shared_frame(market, symbol, start, end)
+
+    ma_df, ma_buy, ma_sell = dual_ma_block(chart_df, **DUAL_MA_PARAMS)
+    macd_df, macd_buy, macd_sell = macd_rsi_block(chart_df, **MACD_RSI_PARAMS)
+    bench('strategy.dual_ma', lambda: dual_ma_block(chart_df, **DUAL_MA_PARAMS), rows)
+    bench('strategy.macd_rsi', lambda: macd_rsi_block(chart_df, **MACD_RSI_PARAMS), rows)
+    bench('backtest.cumprod', lambda: cumprod_backtest(ma_df), rows)
+    bench('chart.markers', lambda: marker_block(ma_df, ma_buy, ma_sell), int(ma_buy.sum() + ma_sell.sum()))
+    bench('chart.markers_macd', lambda: marker_block(macd_df, macd_buy, macd_sell), int(macd_buy.sum() + macd_sell.sum()))
+    bench('chart.decimate', lambda: candle_view(ma_df, DEFAULT_POINT_BUDGET, ('MA_Short', 'MA_Long')), rows)
+
+
+def run_benchmarks(sizes: list = None, bundled: bool = True, stages: list = None,
+                   min_seconds: float = MIN_SECONDS, max_repeat: int = MAX_REPEAT, progress=None) -> dict:
+    """
+    运行整套基准，返回可直接序列化为 JSON 的结果：
+    {"meta": 运行环境, "results": [{stage, dataset, rows, repeat, min_ms, median_ms, mean_ms, rows_per_sec}]}
+    stages 为阶段名前缀列表 (如 ["load", "strategy.dual_ma"])，None 表示全部。
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    results = []
+
+    def record(stage, dataset, rows, stats):
+        entry = {'stage': stage, 'dataset': dataset, 'rows': int(rows), **stats,
+                 'rows_per_sec': rows / stats['median_ms'] * 1000 if stats['median_ms'] > 0 else None}
+        results.append(entry)
+        if progress:
+            progress(entry)
+
+    if bundled:
+        for market, symbol in BUNDLED:
+            if not os.path.exists(daily_file_path(market, symbol)):
+                continue
+            _run_stages(f"{market}:{symbol}", market, symbol, "1990-01-01", datetime.now().strftime("%Y-%m-%d"),
+                        stages, record, min_seconds, max_repeat)
+
+    # 合成行情写入临时缓存目录，不影响真实缓存
+    tmp_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        with _data_dir(tmp_dir):
+            for n_rows in sizes:
+                if n_rows <= DAILY_MAX_ROWS:
+                    frame = synthetic_ohlcv(n_rows, seed=SYNTHETIC_SEED)
+                else:
+                    frame = synthetic_ohlcv(n_rows, seed=SYNTHETIC_SEED, freq="min", drift=0.0, volatility=MINUTE_VOLATILITY)
+                symbol = f"SYN{n_rows}"
+                start, end = str(frame['日期'].iloc[0]), str(frame['日期'].iloc[-1])
+                with _quiet():
+                    sync_daily("A", symbol, start, end, lambda fetch_start, fetch_end: frame)
+                del frame
+                _run_stages(f"synthetic-{_size_label(n_rows)}", "A", symbol, start, end,
+                            stages, record, min_seconds, max_repeat)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {'meta': environment(), 'results': results}
+
+
+def environment() -> dict:
+    """记录运行环境，跨版本对比时用于判断结果是否可比"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'duckdb': duckdb.__version__,
+    }
+
+
+# --- 回退检测 ---
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.25, min_delta_ms: float = 1.0) -> list:
+    """
+    与历史结果逐项对比中位耗时。
+    当前耗时超过 baseline × (1 + tolerance) 且绝对差值超过 min_delta_ms (过滤小规模下的计时噪声) 时记为回退。
+    """
+    base = {(r['stage'], r['dataset']): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        old = base.get((r['stage'], r['dataset']))
+        if old is None:
+            continue
+        delta = r['median_ms'] - old['median_ms']
+        if r['median_ms'] > old['median_ms'] * (1 + tolerance) and delta > min_delta_ms:
+            regressions.append({'stage': r['stage'], 'dataset': r['dataset'], 'baseline_ms': old['median_ms'],
+                                'current_ms': r['median_ms'], 'ratio': r['median_ms'] / old['median_ms']})
+    return regressions
+
+
+def check_budgets(current: dict, budgets: dict = None) -> list:
+    """检查真实行情上的各阶段耗时是否满足 README 宣称的上限"""
+    budgets = README_BUDGETS_MS if budgets is None else budgets
+    bundled = {f"{market}:{symbol}" for market, symbol in BUNDLED}
+    violations = []
+    for r in current['results']:
+        limit = budgets.get(r['stage'])
+        if limit is not None and r['dataset'] in bundled and r['median_ms'] > limit:
+            violations.append({'stage': r['stage'], 'dataset': r['dataset'], 'budget_ms': limit,
+                               'current_ms': r['median_ms']})
+    return violations
@@ -0,0 +1,144 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.shared_store import shared_store
+from utils.tracing import increment
+
+# --- 跨会话结果缓存 (进程级，所有 Streamlit 会话共享) ---
+# 行情数据本身由 utils/shared_store.py 的共享 Arrow 表提供 (每个标的一份)，这里再缓存三类结果：
+#   1. 行情同步：键为 (market, symbol, start, end)，区间确认已覆盖后跳过缺口检查与网络补抓
+#   2. 选股结果：键为 (market, 条件, 参数, 截止日, 缓存文件版本)，同一交易日的相同条件只查询一次
+#   3. 指标序列：键为 (market, symbol, start, end, 文件版本, 指标名, 参数)，滑块只改了某个参数时，
+#      其余未变化的指标直接复用，只需重算信号与回测；缓存文件更新后版本变化，旧条目自然过期
+# 每层按 LRU 淘汰，并受内存预算约束。缓存值被多个会话共享，调用方不得原地修改。
+
+# 各层内存预算 (字节)
+SYNC_CACHE_BYTES = 1024 * 1024
+SCREEN_CACHE_BYTES = 64 * 1024 * 1024
+INDICATOR_CACHE_BYTES = 256 * 1024 * 1024
+# 请求区间包含今天时，行情可能还会更新，同步结果只缓存这么多秒
+LIVE_TTL_SECONDS = 300
+
+
+def _sizeof(value) -> int:
+    """估算缓存值占用的内存字节数"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+    """线程安全的 LRU 记忆化缓存，超出内存预算时淘汰最久未使用的条目"""
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute, ttl: float = None, should_cache=None):
+        """
+        命中则直接返回缓存值，否则调用 compute() 计算并写入缓存。
+        should_cache(value) 返回 False 时结果不入缓存 (例如抓取失败得到的空表)。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                increment("cache_hit")
+                return entry[0]
+            self.misses += 1
+        increment("cache_miss")
+
+        # 计算放在锁外，避免一个慢请求阻塞其他会话
+        value = compute()
+        if should_cache is not None and not should_cache(value):
+            return value
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return value
+
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def invalidate(self, predicate):
+        """删除所有满足 predicate(key) 的条目"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'used_mb': self.current_bytes / 1024 / 1024,
+                'budget_mb': self.max_bytes / 1024 / 1024,
+            }
+
+
+sync_cache = MemoCache("行情同步", SYNC_CACHE_BYTES)
+indicator_cache = MemoCache("指标序列", INDICATOR_CACHE_BYTES)
+screen_cache = MemoCache("选股结果", SCREEN_CACHE_BYTES)
+
+
+def cached_sync(key: tuple, sync):
+    """
+    确保行情覆盖请求区间，key 形如 (market, symbol, start, end)，sync() 执行实际的缺口检查与补抓，
+    返回 (清洗后的代码, 是否成功)。同步失败的结果不入缓存，下次请求会重新补抓；
+    区间包含今天时行情还会更新，只记住 LIVE_TTL_SECONDS 秒。
+    """
+    live = pd.Timestamp(key[3]) >= pd.Timestamp(datetime.now().date())
+    return sync_cache.get_or_compute(key, sync, ttl=LIVE_TTL_SECONDS if live else None,
+                                     should_cache=lambda result: result[1])
+
+
+def cached_indicator(frame_key: tuple, name: str, params: tuple, compute):
+    """读取某个行情切片上的指标序列，相同 (指标名, 参数) 只计算一次"""
+    return indicator_cache.get_or_compute((*frame_key, name, params), compute)
+
+
+def cached_screen(key: tuple, compute) -> pd.DataFrame:
+    """读取选股结果，key 中包含缓存文件版本，行情更新后自动重新查询"""
+    return screen_cache.get_or_compute(key, compute)
+
+
+def cache_stats() -> list:
+    return [shared_store.stats(), indicator_cache.stats(), screen_cache.stats()]
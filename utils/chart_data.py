@@ -0,0 +1,198 @@
+import json
+
+import numpy as np
+import pandas as pd
+from lightweight_charts.util import marker_position, marker_shape
+
+# --- 图表数据准备：抽稀 (Decimation) 与 Marker ---
+# 浏览器端一张图能分辨的点数受像素宽度限制，二十年日线或分钟线全部发送只会拖慢序列化与渲染。
+# 超出点数预算时：
+#   - K 线与成交量按位置分桶聚合 (开=首、高=最大、低=最小、收=末、量=求和)，每桶的最高/最低价不会丢失
+#   - 指标线用 LTTB (Largest-Triangle-Three-Buckets) 选点，并强制保留全局最高/最低点
+#   - 买卖点 Marker 吸附到所在桶的时间上，抽稀后依然一个不少
+# 数据量不超过预算时原样返回。
+
+# 默认每张图发送给浏览器的点数上限 (约为宽屏图表像素宽度的 1.5 倍)
+DEFAULT_POINT_BUDGET = 2000
+CANDLE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume']
+# 平均每桶不超过这么多个点时，LTTB 选点走纯 Python 循环
+NARROW_BUCKET = 16
+
+
+def bucket_starts(n: int, budget: int) -> np.ndarray:
+    """把 n 个点按位置均分为至多 budget 个桶，返回各桶起始下标；budget <= 0 或 n 不超过预算时每个点单独成桶"""
+    if budget <= 0 or n <= budget:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n, budget, endpoint=False).astype(np.int64))
+
+
+def _lttb_select(x: np.ndarray, y: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    LTTB 核心：按给定分桶每桶选一个点，使其与上一个选中点、下一桶均值点构成的三角形面积最大。
+    第一个桶取首个有效点，最后一个桶取末个有效点；整桶为 NaN 时返回 -1。
+    """
+    n = len(y)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.append(starts[1:], n)
+    finite = ~np.isnan(y)
+    count = np.add.reduceat(finite.astype(np.float64), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_x = (np.add.reduceat(np.where(finite, x, 0.0), starts) / count).tolist()
+        avg_y = (np.add.reduceat(np.where(finite, y, 0.0), starts) / count).tolist()
+
+    non_empty = np.flatnonzero(count > 0)
+    chosen = np.full(len(starts), -1, dtype=np.int64)
+    if len(non_empty) == 0:
+        return chosen
+    # 每个桶之后的下一个非空桶
+    next_pos = np.searchsorted(non_empty, np.arange(len(starts)), side='right').tolist()
+    starts, ends, non_empty = starts.tolist(), ends.tolist(), non_empty.tolist()
+
+    first, last = non_empty[0], non_empty[-1]
+    # 桶很窄时逐个 NumPy 调用的固定开销远大于计算本身，改用纯 Python 标量循环
+    narrow = n <= NARROW_BUCKET * len(starts)
+    if narrow:
+        xs, ys = x.tolist(), y.tolist()
+    anchor = -1
+    for i in non_empty:
+        lo, hi = starts[i], ends[i]
+        if i == first or i == last:
+            valid = np.flatnonzero(finite[lo:hi])
+            anchor = lo + (valid[0] if i == first else valid[-1])
+        elif narrow:
+            nxt = non_empty[next_pos[i]]
+            ax, ay, cx, cy = xs[anchor], ys[anchor], avg_x[nxt], avg_y[nxt]
+            best = -1.0
+            for j in range(lo, hi):
+                yj = ys[j]
+                if yj != yj:
+                    continue
+                area = abs((ax - cx) * (yj - ay) - (ax - xs[j]) * (cy - ay))
+                if area > best:
+                    best, anchor = area, j
+        else:
+            nxt = non_empty[next_pos[i]]
+            valid = np.flatnonzero(finite[lo:hi])
+            ax, ay = x[anchor], y[anchor]
+            cx, cy = avg_x[nxt], avg_y[nxt]
+            seg_x, seg_y = x[lo:hi][valid], y[lo:hi][valid]
+            area = np.abs((ax - cx) * (seg_y - ay) - (ax - seg_x) * (cy - ay))
+            anchor = lo + valid[int(area.argmax())]
+        chosen[i] = anchor
+    return chosen
+
+
+def _force_extremes(y: np.ndarray, starts: np.ndarray, chosen: np.ndarray) -> np.ndarray:
+    """全局最高/最低点所在的桶改为选中该点，保证极值不被抽掉"""
+    if np.isnan(y).all():
+        return chosen
+    for idx in (int(np.nanargmax(y)), int(np.nanargmin(y))):
+        chosen[np.searchsorted(starts, idx, side='right') - 1] = idx
+    return chosen
+
+
+def lttb_indices(y, budget: int, x=None) -> np.ndarray:
+    """
+    对单条曲线做 LTTB 抽稀，返回保留点的下标 (升序，NaN 点不保留)。
+    首尾两个点各占一个桶，全局最高/最低点一定保留。
+    """
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if budget <= 0 or len(valid) <= max(budget, 3):
+        return valid
+    xs = (np.arange(len(y), dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64))[valid]
+    ys = y[valid]
+    n = len(ys)
+    starts = np.concatenate([[0], np.linspace(1, n - 1, budget - 1).astype(np.int64)[:-1], [n - 1]])
+    chosen = _force_extremes(ys, starts, _lttb_select(xs, ys, starts))
+    return valid[np.unique(chosen[chosen >= 0])]
+
+
+def lttb_frame(df: pd.DataFrame, columns: list, budget: int = DEFAULT_POINT_BUDGET) -> pd.DataFrame:
+    """
+    多条曲线共用一张图时，各列分别做 LTTB，取下标并集，保证每条线的形状都被保留。
+    横轴使用索引 (时间索引按时间间距计算面积)。
+    """
+    if budget <= 0 or len(df) <= budget:
+        return df
+    index = df.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else None
+    keep = np.unique(np.concatenate([lttb_indices(df[c].to_numpy(dtype=np.float64), budget, x) for c in columns]))
+    return df.iloc[keep]
+
+
+def candle_view(chart_df: pd.DataFrame, budget: int = DEFAULT_POINT_BUDGET, overlays: tuple = ()):
+    """
+    生成发送给 K 线图的数据：
+    返回 (K 线 DataFrame, {叠加线列名: 该线的 time/value DataFrame}, 各桶起始下标)。
+    叠加线在与 K 线相同的桶上选点并使用桶的时间，避免与 K 线的时间轴错位。
+    """
+    n = len(chart_df)
+    starts = bucket_starts(n, budget)
+    times = chart_df['time'].to_numpy()
+    bucket_time = times[starts]
+
+    if len(starts) == n:
+        candles = chart_df[CANDLE_COLUMNS].copy()
+        lines = {col: chart_df[['time', col]].dropna() for col in overlays}
+        return candles, lines, starts
+
+    last = np.append(starts[1:], n) - 1
+    candles = pd.DataFrame({
+        'time': bucket_time,
+        'open': chart_df['open'].to_numpy()[starts],
+        'high': np.fmax.reduceat(chart_df['high'].to_numpy(dtype=np.float64), starts),
+        'low': np.fmin.reduceat(chart_df['low'].to_numpy(dtype=np.float64), starts),
+        'close': chart_df['close'].to_numpy()[last],
+        'volume': np.add.reduceat(chart_df['volume'].to_numpy(), starts),
+    })
+
+    lines = {}
+    x = np.arange(n, dtype=np.float64)
+    for col in overlays:
+        y = chart_df[col].to_numpy(dtype=np.float64)
+        chosen = _force_extremes(y, starts, _lttb_select(x, y, starts))
+        ok = chosen >= 0
+        lines[col] = pd.DataFrame({'time': bucket_time[ok], col: y[chosen[ok]]})
+    return candles, lines, starts
+
+
+def _time_strings(times: np.ndarray) -> np.ndarray:
+    """日线输出 YYYY-MM-DD，带日内时间的输出到秒"""
+    days = times.astype('datetime64[D]')
+    unit = 'D' if (times == days).all() else 's'
+    return np.datetime_as_string(times, unit=unit)
+
+
+def build_markers(times: pd.Series, mask, position: str, shape: str, color: str, text: str) -> list:
+    """
+    按布尔掩码一次性生成 Marker 列表 (替代逐行 iterrows)。
+    格式与 lightweight-charts 的 marker_list 参数一致。
+    """
+    hit = np.asarray(mask, dtype=bool)
+    stamps = _time_strings(times.to_numpy()[hit])
+    return [{"time": t, "position": position, "shape": shape, "color": color, "text": text} for t in stamps.tolist()]
+
+
+def set_markers(chart, markers: list, bucket_times=None):
+    """
+    把 Marker 一次性写入图表。bucket_times 为抽稀后 K 线的时间序列，
+    每个 Marker 吸附到所在桶的起始时间，保证落在实际存在的 K 线上。
+    时间直接换算为秒级时间戳，不经过 marker_list 逐个解析日期。
+    """
+    if not markers:
+        chart.run_script(f'{chart.id}.series.setMarkers([])')
+        return
+    seconds = np.array([m['time'] for m in markers], dtype='datetime64[s]').astype(np.int64)
+    if bucket_times is not None:
+        bucket_seconds = np.asarray(bucket_times, dtype='datetime64[s]').astype(np.int64)
+        seconds = bucket_seconds[np.clip(np.searchsorted(bucket_seconds, seconds, side='right') - 1, 0, None)]
+    order = np.argsort(seconds, kind='stable')
+    payload = [{
+        "time": int(seconds[i]),
+        "position": marker_position(markers[i]['position']),
+        "color": markers[i]['color'],
+        "shape": marker_shape(markers[i]['shape']),
+        "text": markers[i]['text'],
+    } for i in order]
+    chart.run_script(f'{chart.id}.series.setMarkers({json.dumps(payload, ensure_ascii=False)})')
@@ -1,161 +1,525 @@
-import akshare as ak
 import pandas as pd
-import duckdb
+import numpy as np
 import os
-from datetime import datetime
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from utils.providers import AkShareProvider, YFinanceProvider, normalize_frame
+from utils.tracing import annotate, increment, span, traced
+
+if TYPE_CHECKING:
+    import duckdb
+
+# 重量级依赖按需导入：duckdb 在第一次读缓存时导入，requests 与 akshare / yfinance 只在缓存缺口需要联网补抓时导入，
+# 只读本地缓存的批处理与脚本启动时不为网络库付出导入开销。
+# 数据目录在第一次写缓存时才创建 (_merge_into_cache)，导入本模块没有副作用。
 
 # 数据存储目录
 DATA_DIR = "data"
-os.makedirs(DATA_DIR, exist_ok=True)
+
+# 缓存按 Hive 分区组织：data/market=<市场>/symbol=<代码>/daily.parquet
+DAILY_FILE = "daily.parquet"
+# 看盘与回测所需的核心字段
+OHLCV_COLUMNS = ['日期', '开盘', '最高', '最低', '收盘', '成交量']
+# 图表与回测使用的英文列名 <- 缓存中的中文列名
+CHART_COLUMNS = dict(zip(OHLCV_COLUMNS, ['time', 'open', 'high', 'low', 'close', 'volume']))
+
+# A 股首次建缓存时拉取的起始日期 (上市以来全部历史)
+A_SHARE_HISTORY_START = "1990-01-01"
+# 美股首次建缓存时至少回溯的年数
+US_HISTORY_YEARS = 10
 
 # --- 增强的 AkShare 请求机制 ---
 import time
-import requests
 
-def fetch_data_with_retry(symbol: str, retries: int = 3, delay: int = 2) -> pd.DataFrame:
-    """带重试机制的数据抓取"""
+@traced("fetch.akshare")
+def fetch_data_with_retry(symbol: str, retries: int = 3, delay: int = 2, start_date: str = "19900101", end_date: str = None) -> pd.DataFrame:
+    """带重试机制的数据抓取，可指定起止日期 (YYYYMMDD) 只抓取缺失的区间"""
+    import requests
+
+    if end_date is None:
+        end_date = datetime.now().strftime("%Y%m%d")
     for attempt in range(retries):
         try:
             # 去除可能带有的 sh/sz 前缀，很多 AkShare 的新方言接口只认 6 位数字
             clean_symbol = symbol.replace("sh", "").replace("sz", "")
-            
-            # 首选：新浪财经 A 股前复权接口 (相对稳定)
-            df = ak.stock_zh_a_hist(symbol=clean_symbol, period="daily", start_date="19900101", end_date=datetime.now().strftime("%Y%m%d"), adjust="qfq")
-            
+
+            # 首选：A 股前复权接口 (相对稳定)
+            df = AkShareProvider().download(clean_symbol, pd.Timestamp(start_date), pd.Timestamp(end_date))
+
             if not df.empty:
+                annotate(symbol=symbol, attempts=attempt + 1, rows=len(df))
                 return df
-                
+
         except requests.exceptions.ConnectionError as e:
             print(f"⚠️ [尝试 {attempt+1}/{retries}] 连接被拒绝或中断: {e}")
             time.sleep(delay)
         except Exception as e:
             print(f"⚠️ [尝试 {attempt+1}/{retries}] 发生未知错误: {e}")
             time.sleep(delay)
-            
+
     print(f"❌ 警告：经过 {retries} 次尝试，仍未获取到 {symbol} 的数据。")
+    annotate(symbol=symbol, attempts=retries, rows=0)
     return pd.DataFrame()
 
-def get_a_share_daily(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+
+# --- 共享 DuckDB 目录 (Catalog) ---
+# 进程内只维护一个长连接，每个线程通过 cursor() 拿到自己的游标 (DuckDB 连接对象不能跨线程并发使用)。
+# 全部日线缓存注册为一张 Hive 分区视图 daily，可按 market / symbol 跨标的查询。
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_catalog_has_view = False
+_local = threading.local()
+
+
+def _conn() -> "duckdb.DuckDBPyConnection":
+    """返回当前线程专属的 DuckDB 游标，底层共享同一个长连接"""
+    cursor = getattr(_local, "cursor", None)
+    if cursor is None:
+        global _catalog
+        with _catalog_lock:
+            if _catalog is None:
+                import duckdb
+                _catalog = duckdb.connect()
+            cursor = _catalog.cursor()
+        _local.cursor = cursor
+    return cursor
+
+
+def daily_dataset_sql() -> str:
+    """全部日线缓存作为一个 Hive 分区数据集的表达式，可直接嵌入 FROM 子句"""
+    pattern = os.path.join(DATA_DIR, "market=*", "symbol=*", DAILY_FILE)
+    return (f"read_parquet('{pattern}', hive_partitioning=true, union_by_name=true, "
+            "hive_types={'market': VARCHAR, 'symbol': VARCHAR})")
+
+
+def get_catalog() -> "duckdb.DuckDBPyConnection":
     """
-    获取 A 股历史日线数据，并使用 DuckDB + Parquet 缓存
+    返回已注册 daily 视图的共享游标，用于跨标的 SQL 查询，例如：
+    SELECT symbol, max(日期) FROM daily WHERE market = 'A' GROUP BY symbol
     """
-    # 将日期格式统一为 YYYYMMDD，适配 AkShare 接口
-    ak_start = start_date.replace("-", "")
-    ak_end = end_date.replace("-", "")
-    
-    # 强制清理股票代码供文件名使用（去除特殊字符）
-    clean_symbol = symbol.replace("sh", "").replace("sz", "")
-    file_path = os.path.join(DATA_DIR, f"A_{clean_symbol}_daily.parquet")
-    
-    # 策略 1：检查本地是否已有 Parquet 缓存
-    if os.path.exists(file_path):
-        print(f"📦 [A股:{clean_symbol}] 发现本地缓存，正在使用 DuckDB 极速加载...")
-        conn = duckdb.connect()
-        query = f"SELECT * FROM '{file_path}'"
-        df = conn.execute(query).df()
-        
-        df['日期'] = pd.to_datetime(df['日期'])
-        mask = (df['日期'] >= pd.to_datetime(start_date)) & (df['日期'] <= pd.to_datetime(end_date))
-        filtered_df = df.loc[mask].copy()
-        
-        if not filtered_df.empty:
-            return filtered_df
+    global _catalog_has_view
+    import duckdb
+
+    cursor = _conn()
+    if not _catalog_has_view:
+        with _catalog_lock:
+            # 视图在创建时会校验文件是否存在，因此等到第一个分区落盘后再注册
+            if not _catalog_has_view:
+                try:
+                    cursor.execute(f"CREATE OR REPLACE VIEW daily AS SELECT * FROM {daily_dataset_sql()}")
+                    _catalog_has_view = True
+                except duckdb.IOException:
+                    pass
+    return cursor
+
+
+def read_daily(market: str, symbol: str, start_date: str, end_date: str, columns: list = None) -> pd.DataFrame:
+    """
+    从缓存读取单个标的的日线切片。
+    分区路径由 (market, symbol) 直接确定，不需要扫描整个目录；
+    日期过滤与列投影下推到 Parquet 扫描，只读取并物化请求的区间与字段。
+    """
+    file_path, _ = _cache_paths(market, symbol)
+    with span("load.read_daily", market=market, symbol=symbol) as sp:
+        if not os.path.exists(file_path):
+            return pd.DataFrame()
+        select = ", ".join(f'"{c}"' for c in columns) if columns else "*"
+        df = _conn().execute(
+            f"SELECT {select} FROM read_parquet(?, hive_partitioning=false) WHERE 日期 BETWEEN ? AND ?",
+            [file_path, pd.Timestamp(start_date), pd.Timestamp(end_date)]
+        ).df()
+        if sp:
+            sp.set(rows=len(df), bytes=int(df.memory_usage(index=False).sum()), file_bytes=os.path.getsize(file_path))
+        return df
+
+
+def daily_file_path(market: str, symbol: str) -> str:
+    """某个标的日线缓存所在的分区文件路径 (代码需已清洗)"""
+    return _cache_paths(market, symbol)[0]
+
+
+def cached_symbols(market: str) -> list:
+    """列出某个市场下已有日线缓存的全部代码"""
+    root = os.path.join(DATA_DIR, f"market={market}")
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name.split("=", 1)[1] for name in os.listdir(root)
+        if name.startswith("symbol=") and os.path.exists(os.path.join(root, name, DAILY_FILE))
+    )
+
+
+# --- 并发安全：单飞抓取 (Single-flight) + 跨进程文件锁 ---
+# 多个会话 / 线程同时请求同一个 (市场, 代码, 区间) 时，只有第一个请求真正执行同步，其余请求等待它完成并共享结果 (含异常)。
+# 同一标的的写入 (缺口补抓、合并、覆盖区间元数据) 在 data/.locks/ 下的锁文件上互斥，对其他进程 (prefetch、批量回测) 同样有效；
+# 拿到锁之后重新读取覆盖区间，前一个持锁者已经补齐的缺口不会再抓一次。
+# 所有缓存文件都先写入唯一命名的临时文件再原子替换 (os.replace)，读者只会看到完整的旧文件或新文件。
+
+LOCK_DIR = ".locks"
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(key, compute):
+    """同一 key 同时只执行一次 compute()，并发的调用者等待并共享它的返回值或异常"""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
         else:
-            print(f"⚠️ [A股:{clean_symbol}] 缓存数据未能覆盖请求的时间段，准备重新网络拉取...")
-
-    # 策略 2：本地没有缓存，使用重试机制从网络拉取
-    print(f"🌐 [A股:{clean_symbol}] 正在从网络接口下载历史数据...")
-    df = fetch_data_with_retry(clean_symbol)
-    
-    if df.empty:
-        return pd.DataFrame()
-        
+            flight.waiters += 1
+    if not leader:
+        increment("singleflight_wait")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
     try:
-        print(f"✅ [A股:{clean_symbol}] 数据下载完成，共 {len(df)} 条，正在写入 Parquet 缓存。")
-        df['日期'] = pd.to_datetime(df['日期'])
-        conn = duckdb.connect()
-        conn.execute(f"COPY (SELECT * FROM df) TO '{file_path}' (FORMAT PARQUET)")
-        
-        mask = (df['日期'] >= pd.to_datetime(start_date)) & (df['日期'] <= pd.to_datetime(end_date))
-        return df.loc[mask]
+        flight.result = compute()
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
 
-    except Exception as e:
-        print(f"❌ ERROR: [A股]缓存数据时发生错误：{e}")
-        return pd.DataFrame()
 
+class FileLock:
+    """基于锁文件的跨进程互斥锁 (POSIX 用 flock，Windows 用 msvcrt.locking)，同一进程内的不同线程之间同样互斥"""
 
-# --- 新增：美股市场抓取模块 (基于 yfinance) ---
-import yfinance as yf
-
-def get_us_share_daily(symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
-    """
-    获取 美股 历史日线数据 (yfinance)，并转换为与 A股 对齐的格式后缓存为 Parquet。
-    """
-    clean_symbol = symbol.upper()
-    file_path = os.path.join(DATA_DIR, f"US_{clean_symbol}_daily.parquet")
-    
-    # 策略 1：查询本地 DuckDB 缓存
-    if os.path.exists(file_path):
-        print(f"📦 [美股:{clean_symbol}] 发现本地缓存，正在加载...")
-        conn = duckdb.connect()
-        df = conn.execute(f"SELECT * FROM '{file_path}'").df()
-        df['日期'] = pd.to_datetime(df['日期'])
-        mask = (df['日期'] >= pd.to_datetime(start_date)) & (df['日期'] >= pd.to_datetime(start_date)) & (df['日期'] <= pd.to_datetime(end_date))
-        filtered_df = df.loc[mask].copy()
-        if not filtered_df.empty:
-            return filtered_df
-            
-    # 策略 2：通过 yfinance 从全球网络获取（速度快，无限制）
-    print(f"🌐 [美股:{clean_symbol}] 正在通过 yfinance 下载历史数据...")
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                import time as _time
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        _time.sleep(0.05)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            if os.name == "nt":
+                import msvcrt
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+def cache_lock(market: str, clean_symbol: str, name: str = "daily") -> FileLock:
+    """某个标的缓存写入用的跨进程锁 (锁文件不放在分区目录里，避免为不存在的代码建出空分区)"""
+    return FileLock(os.path.join(DATA_DIR, LOCK_DIR, f"{market}_{clean_symbol}_{name}.lock"))
+
+
+def temp_path(path: str) -> str:
+    """与目标文件同目录、进程与线程间不会冲突的临时文件名 (同一文件系统内 os.replace 才是原子的)"""
+    return f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+
+
+# --- 增量缓存机制：覆盖区间元数据 + 缺口补抓 + 原子合并 ---
+# 每个 Parquet 缓存旁边有一个同名 .meta.json，记录已经向数据源确认过的日期区间。
+# 请求区间超出覆盖范围时只补抓头部/尾部缺口，再与旧数据合并后整体替换原文件。
+
+def _cache_paths(market: str, clean_symbol: str) -> tuple[str, str]:
+    partition = os.path.join(DATA_DIR, f"market={market}", f"symbol={clean_symbol}")
+    file_path = os.path.join(partition, DAILY_FILE)
+    return file_path, file_path.replace(".parquet", ".meta.json")
+
+
+def _migrate_legacy_cache(market: str, clean_symbol: str):
+    """旧版缓存为平铺的 data/<市场>_<代码>_daily.parquet，首次访问时迁移到分区目录"""
+    file_path, meta_path = _cache_paths(market, clean_symbol)
+    legacy_path = os.path.join(DATA_DIR, f"{market}_{clean_symbol}_daily.parquet")
+    if os.path.exists(file_path) or not os.path.exists(legacy_path):
+        return
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    legacy_meta = legacy_path.replace(".parquet", ".meta.json")
+    if os.path.exists(legacy_meta):
+        os.replace(legacy_meta, meta_path)
+    os.replace(legacy_path, file_path)
+    print(f"🚚 [{market}:{clean_symbol}] 旧版缓存已迁移至分区目录 {os.path.dirname(file_path)}")
+
+
+def _read_coverage(file_path: str, meta_path: str):
+    """返回缓存已覆盖的 (起始日, 截止日)，无缓存时返回 None"""
+    if not os.path.exists(file_path):
+        return None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"])
+    # 兼容旧版缓存：没有元数据时以文件内的首尾交易日作为覆盖区间
+    first, last = _conn().execute("SELECT min(日期), max(日期) FROM read_parquet(?, hive_partitioning=false)", [file_path]).fetchone()
+    if first is None:
+        return None
+    return pd.Timestamp(first), pd.Timestamp(last)
+
+
+def _write_coverage(meta_path: str, start: pd.Timestamp, end: pd.Timestamp, rows: int):
+    meta = {
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "rows": int(rows),
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    tmp_path = temp_path(meta_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def _read_anchor(file_path: str, on_or_before: pd.Timestamp = None, on_or_after: pd.Timestamp = None):
+    """取缓存中紧邻缺口的一根 K 线 (日期, 收盘价)，用于校验复权基准是否变化"""
+    conn = _conn()
+    if on_or_before is not None:
+        row = conn.execute("SELECT 日期, 收盘 FROM read_parquet(?, hive_partitioning=false) WHERE 日期 <= ? ORDER BY 日期 DESC LIMIT 1", [file_path, on_or_before]).fetchone()
+    else:
+        row = conn.execute("SELECT 日期, 收盘 FROM read_parquet(?, hive_partitioning=false) WHERE 日期 >= ? ORDER BY 日期 LIMIT 1", [file_path, on_or_after]).fetchone()
+    return (pd.Timestamp(row[0]), row[1]) if row else None
+
+
+def _anchor_matches(delta_df: pd.DataFrame, anchor) -> bool:
+    """补抓的数据中锚点 K 线收盘价与缓存一致，说明复权基准未变，可以直接拼接"""
+    if anchor is None:
+        return True
+    hit = delta_df.loc[delta_df['日期'] == anchor[0], '收盘']
+    return not hit.empty and bool(np.isclose(hit.iloc[0], anchor[1], rtol=1e-6))
+
+
+@traced("cache.merge")
+def _merge_into_cache(file_path: str, delta_df: pd.DataFrame, replace: bool = False) -> int:
+    """
+    将新数据与旧缓存按日期合并 (同一天以新数据为准)，写入临时文件后原子替换。
+    返回合并后的总行数。
+    """
+    tmp_path = temp_path(file_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    conn = _conn()
+    conn.register("delta_df", delta_df)
+    if replace or not os.path.exists(file_path):
+        source = "SELECT * FROM delta_df"
+    else:
+        source = f"""
+            SELECT * EXCLUDE (_src) FROM (
+                SELECT *, 0 AS _src FROM read_parquet('{file_path}', hive_partitioning=false)
+                UNION ALL BY NAME
+                SELECT *, 1 AS _src FROM delta_df
+            )
+            QUALIFY row_number() OVER (PARTITION BY 日期 ORDER BY _src DESC) = 1
+        """
     try:
-        # 美股通常直接获取上市以来的最大值 (period="max") 用作未来缓存
-        # 为提高速度，我们抓取近 10 年即可
-        raw_df = yf.download(clean_symbol, period="10y", progress=False)
-        
+        conn.execute(f"COPY ({source} ORDER BY 日期) TO '{tmp_path}' (FORMAT PARQUET)")
+        rows = conn.execute("SELECT count(*) FROM read_parquet(?, hive_partitioning=false)", [tmp_path]).fetchone()[0]
+    except BaseException:
+        # 写到一半失败时丢弃临时文件，原缓存保持不变
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.unregister("delta_df")
+    os.replace(tmp_path, file_path)
+    annotate(rows=rows, delta_rows=len(delta_df), file_bytes=os.path.getsize(file_path))
+    return rows
+
+
+@traced("cache.sync")
+def _sync_cache(tag: str, file_path: str, meta_path: str, start: pd.Timestamp, end: pd.Timestamp,
+                fetcher, history_start: pd.Timestamp) -> bool:
+    """
+    确保缓存覆盖 [start, end]：首次全量下载，之后只补抓缺失的头部/尾部区间。
+    fetcher(起始日, 截止日) 返回已统一为中文字段的 DataFrame，失败时返回空表。
+    返回 False 表示网络补抓失败 (此时仍可使用已有缓存)。
+    """
+    today = pd.Timestamp(datetime.now().date())
+    end = min(end, today)
+    coverage = _read_coverage(file_path, meta_path)
+
+    # 当天的 K 线可能尚未收盘，不计入已确认的覆盖区间，下次请求时会重新抓取覆盖
+    def confirmed(day: pd.Timestamp) -> pd.Timestamp:
+        return min(day, today - timedelta(days=1))
+
+    if coverage is None:
+        annotate(tag=tag, gaps="full")
+        fetch_start = min(start, history_start)
+        print(f"🌐 [{tag}] 本地无缓存，正在从网络接口下载历史数据...")
+        df = fetcher(fetch_start, today)
+        if df.empty:
+            return False
+        rows = _merge_into_cache(file_path, df, replace=True)
+        _write_coverage(meta_path, fetch_start, confirmed(today), rows)
+        print(f"✅ [{tag}] 数据下载完成，共 {rows} 条，已写入 Parquet 缓存。")
+        return True
+
+    cov_start, cov_end = coverage
+    gaps = []
+    if start < cov_start:
+        anchor = _read_anchor(file_path, on_or_after=cov_start)
+        gaps.append(("头部", start, anchor[0] if anchor else cov_start, anchor))
+    if end > cov_end:
+        anchor = _read_anchor(file_path, on_or_before=cov_end)
+        gaps.append(("尾部", anchor[0] if anchor else cov_end, end, anchor))
+
+    annotate(tag=tag, gaps=len(gaps))
+    for label, gap_start, gap_end, anchor in gaps:
+        print(f"🌐 [{tag}] 缓存{label}缺口 {gap_start:%Y-%m-%d} ~ {gap_end:%Y-%m-%d}，正在增量补抓...")
+        delta_df = fetcher(gap_start, gap_end)
+        if delta_df.empty:
+            print(f"⚠️ [{tag}] 增量补抓失败，继续使用已有缓存。")
+            return False
+
+        if not _anchor_matches(delta_df, anchor):
+            # 复权基准发生变化 (除权除息)，旧数据已不可直接拼接，整段重新下载
+            print(f"♻️ [{tag}] 检测到复权基准变化，重新下载完整历史...")
+            fetch_start = min(start, cov_start)
+            df = fetcher(fetch_start, today)
+            if df.empty:
+                return False
+            rows = _merge_into_cache(file_path, df, replace=True)
+            _write_coverage(meta_path, fetch_start, confirmed(today), rows)
+            return True
+
+        rows = _merge_into_cache(file_path, delta_df)
+        cov_start = min(cov_start, gap_start)
+        cov_end = max(cov_end, confirmed(gap_end))
+        _write_coverage(meta_path, cov_start, cov_end, rows)
+        print(f"✅ [{tag}] 增量补抓 {len(delta_df)} 条，缓存共 {rows} 条。")
+    return True
+
+
+def clean_symbol_for(market: str, symbol: str) -> str:
+    """统一代码格式：A 股去掉 sh/sz 前缀，美股转大写"""
+    symbol = symbol.strip()
+    if market == "A":
+        return symbol.replace("sh", "").replace("sz", "")
+    return symbol.upper()
+
+
+def sync_daily(market: str, clean_symbol: str, start_date: str, end_date: str, fetcher) -> bool:
+    """
+    确保某个标的的缓存覆盖 [start_date, end_date]，缺口通过 fetcher(起始日, 截止日) 补抓。
+    fetcher 返回统一中文字段的 DataFrame；返回空表或抛出异常均视为抓取失败。
+    并发的相同请求只同步一次；同一标的的写入在跨进程文件锁内进行。
+    """
+    key = (market, clean_symbol, pd.Timestamp(start_date), pd.Timestamp(end_date))
+    return single_flight(key, lambda: _sync_daily(market, clean_symbol, start_date, end_date, fetcher))
+
+
+def _sync_daily(market: str, clean_symbol: str, start_date: str, end_date: str, fetcher) -> bool:
+    # 持锁后再读覆盖区间：等锁期间其他进程补齐的缺口不会重复抓取
+    with cache_lock(market, clean_symbol):
+        _migrate_legacy_cache(market, clean_symbol)
+        file_path, meta_path = _cache_paths(market, clean_symbol)
+        if market == "A":
+            tag = f"A股:{clean_symbol}"
+            history_start = pd.Timestamp(A_SHARE_HISTORY_START)
+        else:
+            tag = f"美股:{clean_symbol}"
+            # 美股首次建缓存至少回溯 10 年，供之后的请求直接命中
+            history_start = pd.Timestamp(datetime.now().date()) - pd.DateOffset(years=US_HISTORY_YEARS)
+        return _sync_cache(tag, file_path, meta_path, pd.Timestamp(start_date), pd.Timestamp(end_date),
+                           fetcher, history_start)
+
+
+def _a_share_fetcher(clean_symbol: str):
+    def fetcher(fetch_start: pd.Timestamp, fetch_end: pd.Timestamp) -> pd.DataFrame:
+        # 将日期格式统一为 YYYYMMDD，适配 AkShare 接口
+        df = fetch_data_with_retry(clean_symbol, start_date=fetch_start.strftime("%Y%m%d"), end_date=fetch_end.strftime("%Y%m%d"))
+        return normalize_frame("akshare", df)
+    return fetcher
+
+
+def _us_share_fetcher(clean_symbol: str):
+    def fetcher(fetch_start: pd.Timestamp, fetch_end: pd.Timestamp) -> pd.DataFrame:
+        try:
+            with span("fetch.yfinance", symbol=clean_symbol) as sp:
+                raw_df = YFinanceProvider().download(clean_symbol, fetch_start, fetch_end)
+                if sp:
+                    sp.set(rows=len(raw_df))
+        except Exception as e:
+            print(f"❌ ERROR: 获取美股时发生错误：{e}")
+            return pd.DataFrame()
         if raw_df.empty:
             print(f"❌ 警告：未获取到美股代码 [{clean_symbol}] 的数据。请检查代码 (如 AAPL, TSLA, MSFT)。")
             return pd.DataFrame()
-            
-        print(f"✅ [美股:{clean_symbol}] 数据下载成功，正在清洗并写入缓存...")
-        
-        # 清洗列名：将多级表头拍平，只保留第一个级别
-        if isinstance(raw_df.columns, pd.MultiIndex):
-            raw_df.columns = raw_df.columns.get_level_values(0)
-            
-        raw_df = raw_df.reset_index()
-        
-        # 将 yfinance 的英文标准列名映射成咱们约定的中文统一格式
-        rename_map = {
-            'Date': '日期',
-            'Open': '开盘',
-            'High': '最高',
-            'Low': '最低',
-            'Close': '收盘',
-            'Volume': '成交量'
-        }
-        df = raw_df.rename(columns=rename_map)
-        
-        # 仅保留核心列
-        cols_to_keep = ['日期', '开盘', '最高', '最低', '收盘', '成交量']
-        # 兜底：如果某些数据少列
-        cols_exist = [c for c in cols_to_keep if c in df.columns]
-        df = df[cols_exist].copy()
-        
-        # 去除时区信息以便跨平台存入 Parquet
-        if df['日期'].dt.tz is not None:
-             df['日期'] = df['日期'].dt.tz_localize(None)
-        
-        # 落盘缓存
-        conn = duckdb.connect()
-        conn.execute(f"COPY (SELECT * FROM df) TO '{file_path}' (FORMAT PARQUET)")
-        
-        # 返回截取段
-        mask = (df['日期'] >= pd.to_datetime(start_date)) & (df['日期'] <= pd.to_datetime(end_date))
-        return df.loc[mask]
-        
+        return normalize_frame("yfinance", raw_df)
+    return fetcher
+
+
+def sync_symbol(market: str, symbol: str, start_date: str, end_date: str) -> tuple:
+    """
+    确保某个标的的缓存覆盖请求区间 (缺口增量补抓)，返回 (清洗后的代码, 是否同步成功)。
+    抓取出错只打印日志并返回 False，调用方继续使用已有缓存，但不应记住这次同步结果。
+    """
+    clean_symbol = clean_symbol_for(market, symbol)
+    fetcher = _a_share_fetcher(clean_symbol) if market == "A" else _us_share_fetcher(clean_symbol)
+    try:
+        ok = sync_daily(market, clean_symbol, start_date, end_date, fetcher)
     except Exception as e:
-        print(f"❌ ERROR: 获取美股时发生错误：{e}")
-        return pd.DataFrame()
+        print(f"❌ ERROR: [{'A股' if market == 'A' else '美股'}]缓存数据时发生错误：{e}")
+        ok = False
+    return clean_symbol, bool(ok)
+
+
+def get_a_share_daily(symbol: str, start_date: str, end_date: str, columns: list = None) -> pd.DataFrame:
+    """
+    获取 A 股历史日线数据，并使用 DuckDB + Parquet 缓存 (缺口增量补抓)
+    """
+    # 强制清理股票代码供文件名使用（去除特殊字符）
+    clean_symbol, _ = sync_symbol("A", symbol, start_date, end_date)
+    print(f"📦 [A股:{clean_symbol}] 正在使用 DuckDB 从本地缓存极速加载...")
+    return read_daily("A", clean_symbol, start_date, end_date, columns)
+
+
+# --- 新增：美股市场抓取模块 (基于 yfinance) ---
+
+def get_us_share_daily(symbol: str, start_date: str, end_date: str, columns: list = None) -> pd.DataFrame:
+    """
+    获取 美股 历史日线数据 (yfinance)，并转换为与 A股 对齐的格式后缓存为 Parquet (缺口增量补抓)。
+    """
+    clean_symbol, _ = sync_symbol("US", symbol, start_date, end_date)
+    print(f"📦 [美股:{clean_symbol}] 正在从本地缓存加载...")
+    return read_daily("US", clean_symbol, start_date, end_date, columns)
 
 
 # 本地测试代码 (当直接运行此脚本时触发)
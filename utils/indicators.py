@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# --- 技术指标计算模块 ---
+# 所有公式与 app.py 策略引擎保持同一口径，供单次回测、参数扫描等模块复用
+
+
+def sma(close: pd.Series, window: int) -> pd.Series:
+    """简单移动均线 (MA)"""
+    return close.rolling(window=window).mean()
+
+
+def ema(close: pd.Series, span: int) -> pd.Series:
+    """指数移动均线 (EMA)，adjust=False 即经典递推口径"""
+    return close.ewm(span=span, adjust=False).mean()
+
+
+def macd(close: pd.Series, fast: int, slow: int, signal_period: int = 9):
+    """
+    计算 MACD 三件套，返回 (DIF, DEA, MACD柱)
+    """
+    dif = ema(close, fast) - ema(close, slow)
+    dea = dif.ewm(span=signal_period, adjust=False).mean()
+    return dif, dea, 2 * (dif - dea)
+
+
+def rsi(close: pd.Series, period: int) -> pd.Series:
+    """相对强弱指标 (RSI)，涨跌幅均值使用简单滚动平均"""
+    delta = close.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def ewm_rows(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    对二维数组 (参数组合 × 交易日) 的每一行同时做 EMA 递推。
+    与 pandas ewm(adjust=False) 逐位一致，输入不允许含 NaN。
+    """
+    alpha = 2.0 / (span + 1.0)
+    old_wt = 1.0 - alpha
+    norm = old_wt + alpha
+    out = np.empty_like(values, dtype=np.float64)
+    weighted = values[:, 0].astype(np.float64)
+    out[:, 0] = weighted
+    for t in range(1, values.shape[1]):
+        cur = values[:, t]
+        # pandas 在新值等于当前均值时跳过递推，这里同样处理以保证逐位一致
+        weighted = np.where(weighted != cur, (old_wt * weighted + alpha * cur) / norm, weighted)
+        out[:, t] = weighted
+    return out
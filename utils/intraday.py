@@ -0,0 +1,391 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils import data_loader
+from utils.providers import INTRADAY_MINUTES, default_provider, normalize_frame
+from utils.tracing import annotate, span, traced
+
+# --- 分钟线列式存储 (Intraday Store) ---
+# 十年 1 分钟线约百万行，用 Parquet + pandas 每次都要整表解码、物化成 DataFrame。
+# 这里按列存成定长二进制 (.npy)，读取时内存映射，直接返回 NumPy 视图：
+#   data/market=<市场>/symbol=<代码>/intraday_<周期>/
+#       manifest.json                 各月份分块的版本目录、行数与首尾时间
+#       202401.<版本>/time.npy        int64 秒级时间戳 (交易所当地时间按 UTC 计，与图表库一致)
+#       202401.<版本>/open.npy ...    float32 开高低收，int64 成交量
+# 打开存储只读取 manifest；请求某个时间窗口时只映射相关月份，按二分查找切片，
+# 窗口落在单个月份内时完全零拷贝，跨月时只拷贝请求的部分。
+# 写入某个月份时生成新版本目录，最后原子替换 manifest，读者永远看到完整一致的数据。
+# 被替换的旧版本目录记入 manifest 的 retired 表，保留 RETIRE_SECONDS 之后才在后续写入时删除，
+# 在此之前打开的 IntradayStore 仍可按需映射旧 manifest 引用的分块；打开更久的实例应重新打开。
+# 写入与补抓在 data/.locks/ 下的跨进程文件锁内进行，并发写入者不会丢失彼此的分块或删掉对方的目录。
+
+INTRADAY_FREQS = tuple(INTRADAY_MINUTES)
+MANIFEST_FILE = "manifest.json"
+# 旧版本分块目录被替换后至少保留的秒数
+RETIRE_SECONDS = 24 * 3600
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+COLUMNS = ('time',) + PRICE_COLUMNS + ('volume',)
+COLUMN_DTYPES = {'time': np.int64, 'open': np.float32, 'high': np.float32, 'low': np.float32,
+                 'close': np.float32, 'volume': np.int64}
+
+
+def intraday_dir(market: str, symbol: str, freq: str) -> str:
+    if freq not in INTRADAY_FREQS:
+        raise ValueError(f"不支持的分钟线周期: {freq}，可选 {INTRADAY_FREQS}")
+    return os.path.join(data_loader.DATA_DIR, f"market={market}", f"symbol={symbol}", f"intraday_{freq}")
+
+
+def to_epoch(ts) -> int:
+    """时间 (字符串 / Timestamp) 转为存储使用的秒级时间戳"""
+    return int(np.datetime64(pd.Timestamp(ts).to_datetime64(), 's').astype(np.int64))
+
+
+def end_of(ts) -> pd.Timestamp:
+    """区间终点只给到日期时包含当天全部 K 线"""
+    ts = pd.Timestamp(ts)
+    return ts + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if ts == ts.normalize() else ts
+
+
+class Bars:
+    """
+    一段分钟线的列数组 (time / open / high / low / close / volume)。
+    从存储读取时各列通常是内存映射文件的只读视图，不要原地修改。
+    """
+    __slots__ = COLUMNS
+
+    def __init__(self, columns: dict):
+        for name in COLUMNS:
+            setattr(self, name, columns.get(name))
+
+    def __len__(self):
+        return 0 if self.time is None else len(self.time)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return getattr(self, name)
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        """time 列的 datetime64[s] 视图 (零拷贝)"""
+        return self.time.view('datetime64[s]')
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        转成与 app.py 图表数据同口径的英文字段 DataFrame。各列直接引用 Bars 的数组 (零拷贝)：
+        time 为 datetime64[s]，价格保持 float32，只读，追加新列不受影响。
+        """
+        data = {'time': self.datetimes}
+        for name in COLUMNS[1:]:
+            column = getattr(self, name)
+            if column is not None:
+                data[name] = column
+        return pd.DataFrame(data, copy=False)
+
+
+def _empty_columns(columns) -> dict:
+    return {c: np.empty(0, dtype=COLUMN_DTYPES[c]) for c in columns}
+
+
+def frame_to_columns(df: pd.DataFrame) -> dict:
+    """
+    把中文或英文字段的分钟线表转换成存储列：按时间排序，同一时间保留最后一条。
+    """
+    df = df.rename(columns=data_loader.CHART_COLUMNS)
+    missing = [c for c in COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"分钟线缺少字段: {missing}")
+    times = pd.to_datetime(df['time']).to_numpy().astype('datetime64[s]').astype(np.int64)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    keep = np.append(times[1:] != times[:-1], True)
+    idx = order[keep]
+    columns = {'time': times[keep]}
+    for name in COLUMNS[1:]:
+        columns[name] = df[name].to_numpy()[idx].astype(COLUMN_DTYPES[name])
+    return columns
+
+
+# --- 写入 ---
+
+def _read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"chunks": {}, "coverage": None}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(path: str, manifest: dict):
+    manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    tmp_path = data_loader.temp_path(manifest_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def _load_chunk(path: str, entry: dict, columns=COLUMNS, mmap: bool = True) -> dict:
+    chunk_dir = os.path.join(path, entry["dir"])
+    return {c: np.load(os.path.join(chunk_dir, f"{c}.npy"), mmap_mode="r" if mmap else None) for c in columns}
+
+
+def _merge_columns(old: dict, new: dict) -> dict:
+    """按时间合并两段列数据，同一时间以新数据为准"""
+    times = np.concatenate([old['time'], new['time']])
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    # 稳定排序下新数据排在相同时间的旧数据之后，保留每组最后一条
+    keep = order[np.append(times[1:] != times[:-1], True)]
+    return {c: np.concatenate([old[c], new[c]])[keep] for c in COLUMNS}
+
+
+def _intraday_lock(market: str, symbol: str, freq: str):
+    return data_loader.cache_lock(market, symbol, f"intraday_{freq}")
+
+
+def _remove_stale(path: str, manifest: dict, now: float = None):
+    """
+    清理旧版本目录 (调用方持有写锁)：退役超过 RETIRE_SECONDS 的目录删除，
+    既不在用也没有退役记录的目录是中断写入的残留，直接删除；删不掉的 (Windows 下仍被映射) 留到下次。
+    """
+    now = time.time() if now is None else now
+    live = {entry["dir"] for entry in manifest["chunks"].values()}
+    retired = manifest.setdefault("retired", {})
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if not os.path.isdir(full) or name in live:
+            continue
+        if name in retired and now - retired[name] < RETIRE_SECONDS:
+            continue
+        shutil.rmtree(full, ignore_errors=True)
+    manifest["retired"] = {name: at for name, at in retired.items() if os.path.isdir(os.path.join(path, name))}
+
+
+def write_intraday(market: str, symbol: str, freq: str, df: pd.DataFrame) -> int:
+    """
+    把一段分钟线合并进存储 (同一时间以新数据为准)，只重写涉及到的月份。
+    返回写入后存储的总行数。
+    """
+    with _intraday_lock(market, symbol, freq):
+        return _write_intraday(market, symbol, freq, df)
+
+
+@traced("intraday.write")
+def _write_intraday(market: str, symbol: str, freq: str, df: pd.DataFrame) -> int:
+    path = intraday_dir(market, symbol, freq)
+    os.makedirs(path, exist_ok=True)
+    manifest = _read_manifest(path)
+    chunks = manifest["chunks"]
+    if df.empty:
+        return sum(entry["rows"] for entry in chunks.values())
+
+    now = time.time()
+    retired = manifest.setdefault("retired", {})
+    new = frame_to_columns(df)
+    months = new['time'].view('datetime64[s]').astype('datetime64[M]')
+    bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(months)]):
+        key = str(months[lo]).replace("-", "")
+        part = {c: new[c][lo:hi] for c in COLUMNS}
+        if key in chunks:
+            part = _merge_columns(_load_chunk(path, chunks[key], mmap=False), part)
+            retired[chunks[key]["dir"]] = now
+        chunk_dir = f"{key}.{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.join(path, chunk_dir))
+        for c in COLUMNS:
+            np.save(os.path.join(path, chunk_dir, f"{c}.npy"), np.ascontiguousarray(part[c], dtype=COLUMN_DTYPES[c]))
+        chunks[key] = {"dir": chunk_dir, "rows": int(len(part['time'])),
+                       "start": int(part['time'][0]), "end": int(part['time'][-1])}
+
+    manifest["chunks"] = dict(sorted(chunks.items()))
+    _remove_stale(path, manifest, now)
+    _write_manifest(path, manifest)
+    rows = sum(entry["rows"] for entry in chunks.values())
+    annotate(rows=rows, delta_rows=len(new['time']), months=len(bounds) + 1)
+    return rows
+
+
+# --- 读取 ---
+
+class IntradayStore:
+    """
+    单个标的、单个周期的分钟线存储。打开时只读取 manifest，
+    各月份分块在第一次被请求时才做内存映射，并在实例内复用。
+    实例看到的是打开时的快照：之后的写入不可见，被替换的分块保留 RETIRE_SECONDS 供其继续映射。
+    """
+
+    def __init__(self, market: str, symbol: str, freq: str = "1min"):
+        self.market = market
+        self.symbol = symbol
+        self.freq = freq
+        self.path = intraday_dir(market, symbol, freq)
+        manifest = _read_manifest(self.path)
+        self.coverage = manifest.get("coverage")
+        self._entries = list(manifest["chunks"].values())
+        self._starts = np.array([e["start"] for e in self._entries], dtype=np.int64)
+        self._ends = np.array([e["end"] for e in self._entries], dtype=np.int64)
+        self._mapped = {}
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def rows(self) -> int:
+        return sum(e["rows"] for e in self._entries)
+
+    @property
+    def months(self) -> list:
+        return [e["dir"].split(".", 1)[0] for e in self._entries]
+
+    @property
+    def start(self):
+        return pd.Timestamp(int(self._starts[0]), unit="s") if self._entries else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(int(self._ends[-1]), unit="s") if self._entries else None
+
+    def _columns(self, i: int, columns) -> dict:
+        mapped = self._mapped.setdefault(i, {})
+        for c in columns:
+            if c not in mapped:
+                mapped[c] = np.load(os.path.join(self.path, self._entries[i]["dir"], f"{c}.npy"), mmap_mode="r")
+        return mapped
+
+    def iter_chunks(self, start=None, end=None, columns=COLUMNS):
+        """
+        按月份依次产出 [start, end] 内的 Bars (end 只给日期时包含当天)，每块都是内存映射的零拷贝视图，
+        适合逐块喂给流式指标，整段历史不必同时驻留内存。
+        """
+        columns = tuple(dict.fromkeys(('time',) + tuple(columns)))
+        lo = to_epoch(start) if start is not None else np.iinfo(np.int64).min
+        hi = to_epoch(end_of(end)) if end is not None else np.iinfo(np.int64).max
+        first = int(np.searchsorted(self._ends, lo, side='left'))
+        last = int(np.searchsorted(self._starts, hi, side='right'))
+        for i in range(first, last):
+            mapped = self._columns(i, columns)
+            times = mapped['time']
+            a = int(np.searchsorted(times, lo, side='left'))
+            b = int(np.searchsorted(times, hi, side='right'))
+            if b > a:
+                yield Bars({c: mapped[c][a:b] for c in columns})
+
+    def window(self, start=None, end=None, columns=COLUMNS) -> Bars:
+        """读取 [start, end] 内的分钟线；单月窗口零拷贝，跨月窗口只拼接请求的部分"""
+        columns = tuple(dict.fromkeys(('time',) + tuple(columns)))
+        with span("load.intraday", market=self.market, symbol=self.symbol, freq=self.freq) as sp:
+            parts = list(self.iter_chunks(start, end, columns))
+            if not parts:
+                bars = Bars(_empty_columns(columns))
+            elif len(parts) == 1:
+                bars = parts[0]
+            else:
+                bars = Bars({c: np.concatenate([p[c] for p in parts]) for c in columns})
+            if sp:
+                sp.set(rows=len(bars), chunks=len(parts), zero_copy=len(parts) <= 1)
+            return bars
+
+
+# --- 增量同步 ---
+
+def sync_intraday(market: str, symbol: str, freq: str, start, end, fetcher) -> bool:
+    """
+    确保分钟线存储覆盖 [start, end]，只补抓头部/尾部缺口。
+    fetcher(起始时间, 截止时间) 返回中文字段的分钟线；抛出异常视为抓取失败，覆盖区间不变。
+    返回空表说明缺口内没有 K 线 (周末、节假日，或早于数据源可回溯的范围)，覆盖区间照常推进，下次不再重抓。
+    分钟线不复权，补抓的数据直接合并，不需要校验复权基准。
+    整个过程持有写锁，拿到锁后才读取覆盖区间，等锁期间别人补齐的缺口不会重复抓取。
+    """
+    with _intraday_lock(market, symbol, freq):
+        return _sync_intraday(market, symbol, freq, start, end, fetcher)
+
+
+@traced("intraday.sync")
+def _sync_intraday(market: str, symbol: str, freq: str, start, end, fetcher) -> bool:
+    tag = f"{market}:{symbol}:{freq}"
+    path = intraday_dir(market, symbol, freq)
+    start, end = pd.Timestamp(start), end_of(end)
+    today = pd.Timestamp(datetime.now().date())
+    end = min(end, today + timedelta(days=1) - timedelta(seconds=1))
+    # 当天仍在交易，只把昨天及以前记为已确认覆盖
+    confirmed_end = min(end, today - timedelta(seconds=1))
+
+    coverage = _read_manifest(path).get("coverage")
+    # 每个缺口抓取成功后，覆盖区间推进到 (cov_start, cov_end)
+    if coverage is None:
+        cov_start = cov_end = None
+        gaps = [("全量", start, end, start, max(confirmed_end, start))]
+    else:
+        cov_start, cov_end = pd.Timestamp(coverage["start"]), pd.Timestamp(coverage["end"])
+        gaps = []
+        if start < cov_start:
+            gaps.append(("头部", start, cov_start, start, cov_end))
+        if end > cov_end:
+            gaps.append(("尾部", cov_end, end, cov_start, max(confirmed_end, cov_end)))
+
+    annotate(tag=tag, gaps=len(gaps))
+    ok, advanced = True, False
+    for label, gap_start, gap_end, new_start, new_end in gaps:
+        print(f"🌐 [{tag}] 分钟线{label}缺口 {gap_start} ~ {gap_end}，正在补抓...")
+        try:
+            df = fetcher(gap_start, gap_end)
+        except Exception as e:
+            print(f"⚠️ [{tag}] 分钟线补抓失败 ({type(e).__name__}: {e})，继续使用已有数据。")
+            ok = False
+            break
+        if df.empty:
+            print(f"ℹ️ [{tag}] 缺口内没有分钟线 (休市或超出数据源可回溯范围)，记为已覆盖。")
+        else:
+            rows = _write_intraday(market, symbol, freq, df)
+            print(f"✅ [{tag}] 补抓 {len(df)} 条，分钟线共 {rows} 条。")
+        # 头部缺口只推进起点、尾部缺口只推进终点 (前一个缺口已推进的一端保留)
+        cov_start = new_start if cov_start is None else min(cov_start, new_start)
+        cov_end = new_end if cov_end is None else max(cov_end, new_end)
+        advanced = True
+
+    if advanced:
+        manifest = _read_manifest(path)
+        manifest["coverage"] = {"start": cov_start.isoformat(), "end": cov_end.isoformat()}
+        _write_manifest(path, manifest)
+    return ok
+
+
+def store_version(market: str, symbol: str, freq: str):
+    """存储的版本标识 (manifest 修改时间, 大小)，每次写入都会变化；没有存储时返回 None"""
+    try:
+        st = os.stat(os.path.join(intraday_dir(market, symbol, freq), MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def get_intraday(market: str, symbol: str, start, end, freq: str = "1min", provider=None) -> Bars:
+    """
+    获取分钟线：先按需补抓缺口写入存储，再以内存映射方式读取 [start, end]。
+    provider 为空时使用该市场的默认数据源。
+    """
+    clean_symbol = data_loader.clean_symbol_for(market, symbol)
+    provider = provider or default_provider(market)
+
+    def fetcher(fetch_start: pd.Timestamp, fetch_end: pd.Timestamp) -> pd.DataFrame:
+        # 请求出错直接抛出，由 sync_intraday 记为失败；成功但没有数据 (休市) 返回空表
+        with span(f"fetch.{provider.name}", symbol=clean_symbol, freq=freq) as sp:
+            raw_df = provider.download_intraday(clean_symbol, fetch_start, fetch_end, freq)
+            if sp:
+                sp.set(rows=len(raw_df))
+        if raw_df.empty:
+            return pd.DataFrame()
+        return normalize_frame(provider.shape, raw_df)
+
+    try:
+        sync_intraday(market, clean_symbol, freq, start, end, fetcher)
+    except Exception as e:
+        print(f"❌ ERROR: [{market}:{clean_symbol}] 同步分钟线时发生错误：{e}")
+    return IntradayStore(market, clean_symbol, freq).window(start, end)
@@ -0,0 +1,212 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import get_catalog, daily_file_path, cached_symbols
+from utils.signals import dual_ma_signal, macd_rsi_signal
+
+# --- 多标的组合回测引擎 (Cross-sectional Portfolio Backtest) ---
+# 把整个股票池的缓存一次性读成 (交易日 × 标的) 的对齐矩阵，
+# 所有标的的指标、信号与收益在同一组矩阵运算中完成，不再逐个标的循环跑单标的回测。
+#
+# 不同标的交易日历不同 (A股/美股混合、停牌)，为保证与单标的回测逐位一致，
+# 每个标的的数据先被“压紧”到自己的交易日序列上计算指标与信号，再还原回统一日历。
+
+PRICE_FIELDS = {'close': '收盘', 'open': '开盘', 'high': '最高', 'low': '最低', 'volume': '成交量'}
+
+
+@dataclass
+class Panel:
+    """对齐后的行情面板：dates × symbols，缺失 (未上市/停牌/休市/退市) 为 NaN"""
+    dates: pd.DatetimeIndex
+    symbols: list
+    fields: dict
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.fields['close']
+
+
+@dataclass
+class PortfolioResult:
+    nav: pd.DataFrame           # 每日组合净值、基准净值、换手率、持仓数量
+    contribution: pd.DataFrame  # 每个标的对组合收益的贡献
+    summary: dict               # 汇总绩效指标
+
+
+def cached_universe(market: str) -> list:
+    """某个市场下全部已缓存标的，格式为 [(market, symbol), ...]"""
+    return [(market, s) for s in cached_symbols(market)]
+
+
+def load_panel(universe: list, start_date: str, end_date: str, fields=('close',)) -> Panel:
+    """
+    一条 DuckDB 查询读取整个股票池的缓存，并散列到 (交易日 × 标的) 矩阵。
+    universe 为 [(market, symbol), ...]，列标签形如 "A:600519"。
+    """
+    universe = [(m, s) for m, s in universe if _has_cache(m, s)]
+    if not universe:
+        return Panel(pd.DatetimeIndex([]), [], {f: np.empty((0, 0)) for f in fields})
+
+    mapping = pd.DataFrame({
+        'market': [m for m, _ in universe],
+        'symbol': [s for _, s in universe],
+        'col': np.arange(len(universe), dtype=np.int32),
+    })
+    files = [daily_file_path(m, s) for m, s in universe]
+    select = ", ".join(f'd."{PRICE_FIELDS[f]}" AS {f}' for f in fields)
+
+    conn = get_catalog()
+    conn.register("panel_universe", mapping)
+    try:
+        raw = conn.execute(
+            f"""
+            SELECT u.col, d.日期 AS date, {select}
+            FROM read_parquet(?, hive_partitioning=true, union_by_name=true,
+                              hive_types={{'market': VARCHAR, 'symbol': VARCHAR}}) d
+            JOIN panel_universe u USING (market, symbol)
+            WHERE d.日期 BETWEEN ? AND ?
+            """,
+            [files, pd.Timestamp(start_date), pd.Timestamp(end_date)]
+        ).fetchnumpy()
+    finally:
+        conn.unregister("panel_universe")
+
+    dates, row = np.unique(raw['date'], return_inverse=True)
+    col = np.asarray(raw['col'])
+    matrices = {}
+    for f in fields:
+        matrix = np.full((len(dates), len(universe)), np.nan)
+        matrix[row, col] = np.asarray(raw[f], dtype=np.float64)
+        matrices[f] = matrix
+    return Panel(pd.DatetimeIndex(dates), [f"{m}:{s}" for m, s in universe], matrices)
+
+
+def _has_cache(market: str, symbol: str) -> bool:
+    return os.path.exists(daily_file_path(market, symbol))
+
+
+# --- 交易日压紧 / 还原 ---
+
+def _pack(values: np.ndarray):
+    """把每列的有效值稳定地移到列首，返回 (压紧矩阵, 排列索引, 有效掩码)"""
+    valid = ~np.isnan(values)
+    order = np.argsort(~valid, axis=0, kind='stable')
+    return np.take_along_axis(values, order, axis=0), order, valid
+
+
+def _unpack(packed: np.ndarray, order: np.ndarray, valid: np.ndarray, fill) -> np.ndarray:
+    out = np.empty(packed.shape, dtype=packed.dtype)
+    np.put_along_axis(out, order, packed, axis=0)
+    out[~valid] = fill
+    return out
+
+
+def _ffill_columns(values: np.ndarray, valid: np.ndarray, fill) -> np.ndarray:
+    """沿时间轴前向填充无效位置，首个有效值之前用 fill"""
+    steps = np.arange(values.shape[0])[:, None]
+    last = np.where(valid, steps, -1)
+    np.maximum.accumulate(last, axis=0, out=last)
+    filled = np.take_along_axis(values, np.maximum(last, 0), axis=0)
+    return np.where(last >= 0, filled, fill)
+
+
+def _strategy_positions(packed_close: np.ndarray, strategy: str, params: dict) -> np.ndarray:
+    """在压紧后的收盘价矩阵 (交易日 × 标的) 上计算目标持仓 (未延后)"""
+    close = pd.DataFrame(packed_close)
+    if strategy == 'dual_ma':
+        ma_short = close.rolling(window=params['ma_short']).mean().to_numpy()
+        ma_long = close.rolling(window=params['ma_long']).mean().to_numpy()
+        return dual_ma_signal(ma_short.T, ma_long.T).T
+    if strategy == 'macd_rsi':
+        signal_period = params.get('signal_period', 9)
+        dif = (close.ewm(span=params['macd_fast'], adjust=False).mean()
+               - close.ewm(span=params['macd_slow'], adjust=False).mean())
+        dea = dif.ewm(span=signal_period, adjust=False).mean()
+        delta = close.diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=params['rsi_period']).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=params['rsi_period']).mean()
+        rsi_values = (100 - (100 / (1 + gain / loss))).to_numpy()
+        return macd_rsi_signal(dif.to_numpy().T, dea.to_numpy().T, rsi_values.T, params['rsi_overbought']).T
+    raise ValueError(f"未知策略: {strategy}")
+
+
+def run_portfolio_backtest(panel: Panel, strategy: str, params: dict, allocation: str = 'equal',
+                           fee_rate: float = 0.0) -> PortfolioResult:
+    """
+    组合回测。
+    strategy: 'dual_ma' (参数 ma_short, ma_long) 或 'macd_rsi'
+              (参数 macd_fast, macd_slow, rsi_period, rsi_overbought，与 app.py 滑块同名)
+    allocation:
+        'equal'  — 每个在市标的固定分配 1/N 资金，出现持仓信号时满仓该份额，否则该份额持有现金
+        'signal' — 资金在当天所有持仓信号之间等权分配，有信号即满仓
+    fee_rate: 按成交金额 (权重变化绝对值) 收取的单边费率
+    """
+    packed, order, valid = _pack(panel.close)
+
+    # 与单标的流水线一致：信号延后 1 个交易日成交，日收益为相邻交易日收盘价涨跌幅
+    target = _strategy_positions(packed, strategy, params)
+    packed_valid = ~np.isnan(packed)
+    pos_packed = np.zeros(packed.shape)
+    pos_packed[1:] = target[:-1]
+    pos_packed[~packed_valid] = 0
+    ret_packed = np.zeros(packed.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret_packed[1:] = packed[1:] / packed[:-1] - 1
+    ret_packed[~packed_valid] = 0
+
+    ret = _unpack(ret_packed, order, valid, 0.0)
+    # 在市区间：首个有效交易日到最后一个有效交易日 (之后再无行情视为退市或数据中断)
+    listed = np.maximum.accumulate(valid, axis=0) & np.maximum.accumulate(valid[::-1], axis=0)[::-1]
+    # 在市期间的停牌/休市日沿用最近一个交易日的持仓 (资金仍被占用)，当天收益为 0；
+    # 最后一个交易日之后清仓，该标的也不再计入 N
+    pos = np.where(listed, _ffill_columns(_unpack(pos_packed, order, valid, 0.0), valid, 0.0), 0.0)
+
+    if allocation == 'equal':
+        n_listed = np.maximum(listed.sum(axis=1, keepdims=True), 1)
+        weights = pos / n_listed
+        bench_weights = listed / n_listed
+    elif allocation == 'signal':
+        weights = pos / np.maximum(pos.sum(axis=1, keepdims=True), 1)
+        bench_weights = listed / np.maximum(listed.sum(axis=1, keepdims=True), 1)
+    else:
+        raise ValueError(f"未知资金分配方式: {allocation}")
+
+    contrib = weights * ret
+    trades = np.abs(np.diff(weights, axis=0, prepend=0.0)).sum(axis=1)
+    port_ret = contrib.sum(axis=1) - trades * fee_rate
+    bench_ret = (bench_weights * ret).sum(axis=1)
+
+    nav = pd.DataFrame({
+        'time': panel.dates,
+        'nav': np.cumprod(1 + port_ret),
+        'benchmark_nav': np.cumprod(1 + bench_ret),
+        'daily_return': port_ret,
+        'turnover': trades / 2,
+        'holdings': (pos > 0).sum(axis=1),
+    })
+
+    strat_ret = pos * ret
+    holding_days = (pos_packed > 0).sum(axis=0)
+    contribution = pd.DataFrame({
+        'symbol': panel.symbols,
+        'contribution': contrib.sum(axis=0) * 100,
+        'strategy_return': (np.prod(1 + strat_ret, axis=0) - 1) * 100,
+        'holding_days': holding_days,
+        'win_rate': np.divide(((pos_packed > 0) & (ret_packed > 0)).sum(axis=0) * 100, holding_days,
+                              out=np.zeros(len(panel.symbols)), where=holding_days > 0),
+    }).sort_values('contribution', ascending=False, kind='stable').reset_index(drop=True)
+
+    n_days = len(panel.dates)
+    summary = {
+        'total_return': float((nav['nav'].iloc[-1] - 1) * 100) if n_days else 0.0,
+        'benchmark_return': float((nav['benchmark_nav'].iloc[-1] - 1) * 100) if n_days else 0.0,
+        'max_drawdown': float((1 - nav['nav'] / nav['nav'].cummax()).max() * 100) if n_days else 0.0,
+        'avg_turnover': float(nav['turnover'].mean()) if n_days else 0.0,
+        'avg_holdings': float(nav['holdings'].mean()) if n_days else 0.0,
+        'symbols': len(panel.symbols),
+        'days': n_days,
+    }
+    return PortfolioResult(nav=nav, contribution=contribution, summary=summary)
@@ -0,0 +1,211 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from utils.data_loader import DATA_DIR, clean_symbol_for, sync_daily, daily_file_path
+from utils.providers import normalize_frame
+
+# --- 批量预取引擎 (Bulk Prefetch) ---
+# 有界线程池并发下载整个股票池，每个数据源一个令牌桶限流，失败按指数退避 + 随机抖动重试。
+# 每完成一个标的就向进度文件追加一行 JSON，中断后可用 resume 跳过已完成的标的。
+# 任务身份只含市场、数据源与起始日：截止日默认取“今天”，跨过午夜重启时，
+# 已同步到前一天及以后的标的仍视为完成，不会整池重新补抓。
+
+# 各数据源默认限速 (每秒请求数, 突发容量)
+DEFAULT_RATES = {
+    "akshare": (2.0, 4),
+    "yfinance": (5.0, 10),
+    "stub": (200.0, 200),
+}
+DEFAULT_STATE_FILE = os.path.join(DATA_DIR, "prefetch_state.jsonl")
+
+
+class TokenBucket:
+    """线程安全的令牌桶：rate 为每秒补充的令牌数，capacity 为允许的突发请求数"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float = None, capacity: int = None):
+        """调整限速，已积攒的令牌不超过新的突发容量"""
+        with self._lock:
+            if rate:
+                self.rate = rate
+            if capacity:
+                self.capacity = capacity
+                self._tokens = min(self._tokens, float(capacity))
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider_name: str, rate: float = None, capacity: int = None) -> TokenBucket:
+    """
+    同一个数据源在进程内共用一个令牌桶，多个预取任务也不会叠加超限。
+    显式传入的 rate / capacity 会更新已有的令牌桶，以最近一次的配置为准。
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(provider_name)
+        if bucket is None:
+            default_rate, default_capacity = DEFAULT_RATES.get(provider_name, (1.0, 1))
+            bucket = TokenBucket(rate or default_rate, capacity or default_capacity)
+            _buckets[provider_name] = bucket
+        elif rate or capacity:
+            bucket.configure(rate, capacity)
+        return bucket
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """指数退避 + 全抖动：在 [0, min(cap, base * 2^attempt)] 内均匀取值，避免重试同时扎堆"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def make_fetcher(provider, symbol: str, bucket: TokenBucket, retries: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 60.0, counters: dict = None):
+    """包装数据源：每次请求先取令牌，失败按退避重试，最终失败抛出最后一次异常"""
+    def fetcher(fetch_start: pd.Timestamp, fetch_end: pd.Timestamp) -> pd.DataFrame:
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            try:
+                if counters is not None:
+                    counters['requests'] += 1
+                raw_df = provider.download(symbol, fetch_start, fetch_end)
+                return normalize_frame(provider.shape, raw_df)
+            except Exception:
+                if attempt == retries:
+                    raise
+                if counters is not None:
+                    counters['retries'] += 1
+                time.sleep(backoff_delay(attempt, base_delay, max_delay))
+    return fetcher
+
+
+def read_symbol_file(path: str) -> list:
+    """读取代码清单：每行一个代码，支持逗号分隔与 # 注释"""
+    symbols = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            symbols.extend(s.strip() for s in line.split(",") if s.strip())
+    return symbols
+
+
+def load_finished(state_file: str, job: dict, end_date: str) -> set:
+    """
+    读取进度文件中同一任务 (市场/数据源/起始日一致) 已成功的代码。
+    记录的截止日不早于 end_date 的前一天即视为完成 (当天的 K 线留给下一次预取)。
+    """
+    threshold = pd.Timestamp(end_date) - pd.Timedelta(days=1)
+    finished = set()
+    if not os.path.exists(state_file):
+        return finished
+    with open(state_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程被强杀时最后一行可能写了一半
+                continue
+            if (record.get("job") == job and record.get("status") == "ok" and record.get("end")
+                    and pd.Timestamp(record["end"]) >= threshold):
+                finished.add(record["symbol"])
+    return finished
+
+
+def prefetch_universe(symbols: list, market: str, provider, start_date: str, end_date: str,
+                      workers: int = 8, rate: float = None, burst: int = None, retries: int = 4,
+                      base_delay: float = 1.0, max_delay: float = 60.0,
+                      state_file: str = DEFAULT_STATE_FILE, resume: bool = True, progress=None) -> dict:
+    """
+    并发预取一批标的到本地缓存，返回汇总报告。
+    每个标的走与看盘相同的增量同步逻辑 (只补抓缺口)，因此重复执行的代价很低。
+    progress(done, total, record) 为可选的进度回调。
+    """
+    started = time.monotonic()
+    job = {"market": market, "provider": provider.name, "start": start_date}
+    bucket = get_bucket(provider.name, rate, burst)
+
+    symbols = list(dict.fromkeys(clean_symbol_for(market, s) for s in symbols))
+    finished = load_finished(state_file, job, end_date) if resume else set()
+    pending = [s for s in symbols if s not in finished]
+
+    counters = {'requests': 0, 'retries': 0}
+    counters_lock = threading.Lock()
+    state_lock = threading.Lock()
+    results = []
+    os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+
+    def work(symbol: str) -> dict:
+        local = {'requests': 0, 'retries': 0}
+        fetcher = make_fetcher(provider, symbol, bucket, retries, base_delay, max_delay, local)
+        t0 = time.monotonic()
+        try:
+            ok = sync_daily(market, symbol, start_date, end_date, fetcher)
+            status, error = ("ok", None) if ok else ("empty", "数据源未返回数据")
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        with counters_lock:
+            counters['requests'] += local['requests']
+            counters['retries'] += local['retries']
+        return {
+            "job": job,
+            "symbol": symbol,
+            "end": end_date,
+            "status": status,
+            "error": error,
+            "requests": local['requests'],
+            "seconds": round(time.monotonic() - t0, 3),
+            "bytes": os.path.getsize(daily_file_path(market, symbol)) if status == "ok" else 0,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    with open(state_file, "a", encoding="utf-8") as state, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work, s) for s in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            results.append(record)
+            with state_lock:
+                state.write(json.dumps(record, ensure_ascii=False) + "\n")
+                state.flush()
+            if progress is not None:
+                progress(len(results), len(pending), record)
+
+    elapsed = time.monotonic() - started
+    by_status = {k: [r for r in results if r["status"] == k] for k in ("ok", "empty", "failed")}
+    return {
+        "job": {**job, "end": end_date},
+        "total": len(symbols),
+        "skipped": len(symbols) - len(pending),
+        "ok": len(by_status["ok"]),
+        "empty": len(by_status["empty"]),
+        "failed": len(by_status["failed"]),
+        "requests": counters['requests'],
+        "retries": counters['retries'],
+        "bytes": sum(r["bytes"] for r in by_status["ok"]),
+        "elapsed_seconds": round(elapsed, 3),
+        "symbols_per_second": round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        "failures": {r["symbol"]: r["error"] for r in by_status["failed"] + by_status["empty"]},
+    }
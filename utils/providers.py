@@ -0,0 +1,192 @@
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.synthetic import synthetic_daily_range, synthetic_intraday_range
+
+# --- 行情数据源 (Provider) ---
+# 每个数据源只负责“发一次请求、拿回原始表”，失败直接抛异常，重试与限流由调用方决定。
+# normalize_frame 把各数据源的原始表统一成缓存使用的中文字段格式。
+# 网络库在真正发请求时才导入，使用桩数据源时无需安装 akshare / yfinance。
+# 分钟线 (download_intraday) 一律取不复权价格，时间为交易所当地时间。
+
+# 支持的分钟线周期及其对应的分钟数
+INTRADAY_MINUTES = {"1min": 1, "5min": 5}
+
+
+class AkShareProvider:
+    """A 股：AkShare 东方财富前复权日线"""
+    name = "akshare"
+    market = "A"
+    shape = "akshare"
+
+    def download(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        import akshare as ak
+        return ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=start.strftime("%Y%m%d"),
+                                  end_date=end.strftime("%Y%m%d"), adjust="qfq")
+
+    def download_intraday(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, freq: str) -> pd.DataFrame:
+        import akshare as ak
+        return ak.stock_zh_a_hist_min_em(symbol=symbol, start_date=start.strftime("%Y-%m-%d %H:%M:%S"),
+                                         end_date=end.strftime("%Y-%m-%d %H:%M:%S"),
+                                         period=str(INTRADAY_MINUTES[freq]), adjust="")
+
+
+class YFinanceProvider:
+    """美股：yfinance 日线"""
+    name = "yfinance"
+    market = "US"
+    shape = "yfinance"
+
+    def download(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        import yfinance as yf
+        # yfinance 的 end 为开区间，需要顺延一天
+        return yf.download(symbol, start=start.strftime("%Y-%m-%d"),
+                           end=(end + pd.Timedelta(days=1)).strftime("%Y-%m-%d"), progress=False)
+
+    def download_intraday(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, freq: str) -> pd.DataFrame:
+        import yfinance as yf
+        raw_df = yf.download(symbol, start=start.strftime("%Y-%m-%d"),
+                             end=(end.normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+                             interval=f"{INTRADAY_MINUTES[freq]}m", auto_adjust=False, progress=False)
+        # 分钟线带纽约时区，转成交易所当地时间后再去掉时区
+        if isinstance(raw_df.index, pd.DatetimeIndex) and raw_df.index.tz is not None:
+            raw_df.index = raw_df.index.tz_convert("America/New_York").tz_localize(None)
+        return raw_df
+
+
+class StubProvider:
+    """
+    本地桩数据源：返回与 AkShare / yfinance 原始结构一致的合成数据，用于离线联调与压测。
+    latency 模拟单次请求耗时 (秒)，failure_rate 为随机抛出连接错误的概率。
+    """
+    name = "stub"
+
+    def __init__(self, market: str = "A", latency: float = 0.0, failure_rate: float = 0.0, seed: int = None):
+        self.market = market
+        self.shape = "akshare" if market == "A" else "yfinance"
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def download(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._rng.random() < self.failure_rate:
+            raise ConnectionError(f"stub provider: simulated connection reset for {symbol}")
+
+        df = synthetic_daily_range(symbol, start, end)
+        if self.shape == "akshare":
+            # AkShare：中文列名，日期为 date 对象，附带成交额/振幅等衍生字段
+            out = pd.DataFrame({
+                '日期': df['日期'].dt.date,
+                '股票代码': symbol,
+                '开盘': df['开盘'].round(2),
+                '收盘': df['收盘'].round(2),
+                '最高': df['最高'].round(2),
+                '最低': df['最低'].round(2),
+                '成交量': df['成交量'],
+                '成交额': (df['成交量'] * df['收盘']).round(2),
+                '振幅': ((df['最高'] - df['最低']) / df['收盘'] * 100).round(2),
+                '涨跌幅': (df['收盘'].pct_change().fillna(0) * 100).round(2),
+                '涨跌额': df['收盘'].diff().fillna(0).round(2),
+                '换手率': np.round(df['成交量'] / 1e6, 2),
+            })
+            return out
+
+        # yfinance：以 Date 为索引，(Price, Ticker) 两级列名
+        out = pd.DataFrame({
+            'Close': df['收盘'].to_numpy(),
+            'High': df['最高'].to_numpy(),
+            'Low': df['最低'].to_numpy(),
+            'Open': df['开盘'].to_numpy(),
+            'Volume': df['成交量'].to_numpy(),
+        }, index=pd.DatetimeIndex(df['日期'], name='Date'))
+        out.columns = pd.MultiIndex.from_product([out.columns, [symbol]], names=['Price', 'Ticker'])
+        return out
+
+    def download_intraday(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, freq: str) -> pd.DataFrame:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._rng.random() < self.failure_rate:
+            raise ConnectionError(f"stub provider: simulated connection reset for {symbol}")
+
+        df = synthetic_intraday_range(symbol, start, end, INTRADAY_MINUTES[freq], self.market)
+        if self.shape == "akshare":
+            # AkShare 分钟线：时间列为 "YYYY-MM-DD HH:MM:SS" 字符串
+            return pd.DataFrame({
+                '时间': df['日期'].dt.strftime("%Y-%m-%d %H:%M:%S"),
+                '开盘': df['开盘'].round(2),
+                '收盘': df['收盘'].round(2),
+                '最高': df['最高'].round(2),
+                '最低': df['最低'].round(2),
+                '成交量': df['成交量'],
+                '成交额': (df['成交量'] * df['收盘']).round(2),
+            })
+        out = pd.DataFrame({
+            'Close': df['收盘'].to_numpy(),
+            'High': df['最高'].to_numpy(),
+            'Low': df['最低'].to_numpy(),
+            'Open': df['开盘'].to_numpy(),
+            'Volume': df['成交量'].to_numpy(),
+        }, index=pd.DatetimeIndex(df['日期'], name='Datetime'))
+        out.columns = pd.MultiIndex.from_product([out.columns, [symbol]], names=['Price', 'Ticker'])
+        return out
+
+
+PROVIDERS = {
+    "akshare": AkShareProvider,
+    "yfinance": YFinanceProvider,
+    "stub": StubProvider,
+}
+
+
+def default_provider(market: str):
+    return AkShareProvider() if market == "A" else YFinanceProvider()
+
+
+def normalize_frame(shape: str, raw_df: pd.DataFrame) -> pd.DataFrame:
+    """将数据源原始表整理为缓存统一格式 (中文字段、无时区的日期)"""
+    if raw_df.empty:
+        return pd.DataFrame()
+
+    if shape == "akshare":
+        # 分钟线接口的时间列名为“时间”
+        df = raw_df.rename(columns={'时间': '日期'})
+        df['日期'] = pd.to_datetime(df['日期'])
+        return df
+
+    # 清洗列名：将多级表头拍平，只保留第一个级别
+    if isinstance(raw_df.columns, pd.MultiIndex):
+        raw_df = raw_df.copy()
+        raw_df.columns = raw_df.columns.get_level_values(0)
+
+    raw_df = raw_df.reset_index()
+
+    # 将 yfinance 的英文标准列名映射成咱们约定的中文统一格式
+    rename_map = {
+        'Date': '日期',
+        'Datetime': '日期',
+        'Open': '开盘',
+        'High': '最高',
+        'Low': '最低',
+        'Close': '收盘',
+        'Volume': '成交量'
+    }
+    df = raw_df.rename(columns=rename_map)
+
+    # 仅保留核心列
+    cols_to_keep = ['日期', '开盘', '最高', '最低', '收盘', '成交量']
+    # 兜底：如果某些数据少列
+    cols_exist = [c for c in cols_to_keep if c in df.columns]
+    df = df[cols_exist].copy()
+
+    # 去除时区信息以便跨平台存入 Parquet
+    if df['日期'].dt.tz is not None:
+        df['日期'] = df['日期'].dt.tz_localize(None)
+    return df
@@ -0,0 +1,199 @@
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+import utils.data_loader as data_loader
+from utils.providers import INTRADAY_MINUTES
+from utils.tracing import annotate, traced
+
+# --- 多周期 K 线 (周线 / 月线 / 自定义 N 日线) ---
+# 由日线缓存用 DuckDB 聚合，物化为同一分区目录下的 Parquet (weekly.parquet / monthly.parquet / <N>d.parquet)，
+# 旁边的 .meta.json 记录来源日线文件的版本与最后一根 (可能尚未走完的) K 线从哪一天开始。
+# 日线文件变化后只重算最后一根 K 线所在的区间并替换尾部；若历史起点、锚点收盘价 (复权基准) 或之前的行数变化，
+# 说明日线被整段重写，改为全量重建。切换到高周期时直接读几百行物化结果，不再逐次从数千行日线重新聚合。
+# 每根 K 线的日期记为区间内最后一个交易日 (即该 K 线收盘的那天)，信号延后 1 根成交时不会用到未来数据。
+# 自定义 N 日线按交易日计数，从缓存中第一根日线起每 N 根合为一根，同一缓存的分桶在每次请求间保持不变。
+# 1min / 5min 分钟线不经过日线聚合，直接读 utils/intraday.py 的内存映射列式存储。
+
+# 内置周期：代码 -> (显示名, 物化文件名)
+TIMEFRAMES = {
+    'D': ("日线", data_loader.DAILY_FILE),
+    'W': ("周线", "weekly.parquet"),
+    'M': ("月线", "monthly.parquet"),
+}
+# 自定义 N 日线允许的范围
+MIN_DAYS, MAX_DAYS = 2, 250
+
+
+def normalize_timeframe(timeframe: str) -> str:
+    """统一周期代码：'D' / 'W' / 'M'、'<N>D' (N 个交易日) 或分钟线 '1min' / '5min'，'1D' 视为日线"""
+    tf = str(timeframe).strip().upper()
+    if tf in TIMEFRAMES:
+        return tf
+    if tf.lower() in INTRADAY_MINUTES:
+        return tf.lower()
+    if tf.endswith("D") and tf[:-1].isdigit():
+        n = int(tf[:-1])
+        if n == 1:
+            return 'D'
+        if MIN_DAYS <= n <= MAX_DAYS:
+            return f"{n}D"
+    raise ValueError(f"不支持的 K 线周期: {timeframe}，可选 D / W / M、{MIN_DAYS}~{MAX_DAYS} 的 <N>D "
+                     f"或分钟线 {' / '.join(INTRADAY_MINUTES)}")
+
+
+def is_intraday(timeframe: str) -> bool:
+    return normalize_timeframe(timeframe) in INTRADAY_MINUTES
+
+
+def timeframe_label(timeframe: str) -> str:
+    tf = normalize_timeframe(timeframe)
+    if tf in INTRADAY_MINUTES:
+        return f"{INTRADAY_MINUTES[tf]}分钟线"
+    return TIMEFRAMES[tf][0] if tf in TIMEFRAMES else f"{tf[:-1]}日线"
+
+
+def bar_file_path(market: str, symbol: str, timeframe: str = 'D') -> str:
+    """某个标的某个周期的 K 线文件路径 (代码需已清洗)，日线即原始缓存文件；分钟线不对应单个文件"""
+    tf = normalize_timeframe(timeframe)
+    if tf in INTRADAY_MINUTES:
+        raise ValueError(f"分钟线 ({tf}) 存放在 utils/intraday.py 的列式存储中，没有单个 K 线文件")
+    name = TIMEFRAMES[tf][1] if tf in TIMEFRAMES else f"{tf.lower()}.parquet"
+    return os.path.join(os.path.dirname(data_loader.daily_file_path(market, symbol)), name)
+
+
+def _version(path: str):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _bucket_sql(tf: str, offset: int) -> str:
+    """日线所属的聚合分桶表达式；N 日线的行号从 offset (之前已分桶的日线数) 起算"""
+    if tf == 'W':
+        return "date_trunc('week', 日期)"
+    if tf == 'M':
+        return "date_trunc('month', 日期)"
+    return f"(row_number() OVER (ORDER BY 日期) - 1 + {offset}) // {int(tf[:-1])}"
+
+
+def _aggregate_sql(tf: str, offset: int = 0, tail: bool = False) -> str:
+    """聚合 read_parquet(?) 中的日线 (tail 为真时只取 日期 >= ? 的部分)，每桶一根 K 线 (附带起始日与包含的交易日数)"""
+    return f"""
+        SELECT max(日期) AS 日期, min(日期) AS 起始日, arg_min(开盘, 日期) AS 开盘, max(最高) AS 最高,
+               min(最低) AS 最低, arg_max(收盘, 日期) AS 收盘, sum(成交量) AS 成交量, count(*) AS 交易日数
+        FROM (
+            SELECT 日期, 开盘, 最高, 最低, 收盘, 成交量, {_bucket_sql(tf, offset)} AS bucket
+            FROM read_parquet(?, hive_partitioning=false) {"WHERE 日期 >= ?" if tail else ""}
+        )
+        GROUP BY bucket
+    """
+
+
+def _tail_state(conn, daily_path: str, tail_start) -> tuple:
+    """日线缓存的 (首个交易日, tail_start 之前的行数, tail_start 当天收盘价)"""
+    return conn.execute(
+        "SELECT min(日期), count(*) FILTER (WHERE 日期 < ?), max(收盘) FILTER (WHERE 日期 = ?) "
+        "FROM read_parquet(?, hive_partitioning=false)",
+        [tail_start, tail_start, daily_path]
+    ).fetchone()
+
+
+def _read_meta(meta_path: str):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(meta_path: str, meta: dict):
+    tmp_path = data_loader.temp_path(meta_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def materialize(market: str, symbol: str, timeframe: str):
+    """
+    确保某个周期的物化 K 线与日线缓存一致，返回文件路径；没有日线缓存时返回 None。
+    日线版本未变时只读一次元数据文件，不加锁。
+    """
+    tf = normalize_timeframe(timeframe)
+    daily_path = data_loader.daily_file_path(market, symbol)
+    if tf == 'D':
+        return daily_path if os.path.exists(daily_path) else None
+    if not os.path.exists(daily_path):
+        return None
+    path = bar_file_path(market, symbol, tf)
+    meta_path = path.replace(".parquet", ".meta.json")
+    if _fresh(path, meta_path, daily_path):
+        return path
+    # 重建在跨进程文件锁内进行，拿到锁后再确认一次，等锁期间别人已经刷新过就直接返回
+    with data_loader.cache_lock(market, symbol, tf):
+        if not _fresh(path, meta_path, daily_path):
+            _rebuild(market, symbol, tf, daily_path, path, meta_path, _read_meta(meta_path), _version(daily_path))
+    return path
+
+
+def _fresh(path: str, meta_path: str, daily_path: str) -> bool:
+    meta = _read_meta(meta_path)
+    return meta is not None and meta['source_version'] == _version(daily_path) and os.path.exists(path)
+
+
+@traced("resample.materialize")
+def _rebuild(market, symbol, tf, daily_path, path, meta_path, meta, version):
+    conn = data_loader._conn()
+    tail = None
+    if meta is not None and os.path.exists(path):
+        # 尾部 K 线之前的日线必须原封不动：起点、行数与尾部起始日的收盘价 (复权基准) 都没有变化
+        first_day, before, anchor = _tail_state(conn, daily_path, pd.Timestamp(meta['tail_start']))
+        if (first_day is not None and pd.Timestamp(first_day) == pd.Timestamp(meta['first_day'])
+                and before == meta['tail_offset'] and anchor is not None
+                and abs(anchor - meta['tail_close']) <= 1e-9 * max(1.0, abs(anchor))):
+            tail = pd.Timestamp(meta['tail_start'])
+
+    tmp_path = data_loader.temp_path(path)
+    if tail is None:
+        annotate(market=market, symbol=symbol, timeframe=tf, mode="full")
+        source, params = _aggregate_sql(tf), [daily_path]
+    else:
+        # 只重算尾部 K 线起始日之后的日线，之前已走完的 K 线原样保留
+        annotate(market=market, symbol=symbol, timeframe=tf, mode="tail")
+        source = f"""
+            SELECT * FROM read_parquet('{path}', hive_partitioning=false) WHERE 日期 < ?
+            UNION ALL BY NAME
+            {_aggregate_sql(tf, meta['tail_offset'], tail=True)}
+        """
+        params = [tail, daily_path, tail]
+    conn.execute(f"COPY ({source} ORDER BY 日期) TO '{tmp_path}' (FORMAT PARQUET)", params)
+
+    # 新的尾部 K 线：记录起始日、之前的日线行数与起始日收盘价，供下次增量更新校验
+    rows, tail_start = conn.execute(
+        "SELECT count(*), arg_max(起始日, 日期) FROM read_parquet(?, hive_partitioning=false)", [tmp_path]
+    ).fetchone()
+    first_day, before, anchor = _tail_state(conn, daily_path, tail_start)
+    os.replace(tmp_path, path)
+    _write_meta(path.replace(".parquet", ".meta.json"), {
+        "timeframe": tf,
+        "source_version": version,
+        "first_day": pd.Timestamp(first_day).strftime("%Y-%m-%d"),
+        "tail_start": pd.Timestamp(tail_start).strftime("%Y-%m-%d"),
+        "tail_offset": int(before),
+        "tail_close": float(anchor),
+        "rows": int(rows),
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    annotate(rows=int(rows), file_bytes=os.path.getsize(path))
+
+
+def read_bars(market: str, symbol: str, timeframe: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """读取某个周期 [start_date, end_date] 内的 K 线 (中文字段，与 read_daily 同口径)，必要时先物化"""
+    path = materialize(market, symbol, timeframe)
+    if path is None:
+        return pd.DataFrame()
+    select = ", ".join(f'"{c}"' for c in data_loader.OHLCV_COLUMNS)
+    return data_loader._conn().execute(
+        f"SELECT {select} FROM read_parquet(?, hive_partitioning=false) WHERE 日期 BETWEEN ? AND ? ORDER BY 日期",
+        [path, pd.Timestamp(start_date), pd.Timestamp(end_date)]
+    ).df()
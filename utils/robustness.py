@@ -0,0 +1,331 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# --- 稳健性检验 (Monte Carlo / Bootstrap Significance) ---
+# 回测跑赢基准，可能只是运气。这里基于回测流水线已有的 Strategy_Return / Daily_Return / Signal，
+# 批量生成上万条重采样路径，给出收益、回撤、胜率的分布、p 值与置信区间：
+#   bootstrap — 平稳分块自助法 (Politis & Romano)：按几何分布长度的随机块重组交易日，
+#               策略与基准同日配对抽样，保留收益的短期自相关；p 值为超额收益 <= 0 的路径占比
+#   random    — 随机入场零假设：按与策略相同的开仓频率、平均持仓时长随机生成进出场
+#               (两状态马尔可夫链)；p 值为随机策略收益 >= 实际策略的占比
+#   shuffle   — 信号置换：把实际持仓序列在时间轴上随机打乱 (持仓天数完全不变)，检验择时是否有效
+# 路径按块在 (路径 × 交易日) 矩阵上向量化计算，各块中间数组合计不超过 memory_bytes；
+# 块之间用线程并行 (NumPy 运算期间释放 GIL)，每块使用独立派生的随机种子，结果与线程数无关。
+
+TESTS = ('bootstrap', 'random', 'shuffle')
+TEST_LABELS = {'bootstrap': '平稳分块 Bootstrap', 'random': '随机入场', 'shuffle': '信号置换'}
+DEFAULT_PATHS = 10_000
+# 所有并行块的中间数组内存上限合计 (字节)
+MEMORY_BYTES = 256 * 1024 * 1024
+# 并行线程数上限；块大小按该上限均分内存，因此与实际线程数无关，结果可复现
+MAX_WORKERS = 4
+# 每个 (路径, 交易日) 单元在一块中同时存活的中间数组字节数估计
+BYTES_PER_CELL = 24
+# 置信带只用前若干条 Bootstrap 路径、在至多若干个时间点上统计，内存与总路径数无关
+BAND_PATHS = 10_000
+BAND_POINTS = 250
+CONFIDENCE = 0.95
+
+
+@dataclass
+class RobustnessReport:
+    observed: dict              # 实际回测的总收益、基准收益、超额收益、最大回撤、胜率
+    tests: pd.DataFrame         # 每种检验的路径数、p 值、说明 (note) 与各指标的置信区间
+    distributions: dict         # 检验名 -> 每条路径的 total_return / max_drawdown / win_rate (及超额收益)；跳过的检验不在其中
+    bands: pd.DataFrame         # Bootstrap 策略净值的逐日置信带 (time, lower, median, upper)
+
+
+def default_block_length(n_days: int) -> float:
+    """平均块长取 n^(1/3) (常用经验值)，至少 2 天"""
+    return max(2.0, n_days ** (1 / 3))
+
+
+def _log_returns(returns: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """每日对数收益；收益 <= -100% (如前复权出现非正价格) 时为 NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.log1p(returns).astype(dtype)
+
+
+def _nav_metrics(log_ret: np.ndarray) -> dict:
+    """
+    一块路径 (路径, 交易日) 的总收益(%) 与最大回撤(%)。
+    输入为每日对数收益，回撤 = 1 - exp(当前对数净值 - 历史最高对数净值)，全程在对数空间计算。
+    """
+    log_nav = np.cumsum(log_ret, axis=1)
+    peak = np.maximum.accumulate(log_nav, axis=1)
+    np.maximum(peak, 0, out=peak)
+    np.subtract(log_nav, peak, out=peak)
+    return {
+        'total_return': np.expm1(log_nav[:, -1].astype(np.float64)) * 100,
+        'max_drawdown': -np.expm1(peak.min(axis=1).astype(np.float64)) * 100,
+    }
+
+
+def _win_rate(won: np.ndarray, holding: np.ndarray) -> np.ndarray:
+    """按日胜率(%)：持仓且上涨的天数 / 持仓天数"""
+    return np.divide(won * 100.0, holding, out=np.zeros(len(holding)), where=holding > 0)
+
+
+def _observed(strategy_return: np.ndarray, daily_return: np.ndarray, held: np.ndarray) -> dict:
+    metrics = _nav_metrics(_log_returns(strategy_return)[None, :])
+    benchmark = (np.prod(1 + daily_return) - 1) * 100
+    total = float(metrics['total_return'][0])
+    win_rate = _win_rate(np.array([np.sum(held & (strategy_return > 0))]), np.array([held.sum()]))
+    return {
+        'total_return': total,
+        'benchmark_return': float(benchmark),
+        'excess_return': total - float(benchmark),
+        'max_drawdown': float(metrics['max_drawdown'][0]),
+        'win_rate': float(win_rate[0]),
+    }
+
+
+# --- 平稳分块自助法 ---
+
+def bootstrap_blocks(rng: np.random.Generator, n_paths: int, n_days: int, block_length: float) -> tuple:
+    """
+    为每条路径抽取首尾相接的块，块长服从均值为 block_length 的几何分布 (等价于每天以 1/block_length
+    的概率开启新块)，每块起点在历史上均匀随机、越过末尾时回绕。
+    返回各块 (所属路径, 块首日, 块长, 在历史中的起点)，按路径、块首日排序。
+    """
+    p = 1.0 / block_length
+    per_row = int(n_days * p * 1.5) + 16
+    while True:
+        lengths = rng.geometric(p, (n_paths, per_row))
+        ends = np.cumsum(lengths, axis=1)
+        if ends[:, -1].min() >= n_days:
+            break
+        per_row *= 2
+    starts = ends - lengths
+    keep = starts < n_days
+    path = np.nonzero(keep)[0]
+    first = starts[keep]
+    length = np.minimum(ends[keep], n_days) - first
+    origin = rng.integers(0, n_days, len(first))
+    return path, first, length, origin
+
+
+def block_bootstrap_indices(rng: np.random.Generator, n_paths: int, n_days: int, block_length: float) -> np.ndarray:
+    """平稳分块自助法的抽样下标 (路径, 交易日)"""
+    return _block_indices(bootstrap_blocks(rng, n_paths, n_days, block_length), n_paths, n_days)
+
+
+def _block_indices(blocks: tuple, n_paths: int, n_days: int) -> np.ndarray:
+    # 块内下标 = 起点 + (当天 - 块首日)：按块长展开 (起点 - 块首日) 再加上当天序号
+    _, first, length, origin = blocks
+    idx = np.repeat((origin - first).astype(np.int32), length).reshape(n_paths, n_days)
+    idx += np.arange(n_days, dtype=np.int32)
+    idx[idx >= n_days] -= n_days
+    return idx
+
+
+def _block_sums(blocks: tuple, prefix: np.ndarray, n_paths: int) -> np.ndarray:
+    """
+    每条路径上某个逐日序列的合计，用前缀和按块计算，不需要展开成 (路径, 交易日) 矩阵。
+    prefix 为序列重复两遍后的前缀和 (长度 2n + 1)，以支持回绕的块。
+    """
+    path, _, length, origin = blocks
+    return np.bincount(path, weights=prefix[origin + length] - prefix[origin], minlength=n_paths)
+
+
+def _wrapped_prefix(values: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0.0], np.cumsum(np.tile(values.astype(np.float64), 2))])
+
+
+# --- 随机入场 ---
+
+def _entry_exit_rates(held: np.ndarray) -> tuple:
+    """从实际持仓估计每天的开仓概率 (空仓时) 与平仓概率 (持仓时)"""
+    entries = int(held[0]) + int((held[1:] & ~held[:-1]).sum())
+    exits = int((held[:-1] & ~held[1:]).sum())
+    holding, flat = int(held.sum()), int((~held).sum())
+    p_exit = exits / holding if holding else 1.0
+    p_entry = entries / flat if flat else 1.0
+    # 从未开仓时如实返回 0，不把下限 1/n 套上去凭空造出交易
+    if not entries:
+        return 0.0, 1.0
+    return min(max(p_entry, 1.0 / len(held)), 1.0), min(max(p_exit, 1.0 / len(held)), 1.0)
+
+
+def random_positions(rng: np.random.Generator, n_paths: int, n_days: int, p_entry: float, p_exit: float) -> np.ndarray:
+    """
+    随机入场持仓 (路径, 交易日)：空仓时每天以 p_entry 开仓、持仓时以 p_exit 平仓的两状态马尔可夫链。
+    等价地，空仓/持仓时长分别服从几何分布，交替生成时长后在切换点翻转状态，无需逐日循环。
+    """
+    exposure = p_entry / (p_entry + p_exit)
+    initial = rng.random(n_paths) < exposure
+    cycle = 1 / p_entry + 1 / p_exit
+    runs = int(2 * n_days / cycle * 1.5) + 16
+    while True:
+        # 第一段的状态由 initial 决定，之后交替
+        first_p = np.where(initial, p_exit, p_entry)[:, None]
+        other_p = np.where(initial, p_entry, p_exit)[:, None]
+        switch_at = np.cumsum(rng.geometric(np.where(np.arange(runs) % 2 == 0, first_p, other_p)), axis=1)
+        if switch_at[:, -1].min() >= n_days:
+            break
+        runs *= 2
+    flips = np.zeros((n_paths, n_days), dtype=np.int8)
+    rows, cols = np.nonzero(switch_at < n_days)
+    flips[rows, switch_at[rows, cols]] = 1
+    # int8 累加溢出时按 256 回绕，奇偶性不变
+    state = np.cumsum(flips, axis=1, dtype=np.int8)
+    return (state & 1).astype(bool) ^ initial[:, None]
+
+
+# --- 信号置换 ---
+
+def shuffled_positions(rng: np.random.Generator, held: np.ndarray, n_paths: int) -> np.ndarray:
+    """
+    把持仓序列在时间轴上随机置换 (路径, 交易日)。二值序列的随机置换等价于随机挑选同样多的持仓日：
+    每天一个随机键，取键最小的 k 天 (np.partition 为线性时间，比逐行洗牌快得多)；
+    极少数键值相同导致持仓天数不等的行，退回逐行洗牌。
+    """
+    n_days = len(held)
+    k = int(held.sum())
+    if k == 0 or k == n_days:
+        return np.broadcast_to(held, (n_paths, n_days)).copy()
+    keys = rng.integers(0, np.iinfo(np.uint32).max, (n_paths, n_days), dtype=np.uint32, endpoint=True)
+    kth = np.partition(keys, k - 1, axis=1)[:, k - 1:k]
+    pos = keys <= kth
+    bad = np.flatnonzero(np.count_nonzero(pos, axis=1) != k)
+    if len(bad):
+        pos[bad] = rng.permuted(np.broadcast_to(held, (len(bad), n_days)), axis=1)
+    return pos
+
+
+# --- 分块计算 ---
+
+def _bootstrap_chunk(rng, tables, rows, block_length, band_rows, band_at):
+    n_days = len(tables['strategy_log'])
+    blocks = bootstrap_blocks(rng, rows, n_days, block_length)
+    strat = tables['strategy_log'][_block_indices(blocks, rows, n_days)]
+    metrics = _nav_metrics(strat)
+    # 基准收益、持仓天数、盈利天数只需要合计，直接按块用前缀和求出
+    bench_total = np.expm1(_block_sums(blocks, tables['benchmark_prefix'], rows)) * 100
+    holding = _block_sums(blocks, tables['held_prefix'], rows)
+    won = _block_sums(blocks, tables['wins_prefix'], rows)
+    metrics['win_rate'] = _win_rate(np.rint(won), np.rint(holding))
+    metrics['excess_return'] = metrics['total_return'] - bench_total
+    band = np.exp(np.cumsum(strat[:band_rows], axis=1)[:, band_at]) if band_rows else None
+    return metrics, band
+
+
+def _position_chunk(tables, pos):
+    """给定一块持仓矩阵 (已延后 1 天)，计算其在实际行情上的表现"""
+    metrics = _nav_metrics(np.where(pos, tables['benchmark_log'], np.float32(0)))
+    metrics['win_rate'] = _win_rate(np.count_nonzero(pos & tables['up'], axis=1), np.count_nonzero(pos, axis=1))
+    return metrics
+
+
+def _random_chunk(rng, tables, rows, p_entry, p_exit):
+    n = len(tables['benchmark_log'])
+    pos = np.zeros((rows, n), dtype=bool)
+    pos[:, 1:] = random_positions(rng, rows, n - 1, p_entry, p_exit)
+    return _position_chunk(tables, pos)
+
+
+def _shuffle_chunk(rng, tables, rows):
+    return _position_chunk(tables, shuffled_positions(rng, tables['held'], rows))
+
+
+def _summarize(name: str, dist: dict, observed: dict) -> dict:
+    lo, hi = (1 - CONFIDENCE) / 2 * 100, (1 + CONFIDENCE) / 2 * 100
+    total = dist['total_return']
+    if name == 'bootstrap':
+        # 超额收益 <= 0 的路径占比：策略并不优于基准的概率
+        p_value = float(np.mean(dist['excess_return'] <= 0))
+    else:
+        # 零假设分布中不差于实际策略的比例 (加 1 修正，避免报告 p = 0)
+        p_value = float((1 + np.sum(total >= observed['total_return'])) / (1 + len(total)))
+    row = {'test': name, 'label': TEST_LABELS[name], 'paths': len(total), 'p_value': p_value, 'note': ''}
+    for metric in ('total_return', 'max_drawdown', 'win_rate') + (('excess_return',) if 'excess_return' in dist else ()):
+        values = dist[metric]
+        row[f'{metric}_mean'] = float(np.nanmean(values))
+        row[f'{metric}_low'], row[f'{metric}_high'] = (float(v) for v in np.nanpercentile(values, [lo, hi]))
+    return row
+
+
+def _skipped(name: str, note: str) -> dict:
+    """无法定义零假设的检验：不生成路径，p 值记为 1 并附上原因"""
+    row = {'test': name, 'label': TEST_LABELS[name], 'paths': 0, 'p_value': 1.0, 'note': note}
+    for metric in ('total_return', 'max_drawdown', 'win_rate'):
+        row[f'{metric}_mean'] = row[f'{metric}_low'] = row[f'{metric}_high'] = np.nan
+    return row
+
+
+def run_robustness(strategy_return, daily_return, position, times=None, n_paths: int = DEFAULT_PATHS,
+                   tests=TESTS, block_length: float = None, seed: int = 0,
+                   memory_bytes: int = MEMORY_BYTES, n_jobs: int | None = None) -> RobustnessReport:
+    """
+    对一次单标的回测做稳健性检验。
+    strategy_return / daily_return / position 对应回测流水线的 Strategy_Return、Daily_Return
+    与延后 1 天后的 Signal；times 为对应的日期，用于输出置信带。
+    """
+    strategy_return = np.asarray(strategy_return, dtype=np.float64)
+    daily_return = np.asarray(daily_return, dtype=np.float64)
+    held = np.asarray(position, dtype=np.float64) > 0
+    n_days = len(strategy_return)
+    if n_days < 2:
+        raise ValueError("回测区间至少需要 2 个交易日")
+    unknown = set(tests) - set(TESTS)
+    if unknown:
+        raise ValueError(f"未知检验: {sorted(unknown)}，可选 {TESTS}")
+
+    block_length = block_length or default_block_length(n_days)
+    p_entry, p_exit = _entry_exit_rates(held)
+    observed = _observed(strategy_return, daily_return, held)
+    wins = held & (strategy_return > 0)
+    # 路径矩阵统一用 float32 对数收益，带宽减半 (只影响分布统计的末位精度)
+    tables = {
+        'strategy_log': _log_returns(strategy_return, np.float32),
+        'benchmark_log': _log_returns(daily_return, np.float32),
+        'benchmark_prefix': _wrapped_prefix(_log_returns(daily_return)),
+        'held': held,
+        'held_prefix': _wrapped_prefix(held),
+        'wins_prefix': _wrapped_prefix(wins),
+        'up': daily_return > 0,
+    }
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, MAX_WORKERS)
+    chunk = max(1, memory_bytes // MAX_WORKERS // (n_days * BYTES_PER_CELL))
+    offsets = list(range(0, n_paths, chunk))
+    # 置信带的取样时间点；只保留前 BAND_PATHS 条 Bootstrap 路径在这些时间点上的净值
+    band_at = np.unique(np.linspace(0, n_days - 1, min(n_days, BAND_POINTS)).astype(np.int64))
+    band_paths = min(n_paths, BAND_PATHS)
+
+    def run_chunk(name, start, seed_seq):
+        rng = np.random.default_rng(seed_seq)
+        rows = min(chunk, n_paths - start)
+        if name == 'bootstrap':
+            return _bootstrap_chunk(rng, tables, rows, block_length, max(0, min(rows, band_paths - start)), band_at)
+        if name == 'random':
+            return _random_chunk(rng, tables, rows, p_entry, p_exit), None
+        return _shuffle_chunk(rng, tables, rows), None
+
+    distributions, rows, band_nav = {}, [], None
+    root = np.random.SeedSequence(seed)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for name, test_seed in zip(tests, root.spawn(len(tests))):
+            if name != 'bootstrap' and not p_entry:
+                # 全程空仓：随机入场与信号置换都只能复现一条空仓路径，没有可比较的进出场
+                rows.append(_skipped(name, "策略全程空仓，没有进出场可供比较，未做检验"))
+                continue
+            results = list(pool.map(run_chunk, [name] * len(offsets), offsets, test_seed.spawn(len(offsets))))
+            dist = {k: np.concatenate([metrics[k] for metrics, _ in results]) for k in results[0][0]}
+            distributions[name] = pd.DataFrame(dist)
+            rows.append(_summarize(name, dist, observed))
+            if name == 'bootstrap':
+                band_nav = np.concatenate([band for _, band in results if band is not None])
+
+    bands = pd.DataFrame()
+    if band_nav is not None:
+        lo, mid, hi = np.nanpercentile(band_nav, [(1 - CONFIDENCE) / 2 * 100, 50, (1 + CONFIDENCE) / 2 * 100], axis=0)
+        bands = pd.DataFrame({
+            'time': np.asarray(times)[band_at] if times is not None else band_at,
+            'lower': lo, 'median': mid, 'upper': hi,
+        })
+    return RobustnessReport(observed=observed, tests=pd.DataFrame(rows), distributions=distributions, bands=bands)
@@ -0,0 +1,261 @@
+import os
+from datetime import datetime
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+import utils.data_loader as data_loader
+from utils.cache import cached_screen
+from utils.strategy import Node, CLOSE, SMA, RSI, prev, crosses_above, crosses_below, falls_below
+from utils.tracing import annotate, traced
+
+# --- 全市场条件选股 (SQL 下推) ---
+# 把 utils/strategy.py 中的策略表达式 (SMA / RSI / 前值 / 比较与逻辑运算) 编译为 DuckDB 窗口函数查询，
+# 一条 SQL 扫描某个市场下全部已缓存的 Parquet 分区，按 symbol 分区、日期排序计算指标，
+# 只返回在指定交易日满足条件的标的及排序分数，全程不为单个标的构建 pandas DataFrame。
+# 每个窗口层级是一层 CTE；逐元素运算内联为 SQL 表达式，比较结果 NULL 视为 False (与 pandas NaN 比较同口径)。
+# 只读取截止日之前若干个自然日 (由表达式所需的最大回看行数推算)，停牌超过该缓冲区的标的不参与筛选。
+# EMA 是递推指标，无法写成有限窗口聚合，因此 MACD 类条件不支持下推。
+# 结果按 (市场, 条件, 参数, 截止日, 缓存文件版本) 缓存，任一分区文件更新后自动失效。
+
+# 回看行数 -> 自然日缓冲：交易日约占自然日的 2/3，再留出长假余量
+CALENDAR_DAYS_PER_ROW = 2
+CALENDAR_BUFFER_DAYS = 30
+# 默认筛选最新交易日时，先假定缓存滞后今天不超过这么多天，只扫描一次
+STALE_DAYS = 30
+
+
+@dataclass
+class Screen:
+    condition: Node                                 # 选股条件 (布尔表达式)
+    score: Node                                     # 排序分数
+    ascending: bool = False                         # 分数升序排列 (如 RSI 越低越靠前)
+    columns: dict = field(default_factory=dict)     # 额外输出的指标列：列名 -> 表达式
+
+
+def golden_cross(fast: int = 5, slow: int = 20) -> Screen:
+    """均线金叉：快线当天上穿慢线，按快线高出慢线的幅度排序"""
+    ma_fast, ma_slow = SMA(CLOSE, fast), SMA(CLOSE, slow)
+    return Screen(crosses_above(ma_fast, ma_slow), ma_fast / ma_slow - 1,
+                  columns={'ma_fast': ma_fast, 'ma_slow': ma_slow})
+
+
+def death_cross(fast: int = 5, slow: int = 20) -> Screen:
+    """均线死叉：快线当天下穿慢线，按跌破幅度排序"""
+    ma_fast, ma_slow = SMA(CLOSE, fast), SMA(CLOSE, slow)
+    return Screen(crosses_below(ma_fast, ma_slow), ma_fast / ma_slow - 1, ascending=True,
+                  columns={'ma_fast': ma_fast, 'ma_slow': ma_slow})
+
+
+def ma_above(fast: int = 5, slow: int = 20) -> Screen:
+    """快线在慢线上方 (双均线策略持仓中)"""
+    ma_fast, ma_slow = SMA(CLOSE, fast), SMA(CLOSE, slow)
+    return Screen(ma_fast > ma_slow, ma_fast / ma_slow - 1,
+                  columns={'ma_fast': ma_fast, 'ma_slow': ma_slow})
+
+
+def rsi_below(period: int = 14, threshold: float = 30) -> Screen:
+    """RSI 低于阈值 (超卖)，RSI 越低越靠前"""
+    rsi_line = RSI(CLOSE, period)
+    return Screen(rsi_line < threshold, rsi_line, ascending=True, columns={'rsi': rsi_line})
+
+
+def rsi_above(period: int = 14, threshold: float = 70) -> Screen:
+    """RSI 高于阈值 (超买)，RSI 越高越靠前"""
+    rsi_line = RSI(CLOSE, period)
+    return Screen(rsi_line > threshold, rsi_line, columns={'rsi': rsi_line})
+
+
+def rsi_falls_below(period: int = 14, threshold: float = 70) -> Screen:
+    """RSI 当天从超买区回落 (MACD+RSI 策略的离场条件之一)"""
+    rsi_line = RSI(CLOSE, period)
+    return Screen(falls_below(rsi_line, threshold), prev(rsi_line) - rsi_line, columns={'rsi': rsi_line})
+
+
+SCREENS = {
+    'golden_cross': golden_cross,
+    'death_cross': death_cross,
+    'ma_above': ma_above,
+    'rsi_below': rsi_below,
+    'rsi_above': rsi_above,
+    'rsi_falls_below': rsi_falls_below,
+}
+
+
+# --- 表达式 -> SQL ---
+
+COMPARISONS = {'gt': '>', 'lt': '<', 'ge': '>=', 'le': '<='}
+ARITHMETIC = {'add': '+', 'sub': '-', 'mul': '*', 'div': '/'}
+PARTITION = "PARTITION BY symbol ORDER BY day"
+
+
+class SqlCompiler:
+    """
+    把表达式编译为分层的 SELECT。layers[k] 是第 k 层 CTE 新增的 (列名, 窗口表达式)，第 0 层为源数据；
+    每个窗口节点放在其输入所在层的下一层，逐元素运算直接内联。结构相同的节点只编译一次。
+    """
+
+    def __init__(self):
+        self.layers = [[]]
+        self._memo = {}
+
+    def _column(self, level: int, sql: str) -> tuple:
+        while len(self.layers) <= level:
+            self.layers.append([])
+        alias = f"c{sum(len(layer) for layer in self.layers)}"
+        self.layers[level].append((alias, sql))
+        return alias, level
+
+    def compile(self, node: Node) -> tuple:
+        """返回 (SQL 表达式, 可用的层号)"""
+        if node not in self._memo:
+            self._memo[node] = self._compile(node)
+        return self._memo[node]
+
+    def _compile(self, node: Node) -> tuple:
+        op = node.op
+        if op == 'col':
+            if node.params[0] != 'close':
+                raise ValueError(f"选股只支持收盘价列，不支持: {node.params[0]}")
+            return 'close', 0
+        if op == 'const':
+            return repr(float(node.params[0])), 0
+        args = [self.compile(a) for a in node.args]
+        level = max(lvl for _, lvl in args)
+        if op == 'sma':
+            (x, lvl), n = args[0], node.params[0]
+            window = f"({PARTITION} ROWS BETWEEN {n - 1} PRECEDING AND CURRENT ROW)"
+            # 与 rolling(window).mean() 一致：窗口内非空值不足 n 个时为空
+            return self._column(lvl + 1, f"CASE WHEN count({x}) OVER {window} = {n} THEN avg({x}) OVER {window} END")
+        if op == 'prev':
+            (x, lvl), = args
+            return self._column(lvl + 1, f"lag({x}) OVER ({PARTITION})")
+        if op == 'rsi':
+            (x, lvl), n = args[0], node.params[0]
+            delta, lvl = self._column(lvl + 1, f"{x} - lag({x}) OVER ({PARTITION})")
+            window = f"({PARTITION} ROWS BETWEEN {n - 1} PRECEDING AND CURRENT ROW)"
+            # 与 indicators.rsi 一致：首日涨跌幅为空时计作 0，满 n 行后才有值
+            full = f"count(*) OVER {window} = {n}"
+            gain, lvl = self._column(lvl + 1, f"CASE WHEN {full} THEN avg(CASE WHEN {delta} > 0 THEN {delta} ELSE 0 END) OVER {window} END")
+            loss, _ = self._column(lvl, f"CASE WHEN {full} THEN avg(CASE WHEN {delta} < 0 THEN -{delta} ELSE 0 END) OVER {window} END")
+            # 只涨不跌时 RSI = 100，无涨无跌时为空 (pandas 中 0/0 为 NaN)
+            return (f"(CASE WHEN {loss} = 0 THEN CASE WHEN {gain} > 0 THEN 100.0 END "
+                    f"ELSE 100 - 100 / (1 + {gain} / {loss}) END)"), lvl
+        if op == 'ema':
+            raise ValueError("EMA 为递推指标，无法下推为窗口函数查询")
+        sql = [x for x, _ in args]
+        if op in COMPARISONS:
+            return f"coalesce({sql[0]} {COMPARISONS[op]} {sql[1]}, false)", level
+        if op in ARITHMETIC:
+            return f"({sql[0]} {ARITHMETIC[op]} {sql[1]})", level
+        if op == 'and':
+            return f"({sql[0]} AND {sql[1]})", level
+        if op == 'or':
+            return f"({sql[0]} OR {sql[1]})", level
+        if op == 'not':
+            return f"(NOT {sql[0]})", level
+        raise ValueError(f"不支持的表达式: {op}")
+
+
+def lookback_rows(node: Node) -> int:
+    """计算表达式在某一天的值至少需要往前读取的行数"""
+    own = {'sma': lambda n: n.params[0] - 1, 'prev': lambda n: 1, 'rsi': lambda n: n.params[0]}
+    extra = own[node.op](node) if node.op in own else 0
+    return extra + max((lookback_rows(a) for a in node.args), default=0)
+
+
+def screen_sql(screen: Screen, limit: int = None, latest: bool = False) -> tuple:
+    """
+    生成完整的选股 SQL，返回 (SQL, 所需回看行数)。
+    参数依次为 market、起始日、截止日；latest=True 时不限截止日，在读到的数据中取最新交易日筛选。
+    """
+    compiler = SqlCompiler()
+    condition, _ = compiler.compile(screen.condition)
+    score, _ = compiler.compile(screen.score)
+    outputs = {name: compiler.compile(node)[0] for name, node in screen.columns.items()}
+
+    date_filter = "日期 >= ?" if latest else "日期 BETWEEN ? AND ?"
+    ctes = [f"""l0 AS (
+        SELECT symbol, 日期 AS day, CAST(收盘 AS DOUBLE) AS close
+        FROM {data_loader.daily_dataset_sql()}
+        WHERE market = ? AND {date_filter}
+    )"""]
+    for k, layer in enumerate(compiler.layers[1:], start=1):
+        columns = ", ".join(f"{sql} AS {alias}" for alias, sql in layer)
+        ctes.append(f"l{k} AS (SELECT *, {columns} FROM l{k - 1})")
+    extra = "".join(f", {sql} AS {name}" for name, sql in outputs.items())
+    order = "ASC" if screen.ascending else "DESC"
+    as_of = "(SELECT max(day) FROM l0)" if latest else "?"
+    sql = (f"WITH {', '.join(ctes)}\n"
+           f"SELECT symbol, day AS date, close{extra}, {score} AS score FROM l{len(compiler.layers) - 1}\n"
+           f"WHERE day = {as_of} AND {condition}\n"
+           f"ORDER BY score {order} NULLS LAST, symbol"
+           + (f"\nLIMIT {int(limit)}" if limit else ""))
+    lookback = max(lookback_rows(n) for n in (screen.condition, screen.score, *screen.columns.values()))
+    return sql, lookback
+
+
+def _buffer(lookback: int) -> pd.Timedelta:
+    return pd.Timedelta(days=lookback * CALENDAR_DAYS_PER_ROW + CALENDAR_BUFFER_DAYS)
+
+
+def dataset_version(market: str) -> tuple:
+    """某个市场全部日线缓存的版本标识 (文件数, 最新修改时间, 总大小)，任一分区更新都会改变"""
+    root = os.path.join(data_loader.DATA_DIR, f"market={market}")
+    count = latest = total = 0
+    if os.path.isdir(root):
+        for entry in os.scandir(root):
+            try:
+                st = os.stat(os.path.join(entry.path, data_loader.DAILY_FILE))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            count, latest, total = count + 1, max(latest, st.st_mtime_ns), total + st.st_size
+    return count, latest, total
+
+
+def latest_trading_day(market: str):
+    """某个市场缓存中最新的交易日 (没有缓存时返回 None)"""
+    row = data_loader._conn().execute(
+        f"SELECT max(日期) FROM {data_loader.daily_dataset_sql()} WHERE market = ?", [market]).fetchone()
+    return pd.Timestamp(row[0]) if row and row[0] is not None else None
+
+
+@traced("screen.query")
+def _run_screen(market: str, screen: Screen, as_of, limit) -> pd.DataFrame:
+    conn = data_loader._conn()
+    if as_of is None:
+        # 先假定缓存已更新到今天，一次扫描里直接取最新交易日；
+        # 没有结果或最新交易日距今太久 (缓冲区不够计算指标) 时，查出实际的最新交易日再精确筛选
+        sql, lookback = screen_sql(screen, limit, latest=True)
+        start = pd.Timestamp(datetime.now().date()) - _buffer(lookback) - pd.Timedelta(days=STALE_DAYS)
+        result = conn.execute(sql, [market, start]).df()
+        if not result.empty and result['date'].iloc[0] - start >= _buffer(lookback):
+            return _ranked(result, result['date'].iloc[0], lookback)
+        as_of = latest_trading_day(market)
+        if as_of is None:
+            return pd.DataFrame()
+    as_of = pd.Timestamp(as_of)
+    sql, lookback = screen_sql(screen, limit)
+    result = conn.execute(sql, [market, as_of - _buffer(lookback), as_of, as_of]).df()
+    return _ranked(result, as_of, lookback)
+
+
+def _ranked(result: pd.DataFrame, as_of, lookback: int) -> pd.DataFrame:
+    result.insert(0, 'rank', range(1, len(result) + 1))
+    annotate(as_of=str(pd.Timestamp(as_of).date()), matches=len(result), lookback_rows=lookback)
+    return result
+
+
+def run_screen(market: str, name: str, as_of=None, limit: int = None, **params) -> pd.DataFrame:
+    """
+    在某个市场全部已缓存标的上运行选股条件 (SCREENS 中的名称)，返回满足条件的标的排名表：
+    rank / symbol / date / close / 指标列 / score。as_of 为筛选的交易日，默认取缓存中最新的交易日。
+    """
+    if name not in SCREENS:
+        raise ValueError(f"未知选股条件: {name}，可选 {sorted(SCREENS)}")
+    if not os.path.isdir(os.path.join(data_loader.DATA_DIR, f"market={market}")):
+        return pd.DataFrame()
+    screen = SCREENS[name](**params)
+    as_of_key = str(pd.Timestamp(as_of).date()) if as_of is not None else None
+    key = (market, name, tuple(sorted(params.items())), as_of_key, limit, dataset_version(market))
+    return cached_screen(key, lambda: _run_screen(market, screen, as_of, limit))
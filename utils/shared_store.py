@@ -0,0 +1,174 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import utils.data_loader as data_loader
+from utils.resample import bar_file_path, materialize, normalize_timeframe
+from utils.tracing import increment, span
+
+# --- 进程级共享行情表 (Arrow, 零拷贝) ---
+# 每个 (市场, 代码) 的日线缓存只从 Parquet 读一次，存为不可变的 Arrow 表，列名在加载时就转换为英文
+# (time / open / high / low / close / volume)，之后任意会话、任意日期区间的请求都只是在这张表上
+# 二分定位后切片 (Table.slice)，再零拷贝转换为 pandas (每列单独成块，直接引用 Arrow 内存)。
+# 因此内存随“不同标的数”增长，而不是“会话数 × 标的数”。
+# 发出去的 DataFrame 记作对该表的引用，被回收时引用数减一；超出内存上限时，只淘汰没有引用、最久未用的表。
+# Parquet 文件被增量补抓替换后 (文件大小或修改时间变化)，下次请求会重新加载，旧表由仍在使用它的视图保持存活。
+# 发出的视图共享底层内存，调用方可以追加列，但不得原地修改已有列。
+# 周线 / 月线 / N 日线 (utils/resample.py) 以 (市场, 代码, 周期) 为键同样共享，读取前先确认物化文件与日线一致。
+
+# 内存上限 (字节)，可用环境变量 QUANT_STORE_MB 调整
+STORE_BYTES = int(os.environ.get("QUANT_STORE_MB", "512")) * 1024 * 1024
+
+
+class _Entry:
+    __slots__ = ('table', 'times', 'nbytes', 'version', 'refs')
+
+    def __init__(self, table: pa.Table, version: tuple):
+        self.table = table
+        # 时间列的 NumPy 视图 (零拷贝)，用于二分定位请求区间
+        self.times = table.column('time').chunk(0).to_numpy() if table.num_rows else np.array([], 'datetime64[ns]')
+        self.nbytes = table.nbytes
+        self.version = version
+        self.refs = 0
+
+
+def file_version(market: str, symbol: str, timeframe: str = 'D'):
+    """缓存文件的版本标识 (修改时间, 大小)；文件不存在时返回 None"""
+    try:
+        st = os.stat(bar_file_path(market, symbol, timeframe))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_table(market: str, symbol: str, timeframe: str = 'D') -> pa.Table:
+    """把一个标的某个周期的完整 K 线读成 Arrow 表 (英文列名、按日期排序、每列单块连续内存)"""
+    # 日期统一为纳秒时间戳，与 pandas 默认精度一致
+    select = ", ".join(f'CAST("{cn}" AS TIMESTAMP_NS) AS {en}' if en == 'time' else f'"{cn}" AS {en}'
+                       for cn, en in data_loader.CHART_COLUMNS.items())
+    result = data_loader._conn().execute(
+        f"SELECT {select} FROM read_parquet(?, hive_partitioning=false) ORDER BY 日期",
+        [bar_file_path(market, symbol, timeframe)]
+    ).arrow()
+    # DuckDB 新版本返回 RecordBatchReader，旧版本直接返回 Table
+    if isinstance(result, pa.RecordBatchReader):
+        result = result.read_all()
+    return result.combine_chunks()
+
+
+class SharedTableStore:
+    """线程安全的共享 Arrow 表存储，按引用计数与 LRU 在内存上限内淘汰"""
+
+    def __init__(self, name: str, max_bytes: int = STORE_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (market, symbol, timeframe) -> _Entry
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.views = 0
+
+    def _entry(self, market: str, symbol: str, timeframe: str):
+        key = (market, symbol, timeframe)
+        version = file_version(market, symbol, timeframe)
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                entry.refs += 1
+                self.hits += 1
+                increment("store_hit")
+                return entry
+            self.misses += 1
+        increment("store_miss")
+
+        # 读取放在锁外，避免大文件阻塞其他会话
+        entry = _Entry(load_table(market, symbol, timeframe), version)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                # 旧版本不再计入内存，仍持有视图的会话继续使用它直到释放
+                self.current_bytes -= old.nbytes
+            entry.refs += 1
+            self._entries[key] = entry
+            self.current_bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refs -= 1
+            self.views -= 1
+            self._evict()
+
+    def _evict(self):
+        """超出上限时从最久未用的表开始淘汰，仍被引用的表跳过 (调用方持有锁)"""
+        if self.current_bytes <= self.max_bytes:
+            return
+        for key in [k for k, e in self._entries.items() if e.refs == 0]:
+            self.current_bytes -= self._entries.pop(key).nbytes
+            self.evictions += 1
+            if self.current_bytes <= self.max_bytes:
+                break
+
+    def frame(self, market: str, symbol: str, start_date: str, end_date: str, timeframe: str = 'D') -> pd.DataFrame:
+        """
+        返回 [start_date, end_date] 区间某个周期的 K 线 (英文列名，默认日线)，数据列直接引用共享的 Arrow 内存。
+        标的没有缓存时返回空表。
+        """
+        timeframe = normalize_timeframe(timeframe)
+        with span("load.shared_frame", market=market, symbol=symbol, timeframe=timeframe) as sp:
+            if timeframe != 'D':
+                # 日线更新后先增量刷新物化文件，文件版本随之变化，旧表自然失效
+                materialize(market, symbol, timeframe)
+            entry = self._entry(market, symbol, timeframe)
+            if entry is None:
+                return pd.DataFrame(columns=list(data_loader.CHART_COLUMNS.values()))
+            lo = int(np.searchsorted(entry.times, np.datetime64(pd.Timestamp(start_date), 'ns'), side='left'))
+            hi = int(np.searchsorted(entry.times, np.datetime64(pd.Timestamp(end_date), 'ns'), side='right'))
+            df = entry.table.slice(lo, hi - lo).to_pandas(split_blocks=True, self_destruct=False)
+            with self._lock:
+                self.views += 1
+            weakref.finalize(df, self._release, entry)
+            if sp:
+                sp.set(rows=len(df), table_rows=entry.table.num_rows, table_bytes=entry.nbytes)
+            return df
+
+    def clear(self):
+        """丢弃全部没有引用的表"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.refs == 0]:
+                self.current_bytes -= self._entries.pop(key).nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'used_mb': self.current_bytes / 1024 / 1024,
+                'budget_mb': self.max_bytes / 1024 / 1024,
+                'views': self.views,
+                'pinned': sum(1 for e in self._entries.values() if e.refs > 0),
+            }
+
+
+shared_store = SharedTableStore("共享行情表")
+
+
+def shared_frame(market: str, symbol: str, start_date: str, end_date: str, timeframe: str = 'D') -> pd.DataFrame:
+    """从进程级共享表读取 K 线切片 (代码需已清洗，默认日线)"""
+    return shared_store.frame(market, symbol, start_date, end_date, timeframe)
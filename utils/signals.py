@@ -0,0 +1,44 @@
+import numpy as np
+
+# --- 信号规则模块 ---
+# 与 app.py 策略引擎同口径的买卖规则，全部在 NumPy 数组上运算，时间轴固定为最后一维，
+# 因此同一套函数既能处理单个标的，也能处理 (参数组合 × 交易日) 或 (标的 × 交易日) 的批量矩阵。
+
+
+def shift_prev(arr: np.ndarray) -> np.ndarray:
+    """沿时间轴后移一位 (等价于 shift(1))，首位补 NaN"""
+    prev = np.empty_like(arr, dtype=np.float64)
+    prev[..., 0] = np.nan
+    prev[..., 1:] = arr[..., :-1]
+    return prev
+
+
+def hold_state(buy: np.ndarray, sell: np.ndarray) -> np.ndarray:
+    """
+    向量化的持仓状态机：遇到买点持仓、遇到卖点空仓，期间沿用最近一次信号。
+    同一天同时出现买卖点时以卖出为准 (与 app.py 先写 1 再写 -1 的顺序一致)。
+    """
+    state = np.where(sell, np.int8(-1), np.where(buy, np.int8(1), np.int8(0)))
+    steps = np.arange(state.shape[-1], dtype=np.int32)
+    last_event = np.where(state != 0, steps, -1)
+    np.maximum.accumulate(last_event, axis=-1, out=last_event)
+    held = np.take_along_axis(state, np.maximum(last_event, 0), axis=-1) == 1
+    return held & (last_event >= 0)
+
+
+def dual_ma_signal(ma_short: np.ndarray, ma_long: np.ndarray) -> np.ndarray:
+    """双均线：快线在慢线上方即持仓，NaN 比较结果为 False"""
+    return ma_short > ma_long
+
+
+def macd_rsi_signal(dif: np.ndarray, dea: np.ndarray, rsi_values: np.ndarray, rsi_overbought) -> np.ndarray:
+    """
+    MACD + RSI：MACD 金叉且 RSI 未超买时买入；MACD 死叉或 RSI 从超买区回落时卖出。
+    rsi_overbought 可以是标量，也可以是能与 rsi_values 广播的数组。
+    """
+    prev_dif = shift_prev(dif)
+    prev_dea = shift_prev(dea)
+    prev_rsi = shift_prev(rsi_values)
+    buy = (prev_dif < prev_dea) & (dif > dea) & (rsi_values < rsi_overbought)
+    sell = ((prev_dif > prev_dea) & (dif < dea)) | ((prev_rsi >= rsi_overbought) & (rsi_values < rsi_overbought))
+    return hold_state(buy, sell)
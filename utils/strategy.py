@@ -0,0 +1,269 @@
+import inspect
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from utils.indicators import sma, ema, rsi
+from utils.signals import shift_prev, hold_state
+
+# --- 声明式策略与表达式图 ---
+# 策略只声明“用哪些指标、什么条件买卖、持仓怎么维持”，不直接操作 DataFrame：
+#   ma_fast, ma_slow = SMA(CLOSE, 5), SMA(CLOSE, 20)
+#   buy, sell = crosses_above(ma_fast, ma_slow), crosses_below(ma_fast, ma_slow)
+# 表达式节点是不可变的值对象，结构相同的子表达式 (同一条 EMA、同一个前值) 编译时合并为一个节点，只算一次；
+# 编译结果是按拓扑序排列的步骤表，运行时全部在 NumPy 数组上计算，不产生 prev_XXX 之类的临时列，
+# 中间结果在最后一次被使用后即复用其内存；持仓状态机直接用 signals.hold_state 的 int8 向量化实现。
+# 新策略只要在 STRATEGIES 中注册一个构造函数，单次回测与性能基准就会自动走这条路径。
+
+
+@dataclass(frozen=True)
+class Node:
+    op: str
+    args: tuple = ()        # 子表达式
+    params: tuple = ()      # 标量参数 (窗口、常数、列名)
+
+    # 比较与逻辑运算符构造新节点；== 保留给节点去重使用，不重载
+    def __gt__(self, other): return Node('gt', (self, _node(other)))
+    def __lt__(self, other): return Node('lt', (self, _node(other)))
+    def __ge__(self, other): return Node('ge', (self, _node(other)))
+    def __le__(self, other): return Node('le', (self, _node(other)))
+    def __and__(self, other): return Node('and', (self, _node(other)))
+    def __or__(self, other): return Node('or', (self, _node(other)))
+    def __invert__(self): return Node('not', (self,))
+    def __add__(self, other): return Node('add', (self, _node(other)))
+    def __sub__(self, other): return Node('sub', (self, _node(other)))
+    def __mul__(self, other): return Node('mul', (self, _node(other)))
+    def __rmul__(self, other): return Node('mul', (_node(other), self))
+    def __truediv__(self, other): return Node('div', (self, _node(other)))
+
+
+def _node(value) -> Node:
+    return value if isinstance(value, Node) else Node('const', params=(float(value),))
+
+
+def col(name: str) -> Node:
+    return Node('col', params=(name,))
+
+
+CLOSE = col('close')
+
+
+def SMA(src: Node, window: int) -> Node:
+    return Node('sma', (src,), (int(window),))
+
+
+def EMA(src: Node, span: int) -> Node:
+    return Node('ema', (src,), (int(span),))
+
+
+def RSI(src: Node, period: int) -> Node:
+    return Node('rsi', (src,), (int(period),))
+
+
+def prev(src: Node) -> Node:
+    """前一根 K 线的值 (shift(1))"""
+    return Node('prev', (src,))
+
+
+def crosses_above(a: Node, b: Node) -> Node:
+    """上穿：前一天 a < b，今天 a > b"""
+    return (prev(a) < prev(b)) & (a > b)
+
+
+def crosses_below(a: Node, b: Node) -> Node:
+    """下穿：前一天 a > b，今天 a < b"""
+    return (prev(a) > prev(b)) & (a < b)
+
+
+def falls_below(a: Node, level) -> Node:
+    """从 level 之上 (含) 回落到 level 之下"""
+    return (prev(a) >= level) & (a < level)
+
+
+@dataclass
+class StrategySpec:
+    name: str
+    buy: Node                                       # 买点 (图上的买入 Marker)
+    sell: Node                                      # 卖点
+    position: Node = None                           # 直接给出持仓条件；为 None 时由买卖点驱动状态机
+    series: dict = field(default_factory=dict)      # 需要输出到图表的序列：列名 -> 节点
+    overlays: dict = field(default_factory=dict)    # 叠加在 K 线主图上的序列：列名 -> 图例名
+    buy_label: str = "买入"
+    sell_label: str = "卖出"
+
+
+@dataclass
+class StrategyResult:
+    series: dict            # 列名 -> float64 数组
+    buy: np.ndarray         # bool
+    sell: np.ndarray        # bool
+    position: np.ndarray    # 当天收盘后的目标持仓 (bool，未延后)
+
+    @property
+    def signal(self) -> np.ndarray:
+        """延后 1 天交易 (避免未来函数) 的持仓，0/1 浮点，与回测流水线的 Signal 列同口径"""
+        out = np.zeros(len(self.position), dtype=np.float64)
+        out[1:] = self.position[:-1]
+        return out
+
+
+# --- 内置策略 (与侧边栏参数同名) ---
+
+def dual_ma(ma_short: int, ma_long: int, **_) -> StrategySpec:
+    """经典双均线：快线在慢线上方持仓，金叉/死叉只用于打点"""
+    fast, slow = SMA(CLOSE, ma_short), SMA(CLOSE, ma_long)
+    return StrategySpec(
+        name="dual_ma",
+        buy=crosses_above(fast, slow),
+        sell=crosses_below(fast, slow),
+        position=fast > slow,
+        series={'MA_Short': fast, 'MA_Long': slow},
+        overlays={'MA_Short': f"MA{ma_short}", 'MA_Long': f"MA{ma_long}"},
+        buy_label="买入(金叉)",
+        sell_label="卖出(死叉)",
+    )
+
+
+def macd_rsi(macd_fast: int, macd_slow: int, rsi_period: int, rsi_overbought: float,
+             signal_period: int = 9, **_) -> StrategySpec:
+    """MACD 金叉且 RSI 未超买时买入；MACD 死叉或 RSI 从超买区回落时卖出，期间持仓不变"""
+    dif = EMA(CLOSE, macd_fast) - EMA(CLOSE, macd_slow)
+    dea = EMA(dif, signal_period)
+    rsi_line = RSI(CLOSE, rsi_period)
+    return StrategySpec(
+        name="macd_rsi",
+        buy=crosses_above(dif, dea) & (rsi_line < rsi_overbought),
+        sell=crosses_below(dif, dea) | falls_below(rsi_line, rsi_overbought),
+        series={'DIF': dif, 'DEA': dea, 'MACD': 2 * (dif - dea), 'RSI': rsi_line},
+        buy_label="买入(趋势启动)",
+        sell_label="卖出(离场)",
+    )
+
+
+STRATEGIES = {
+    'dual_ma': dual_ma,
+    'macd_rsi': macd_rsi,
+}
+
+
+def build_strategy(name: str, **params) -> StrategySpec:
+    if name not in STRATEGIES:
+        raise ValueError(f"未知策略: {name}，可选 {sorted(STRATEGIES)}")
+    return STRATEGIES[name](**params)
+
+
+def strategy_params(name: str) -> list:
+    """内置策略构造函数显式接受的参数名 (不含兜底吞掉多余参数的 **_)"""
+    if name not in STRATEGIES:
+        raise ValueError(f"未知策略: {name}，可选 {sorted(STRATEGIES)}")
+    return [p.name for p in inspect.signature(STRATEGIES[name]).parameters.values()
+            if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)]
+
+
+# --- 编译与执行 ---
+
+# 指标节点：在 pandas Series 上调用 indicators 中的公式，结果可交给外部缓存
+INDICATORS = {'sma': sma, 'ema': ema, 'rsi': rsi}
+# 逐元素运算节点
+UFUNCS = {
+    'gt': np.greater, 'lt': np.less, 'ge': np.greater_equal, 'le': np.less_equal,
+    'and': np.logical_and, 'or': np.logical_or, 'not': np.logical_not,
+    'add': np.add, 'sub': np.subtract, 'mul': np.multiply, 'div': np.divide,
+}
+BOOLEAN_OPS = {'gt', 'lt', 'ge', 'le', 'and', 'or', 'not'}
+
+
+class CompiledStrategy:
+    """
+    编译后的策略：steps 为去重后按拓扑序排列的节点，每步记录输入所在的槽位与该结果最后一次被使用的步序。
+    """
+
+    def __init__(self, spec: StrategySpec):
+        self.spec = spec
+        roots = {'buy': spec.buy, 'sell': spec.sell, **{f"series:{k}": v for k, v in spec.series.items()}}
+        if spec.position is not None:
+            roots['position'] = spec.position
+        self.steps = []
+        slots = {}
+
+        def visit(node):
+            # 结构相同的节点哈希相等，只分配一个槽位
+            if node in slots:
+                return slots[node]
+            arg_slots = tuple(visit(a) for a in node.args)
+            slots[node] = len(self.steps)
+            self.steps.append((node, arg_slots))
+            return slots[node]
+
+        self.roots = {name: visit(node) for name, node in roots.items()}
+        # 每个槽位最后一次被读取的步序；根节点要保留到最后
+        self.last_use = list(range(len(self.steps)))
+        for i, (_, arg_slots) in enumerate(self.steps):
+            for s in arg_slots:
+                self.last_use[s] = i
+        for s in self.roots.values():
+            self.last_use[s] = len(self.steps)
+
+    def run(self, frame: pd.DataFrame, cache=None) -> StrategyResult:
+        """
+        在行情 DataFrame 上执行。cache(name, params, compute) 可选，用于跨次运行复用指标序列
+        (与 utils.cache.cached_indicator 的后三个参数一致)；收盘价上的指标以 (指标名, (周期,)) 为键。
+        """
+        index = frame.index
+        values = [None] * len(self.steps)
+        # 自己分配的中间数组可以原地复用；列数据与缓存中的指标是共享的，只读
+        owned = [False] * len(self.steps)
+        for i, (node, arg_slots) in enumerate(self.steps):
+            op = node.op
+            args = [values[s] for s in arg_slots]
+            if op == 'col':
+                values[i] = frame[node.params[0]].to_numpy(dtype=np.float64)
+            elif op == 'const':
+                values[i] = node.params[0]
+            elif op in INDICATORS:
+                values[i] = self._indicator(node, arg_slots[0], args[0], index, cache)
+            elif op == 'prev':
+                values[i], owned[i] = shift_prev(args[0]), True
+            else:
+                # 输入在此之后不再使用且类型相符时，直接写进它的内存
+                ufunc = UFUNCS[op]
+                dtype = np.bool_ if op in BOOLEAN_OPS else np.float64
+                reuse = [a for s, a in zip(arg_slots, args)
+                         if owned[s] and self.last_use[s] == i and isinstance(a, np.ndarray) and a.dtype == dtype]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values[i] = ufunc(*args, out=reuse[0]) if reuse else ufunc(*args)
+                owned[i] = True
+            for s in arg_slots:
+                if self.last_use[s] == i:
+                    values[s] = None
+
+        buy = np.asarray(values[self.roots['buy']], dtype=bool)
+        sell = np.asarray(values[self.roots['sell']], dtype=bool)
+        if 'position' in self.roots:
+            position = np.asarray(values[self.roots['position']], dtype=bool)
+        else:
+            position = hold_state(buy, sell)
+        series = {name: values[self.roots[f"series:{name}"]] for name in self.spec.series}
+        return StrategyResult(series=series, buy=buy, sell=sell, position=position)
+
+    def _indicator(self, node, src_slot, src, index, cache):
+        src_node = self.steps[src_slot][0]
+        fn = INDICATORS[node.op]
+
+        def compute():
+            return fn(pd.Series(src, index=index), *node.params)
+
+        if cache is None:
+            return compute().to_numpy(dtype=np.float64)
+        # 收盘价上的指标沿用 (指标名, (周期,)) 的缓存键，派生序列上的指标把源表达式也放进键里
+        params = node.params if src_node == CLOSE else (src_node, *node.params)
+        return cache(node.op, params, compute).to_numpy(dtype=np.float64)
+
+
+def compile_strategy(spec: StrategySpec) -> CompiledStrategy:
+    return CompiledStrategy(spec)
+
+
+def run_strategy(spec: StrategySpec, frame: pd.DataFrame, cache=None) -> StrategyResult:
+    return compile_strategy(spec).run(frame, cache)
@@ -0,0 +1,252 @@
+import math
+
+import pandas as pd
+
+# --- 流式指标与信号引擎 (Streaming Indicators) ---
+# 实盘/盘中逐根 K 线推送时，不再对整段历史重算 rolling / ewm，而是维护每个指标的增量状态，
+# 每来一根 K 线只做常数次运算 (均线只保留窗口内的数据，内存与历史长度无关)。
+#
+# 所有递推式都逐步复刻 pandas 内部实现 (含 Kahan 补偿求和与各种数值兜底分支)，
+# 用同一段历史回放得到的指标值与 Signal 与 app.py 批量计算的结果逐位一致。
+
+NAN = float("nan")
+
+
+def _signbit(x: float) -> bool:
+    return math.copysign(1.0, x) < 0
+
+
+def _div(a: float, b: float) -> float:
+    """IEEE 754 语义的除法 (与 NumPy/pandas 一致，除零得到 ±inf 或 NaN 而不是抛异常)"""
+    if b == 0:
+        if a == 0 or a != a:
+            return NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+class RollingMean:
+    """与 Series.rolling(window).mean() 等价的增量滚动均值"""
+    __slots__ = ("window", "_buf", "_pos", "_count", "_nobs", "_sum", "_neg_ct",
+                 "_comp_add", "_comp_remove", "_same_ct", "_prev_value")
+
+    def __init__(self, window: int):
+        self.window = window
+        self._buf = [NAN] * window
+        self._pos = 0
+        self._count = 0
+        self._nobs = 0
+        self._sum = 0.0
+        self._neg_ct = 0
+        self._comp_add = 0.0
+        self._comp_remove = 0.0
+        self._same_ct = 0
+        self._prev_value = NAN
+
+    def update(self, val: float) -> float:
+        if self._count == 0:
+            self._prev_value = val
+        elif self._count >= self.window:
+            # 窗口已满：先移出最旧的值，再加入新值 (顺序与 pandas 相同)
+            old = self._buf[self._pos]
+            if old == old:
+                self._nobs -= 1
+                y = -old - self._comp_remove
+                t = self._sum + y
+                self._comp_remove = t - self._sum - y
+                self._sum = t
+                if _signbit(old):
+                    self._neg_ct -= 1
+
+        if val == val:
+            self._nobs += 1
+            y = val - self._comp_add
+            t = self._sum + y
+            self._comp_add = t - self._sum - y
+            self._sum = t
+            if _signbit(val):
+                self._neg_ct += 1
+            # 连续相同值计数，用于消除浮点误差 (pandas GH#42064)
+            if val == self._prev_value:
+                self._same_ct += 1
+            else:
+                self._same_ct = 1
+            self._prev_value = val
+
+        self._buf[self._pos] = val
+        self._pos = (self._pos + 1) % self.window
+        self._count += 1
+
+        nobs = self._nobs
+        if nobs >= self.window and nobs > 0:
+            result = self._sum / nobs
+            if self._same_ct >= nobs:
+                result = self._prev_value
+            elif self._neg_ct == 0 and result < 0:
+                result = 0.0
+            elif self._neg_ct == nobs and result > 0:
+                result = 0.0
+            return result
+        return NAN
+
+
+class EWMMean:
+    """与 Series.ewm(span=span, adjust=False).mean() 等价的增量指数均线"""
+    __slots__ = ("alpha", "_weighted", "_old_wt", "_nobs", "_started")
+
+    def __init__(self, span: int):
+        self.alpha = 2.0 / (span + 1.0)
+        self._weighted = NAN
+        self._old_wt = 1.0
+        self._nobs = 0
+        self._started = False
+
+    def update(self, cur: float) -> float:
+        is_observation = cur == cur
+        if not self._started:
+            self._started = True
+            self._weighted = cur
+            self._nobs = int(is_observation)
+        else:
+            self._nobs += is_observation
+            weighted = self._weighted
+            if weighted == weighted:
+                self._old_wt *= 1.0 - self.alpha
+                if is_observation:
+                    # 与 pandas 相同：数值未变化时不做递推，避免常数序列出现浮点漂移
+                    if weighted != cur:
+                        weighted = (self._old_wt * weighted + self.alpha * cur) / (self._old_wt + self.alpha)
+                        self._weighted = weighted
+                    self._old_wt = 1.0
+            elif is_observation:
+                self._weighted = cur
+        return self._weighted if self._nobs >= 1 else NAN
+
+
+class RSIStream:
+    """与 app.py 同口径的 RSI：涨跌幅分别做简单滚动均值"""
+    __slots__ = ("_prev_close", "_gain", "_loss")
+
+    def __init__(self, period: int):
+        self._prev_close = NAN
+        self._gain = RollingMean(period)
+        self._loss = RollingMean(period)
+
+    def update(self, close: float) -> float:
+        delta = close - self._prev_close
+        self._prev_close = close
+        # 对应 delta.where(delta > 0, 0) 与 -delta.where(delta < 0, 0)，注意后者会产生 -0.0
+        gain = self._gain.update(delta if delta > 0 else 0.0)
+        loss = self._loss.update(-(delta if delta < 0 else 0.0))
+        rs = _div(gain, loss)
+        return 100 - _div(100, 1 + rs)
+
+
+class MACDStream:
+    """增量 MACD，返回 (DIF, DEA, MACD柱)"""
+    __slots__ = ("_fast", "_slow", "_dea")
+
+    def __init__(self, fast: int, slow: int, signal_period: int = 9):
+        self._fast = EWMMean(fast)
+        self._slow = EWMMean(slow)
+        self._dea = EWMMean(signal_period)
+
+    def update(self, close: float) -> tuple:
+        dif = self._fast.update(close) - self._slow.update(close)
+        dea = self._dea.update(dif)
+        return dif, dea, 2 * (dif - dea)
+
+
+# --- 流式信号规则 ---
+# update() 每根 K 线返回一个 dict：指标值、当根是否出现买/卖点 (用于打 Marker)，
+# 以及 Signal —— 与批量流水线一致，是延后 1 根 K 线成交后的实际持仓。
+
+class DualMAStream:
+    def __init__(self, ma_short: int, ma_long: int):
+        self.ma_short = ma_short
+        self.ma_long = ma_long
+        self._short = RollingMean(ma_short)
+        self._long = RollingMean(ma_long)
+        self._prev_short = NAN
+        self._prev_long = NAN
+        self._raw_signal = 0
+
+    def update(self, close: float) -> dict:
+        s = self._short.update(close)
+        l = self._long.update(close)
+        buy = self._prev_short < self._prev_long and s > l
+        sell = self._prev_short > self._prev_long and s < l
+        self._prev_short, self._prev_long = s, l
+
+        signal = self._raw_signal
+        self._raw_signal = 1 if s > l else 0
+        return {'MA_Short': s, 'MA_Long': l, 'buy': buy, 'sell': sell, 'Signal': signal}
+
+
+class MACDRSIStream:
+    def __init__(self, macd_fast: int, macd_slow: int, rsi_period: int, rsi_overbought: float,
+                 signal_period: int = 9, **_):
+        self.rsi_overbought = rsi_overbought
+        self._macd = MACDStream(macd_fast, macd_slow, signal_period)
+        self._rsi = RSIStream(rsi_period)
+        self._prev_dif = NAN
+        self._prev_dea = NAN
+        self._prev_rsi = NAN
+        self._holding = False
+
+    def update(self, close: float) -> dict:
+        dif, dea, hist = self._macd.update(close)
+        rsi_value = self._rsi.update(close)
+        ob = self.rsi_overbought
+        buy = self._prev_dif < self._prev_dea and dif > dea and rsi_value < ob
+        sell = ((self._prev_dif > self._prev_dea and dif < dea)
+                or (self._prev_rsi >= ob and rsi_value < ob))
+        self._prev_dif, self._prev_dea, self._prev_rsi = dif, dea, rsi_value
+
+        signal = 1 if self._holding else 0
+        # 卖点优先于买点，没有新信号时沿用之前的持仓状态
+        if sell:
+            self._holding = False
+        elif buy:
+            self._holding = True
+        return {'DIF': dif, 'DEA': dea, 'MACD': hist, 'RSI': rsi_value, 'buy': buy, 'sell': sell, 'Signal': signal}
+
+
+STREAMS = {
+    'dual_ma': DualMAStream,
+    'macd_rsi': MACDRSIStream,
+}
+
+
+def make_stream(strategy: str, params: dict):
+    """按策略名与 app.py 滑块同名的参数字典创建流式信号引擎"""
+    if strategy not in STREAMS:
+        raise ValueError(f"未知策略: {strategy}")
+    return STREAMS[strategy](**params)
+
+
+class SignalMonitor:
+    """
+    多标的盘中监控：每个标的维护一份独立的流式状态，按到达顺序推送 K 线。
+    """
+
+    def __init__(self, strategy: str, params: dict):
+        self.strategy = strategy
+        self.params = params
+        self._streams = {}
+
+    def on_bar(self, symbol: str, close: float) -> dict:
+        stream = self._streams.get(symbol)
+        if stream is None:
+            stream = self._streams[symbol] = make_stream(self.strategy, self.params)
+        return stream.update(float(close))
+
+    def symbols(self) -> list:
+        return list(self._streams)
+
+
+def replay(close: pd.Series, strategy: str, params: dict) -> pd.DataFrame:
+    """用流式引擎回放一段历史收盘价，结果可与批量计算逐列比对"""
+    stream = make_stream(strategy, params)
+    rows = [stream.update(float(c)) for c in close]
+    return pd.DataFrame(rows, index=close.index)
@@ -0,0 +1,186 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from utils.indicators import sma, ema, rsi, ewm_rows
+from utils.signals import shift_prev, hold_state, dual_ma_signal
+
+# --- 参数扫描引擎 (Parameter Sweep) ---
+# 一次性评估整张滑块网格：每个不同的窗口只算一次指标，
+# 金叉判断与收益统计在 (参数组合 × 交易日) 的二维/三维数组上广播完成，
+# 网格较大时按块分发到进程池并行计算。
+
+# 单个任务块允许占用的中间数组内存上限 (字节)
+CHUNK_BYTES = 64 * 1024 * 1024
+# 网格规模 (组合数 × 交易日) 低于该值时直接在当前进程计算，省去进程池启动开销
+PARALLEL_MIN_CELLS = 20_000_000
+
+# 子进程共享的只读数据，由 _init_worker 注入
+_SHARED = {}
+
+
+def _init_worker(shared: dict):
+    global _SHARED
+    _SHARED = shared
+
+
+def _daily_returns(close: np.ndarray) -> np.ndarray:
+    """与 pct_change().fillna(0) 同口径的日收益率"""
+    ret = np.zeros_like(close, dtype=np.float64)
+    ret[1:] = close[1:] / close[:-1] - 1
+    return ret
+
+
+def _score(signal: np.ndarray, ret: np.ndarray) -> dict:
+    """
+    对一批信号矩阵 (..., 交易日) 计算回测指标。
+    信号统一延后 1 天成交 (避免未来函数)，与单次回测流水线一致。
+    """
+    pos = np.zeros(signal.shape, dtype=np.float64)
+    pos[..., 1:] = signal[..., :-1]
+
+    # 累计净值 = Π(1 + r)，用对数收益做矩阵乘法，避免为每个组合分配收益率矩阵
+    log_ret = np.log1p(ret)
+    total_return = (np.exp(pos @ log_ret) - 1) * 100
+    holding_days = pos.sum(axis=-1)
+    winning_days = pos @ (ret > 0).astype(np.float64)
+    win_rate = np.divide(winning_days * 100, holding_days, out=np.zeros_like(holding_days), where=holding_days > 0)
+    # 开仓次数：当天持仓且前一天空仓
+    trades = pos[..., 0] + (pos[..., 1:] > pos[..., :-1]).sum(axis=-1)
+
+    return {
+        'total_return': total_return,
+        'win_rate': win_rate,
+        'holding_days': holding_days.astype(np.int64),
+        'trades': trades.astype(np.int64),
+    }
+
+
+def _dual_ma_chunk(short_windows: list, long_windows: list) -> dict:
+    ma = _SHARED['ma']
+    ret = _SHARED['ret']
+    ma_short = np.stack([ma[w] for w in short_windows])
+    ma_long = np.stack([ma[w] for w in long_windows])
+
+    # (短周期, 长周期, 交易日)
+    signal = dual_ma_signal(ma_short[:, None, :], ma_long[None, :, :])
+    metrics = _score(signal, ret)
+
+    grid = np.array(list(product(short_windows, long_windows)), dtype=np.int64)
+    result = {'ma_short': grid[:, 0], 'ma_long': grid[:, 1]}
+    result.update({k: v.ravel() for k, v in metrics.items()})
+    return result
+
+
+def _macd_rsi_chunk(pairs: list, rsi_periods: list, overboughts: list) -> dict:
+    ema_table = _SHARED['ema']
+    rsi_table = _SHARED['rsi']
+    ret = _SHARED['ret']
+    signal_period = _SHARED['signal_period']
+
+    dif = np.stack([ema_table[f] - ema_table[s] for f, s in pairs])
+    dea = ewm_rows(dif, signal_period)
+    prev_dif = shift_prev(dif)
+    prev_dea = shift_prev(dea)
+    golden = (prev_dif < prev_dea) & (dif > dea)
+    death = (prev_dif > prev_dea) & (dif < dea)
+
+    ob = np.asarray(overboughts, dtype=np.float64)[:, None]
+    parts = []
+    for p in rsi_periods:
+        r = rsi_table[p]
+        prev_r = shift_prev(r)
+        rsi_ok = r[None, :] < ob
+        rsi_drop = (prev_r[None, :] >= ob) & (r[None, :] < ob)
+
+        # (MACD 组合, 超买阈值, 交易日)
+        buy = golden[:, None, :] & rsi_ok[None, :, :]
+        sell = death[:, None, :] | rsi_drop[None, :, :]
+        metrics = _score(hold_state(buy, sell), ret)
+
+        grid = np.array([(f, s, p, b) for (f, s), b in product(pairs, overboughts)], dtype=np.int64)
+        part = {'macd_fast': grid[:, 0], 'macd_slow': grid[:, 1], 'rsi_period': grid[:, 2], 'rsi_overbought': grid[:, 3]}
+        part.update({k: v.ravel() for k, v in metrics.items()})
+        parts.append(part)
+
+    return {k: np.concatenate([part[k] for part in parts]) for k in parts[0]}
+
+
+def _chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _run(worker, tasks: list, shared: dict, total_cells: int, n_jobs: int | None) -> pd.DataFrame:
+    if n_jobs is None:
+        n_jobs = (os.cpu_count() or 1) if total_cells >= PARALLEL_MIN_CELLS else 1
+    n_jobs = min(n_jobs, len(tasks))
+
+    if n_jobs <= 1:
+        _init_worker(shared)
+        results = [worker(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(shared,)) as pool:
+            results = list(pool.map(worker, *zip(*tasks)))
+
+    merged = {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+    table = pd.DataFrame(merged)
+    return table.sort_values('total_return', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def sweep_dual_ma(close: pd.Series, short_windows, long_windows, n_jobs: int | None = None) -> pd.DataFrame:
+    """
+    双均线策略全网格扫描。
+    返回按累计收益率降序排列的结果表：
+    ma_short, ma_long, total_return(%), win_rate(%), holding_days, trades
+    """
+    close = close.reset_index(drop=True).astype(np.float64)
+    short_windows = sorted(set(int(w) for w in short_windows))
+    long_windows = sorted(set(int(w) for w in long_windows))
+    n_days = len(close)
+
+    # 长短周期的并集，每个窗口只计算一次均线
+    ma = {w: sma(close, w).to_numpy() for w in sorted(set(short_windows) | set(long_windows))}
+    shared = {'ma': ma, 'ret': _daily_returns(close.to_numpy())}
+
+    cells_per_short = len(long_windows) * n_days
+    chunk = max(1, CHUNK_BYTES // (cells_per_short * 10))
+    if n_jobs != 1:
+        # 保证每个进程至少分到一块
+        chunk = min(chunk, -(-len(short_windows) // (os.cpu_count() or 1)))
+    tasks = [(part, long_windows) for part in _chunks(short_windows, chunk)]
+    return _run(_dual_ma_chunk, tasks, shared, len(short_windows) * cells_per_short, n_jobs)
+
+
+def sweep_macd_rsi(close: pd.Series, fast_spans, slow_spans, rsi_periods, rsi_overboughts,
+                   signal_period: int = 9, n_jobs: int | None = None) -> pd.DataFrame:
+    """
+    MACD + RSI 策略全网格扫描。
+    当前买卖规则只用到超买阈值 (超卖阈值不参与信号)，因此网格维度为
+    macd_fast × macd_slow × rsi_period × rsi_overbought。
+    """
+    close = close.reset_index(drop=True).astype(np.float64)
+    fast_spans = sorted(set(int(s) for s in fast_spans))
+    slow_spans = sorted(set(int(s) for s in slow_spans))
+    rsi_periods = sorted(set(int(p) for p in rsi_periods))
+    rsi_overboughts = sorted(set(int(b) for b in rsi_overboughts))
+    n_days = len(close)
+
+    shared = {
+        'ema': {s: ema(close, s).to_numpy() for s in sorted(set(fast_spans) | set(slow_spans))},
+        'rsi': {p: rsi(close, p).to_numpy() for p in rsi_periods},
+        'ret': _daily_returns(close.to_numpy()),
+        'signal_period': signal_period,
+    }
+
+    pairs = list(product(fast_spans, slow_spans))
+    # 每个 MACD 组合在单个 RSI 周期下的中间数组：买卖点/状态 (int8) + 位置索引 (int32) + 持仓 (float64)
+    cells_per_pair = len(rsi_overboughts) * n_days
+    chunk = max(1, CHUNK_BYTES // (cells_per_pair * 16))
+    if n_jobs != 1:
+        chunk = min(chunk, -(-len(pairs) // (os.cpu_count() or 1)))
+    tasks = [(part, rsi_periods, rsi_overboughts) for part in _chunks(pairs, chunk)]
+    total_cells = len(pairs) * len(rsi_periods) * cells_per_pair
+    return _run(_macd_rsi_chunk, tasks, shared, total_cells, n_jobs)
@@ -0,0 +1,94 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# --- 合成行情生成器 ---
+# 生成与缓存同结构 (中文字段) 的 OHLCV 数据，供离线桩数据源与性能基准使用。
+# 同一个种子总是生成同一条价格路径，任意区间切片在重叠部分的数值完全一致。
+
+ORIGIN = "2000-01-03"
+
+
+def symbol_seed(symbol: str) -> int:
+    """由代码字符串得到稳定的随机种子"""
+    return zlib.crc32(symbol.encode("utf-8"))
+
+
+def synthetic_ohlcv(n_rows: int, seed: int = 0, start: str = ORIGIN, freq: str = "B",
+                    drift: float = 0.0002, volatility: float = 0.02) -> pd.DataFrame:
+    """
+    生成 n_rows 根几何布朗运动 K 线。
+    freq 为 pandas 频率字符串，日线用 "B"，分钟线可用 "min"；
+    drift / volatility 为单根 K 线的对数收益均值与波动率，默认值对应日线。
+    """
+    # 每个字段使用独立的随机流，保证更长的序列是更短序列的前缀扩展
+    rng_close, rng_open, rng_spread, rng_volume = (np.random.default_rng([seed, k]) for k in range(4))
+    if freq == "B":
+        # 工作日序列用 NumPy 生成，比 pd.bdate_range 快两个数量级
+        offsets = np.busday_offset(np.datetime64(start, 'D'), np.arange(n_rows), roll='forward')
+        dates = pd.DatetimeIndex(offsets.astype('datetime64[ns]'))
+    else:
+        dates = pd.date_range(start, periods=n_rows, freq=freq)
+    close = 10 * np.exp(np.cumsum(rng_close.normal(drift, volatility, n_rows)))
+    open_ = close * np.exp(rng_open.normal(0, 0.005, n_rows))
+    spread = np.abs(rng_spread.normal(0, 0.01, n_rows))
+    return pd.DataFrame({
+        '日期': dates,
+        '开盘': open_,
+        '最高': np.maximum(open_, close) * (1 + spread),
+        '最低': np.minimum(open_, close) * (1 - spread),
+        '收盘': close,
+        '成交量': rng_volume.integers(1_000, 1_000_000, n_rows, dtype=np.int64),
+    })
+
+
+def synthetic_daily_range(symbol: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """某个代码在 [start, end] 内的合成日线，路径从 ORIGIN 起算，保证跨请求一致"""
+    last = max(end, pd.Timestamp(ORIGIN)) + pd.Timedelta(days=1)
+    n_rows = int(np.busday_count(np.datetime64(ORIGIN, 'D'), np.datetime64(last.date(), 'D')))
+    df = synthetic_ohlcv(n_rows, seed=symbol_seed(symbol))
+    return df[(df['日期'] >= start) & (df['日期'] <= end)].reset_index(drop=True)
+
+
+# 各市场一个交易日内的 1 分钟 K 线时间 (距当日 0 点的分钟数，K 线以结束时刻标记)
+SESSION_MINUTES = {
+    "A": np.concatenate([np.arange(9 * 60 + 31, 11 * 60 + 31), np.arange(13 * 60 + 1, 15 * 60 + 1)]),
+    "US": np.arange(9 * 60 + 31, 16 * 60 + 1),
+}
+
+
+def synthetic_intraday_range(symbol: str, start: pd.Timestamp, end: pd.Timestamp, bar_minutes: int = 1,
+                             market: str = "A") -> pd.DataFrame:
+    """
+    某个代码在 [start, end] 内的合成分钟线 (交易时段内)。
+    每个交易日以当天合成日线的开盘价起步，按 (代码, 日期) 固定随机种子，保证跨请求一致。
+    """
+    daily = synthetic_daily_range(symbol, start.normalize(), end)
+    minutes = SESSION_MINUTES[market][bar_minutes - 1::bar_minutes]
+    if daily.empty:
+        return pd.DataFrame(columns=['日期', '开盘', '最高', '最低', '收盘', '成交量'])
+
+    per_day = len(minutes)
+    seed = symbol_seed(symbol)
+    days = daily['日期'].to_numpy().astype('datetime64[D]')
+    steps, spread, volume = [], [], []
+    for day in days.astype(np.int64):
+        rng = np.random.default_rng([seed, int(day), bar_minutes])
+        steps.append(rng.normal(0, 0.02 / np.sqrt(per_day), per_day))
+        spread.append(np.abs(rng.normal(0, 0.002, per_day)))
+        volume.append(rng.integers(100, 100_000, per_day, dtype=np.int64))
+    close = daily['开盘'].to_numpy()[:, None] * np.exp(np.cumsum(steps, axis=1))
+    open_ = np.concatenate([daily['开盘'].to_numpy()[:, None], close[:, :-1]], axis=1)
+    spread = np.array(spread)
+
+    times = days[:, None].astype('datetime64[m]') + minutes[None, :].astype('timedelta64[m]')
+    df = pd.DataFrame({
+        '日期': pd.DatetimeIndex(times.ravel().astype('datetime64[ns]')),
+        '开盘': open_.ravel(),
+        '最高': (np.maximum(open_, close) * (1 + spread)).ravel(),
+        '最低': (np.minimum(open_, close) * (1 - spread)).ravel(),
+        '收盘': close.ravel(),
+        '成交量': np.concatenate(volume),
+    })
+    return df[(df['日期'] >= start) & (df['日期'] <= end)].reset_index(drop=True)
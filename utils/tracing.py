@@ -0,0 +1,249 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# --- 分阶段耗时追踪 (Tracing) ---
+# 一次页面运行对应一个 Trace，内部由嵌套的 Span 组成：
+#   with span("load.read_daily", symbol=...) as sp:
+#       ...
+#       if sp:                      # 关闭追踪时 sp 为假，跳过统计字段的计算
+#           sp.set(rows=len(df))
+# 当前 Span 保存在 contextvars 中，加载函数无需层层传参即可挂到调用方的 Trace 下。
+# 没有活动的 Trace 时 span() 直接返回同一个空对象，开销只有一次上下文变量读取。
+# Trace 结束时以一行 JSON 追加到滚动日志，同时提供给侧边栏展示耗时分解。
+
+# 环境变量 QUANT_TRACE=1 时默认开启追踪
+TRACE_ENV = "QUANT_TRACE"
+TRACE_LOG = os.path.join("data", "trace.jsonl")
+# 单个日志文件上限与保留的历史文件个数
+TRACE_LOG_BYTES = 5 * 1024 * 1024
+TRACE_LOG_BACKUPS = 3
+
+_current = contextvars.ContextVar("quant_trace_span", default=None)
+_loggers = {}
+
+
+def tracing_enabled() -> bool:
+    return os.environ.get(TRACE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+class Span:
+    __slots__ = ("trace", "name", "parent", "attrs", "start", "duration_ms", "_token")
+
+    def __init__(self, trace, name: str, parent, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.start = None
+        self.duration_ms = None
+        self._token = None
+
+    def __bool__(self):
+        return True
+
+    def set(self, **attrs):
+        """附加统计字段，如 rows / bytes / cache"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        return False
+
+    @property
+    def depth(self) -> int:
+        depth, node = 0, self.parent
+        while node is not None:
+            depth, node = depth + 1, node.parent
+        return depth
+
+
+class _NoopSpan:
+    """未开启追踪时使用的空 Span，所有操作都是空操作"""
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def finish(self):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace(Span):
+    """一次完整运行的根 Span，记录全部子 Span"""
+    __slots__ = ("trace_id", "started_at", "spans", "_stage", "log_path")
+
+    def __init__(self, name: str, attrs: dict, log_path: str = None):
+        super().__init__(self, name, None, attrs)
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.spans = []
+        self._stage = None
+        self.log_path = log_path
+
+    def end_stage(self):
+        if self._stage is not None:
+            self._stage.__exit__(None, None, None)
+            self._stage = None
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.duration_ms is not None:
+            return False
+        self.end_stage()
+        super().__exit__(exc_type, exc, tb)
+        if self.log_path:
+            _write_log(self.log_path, self.to_dict())
+        return False
+
+    def finish(self):
+        """不使用 with 语句时手动结束 Trace"""
+        self.__exit__(None, None, None)
+
+    def to_dict(self) -> dict:
+        def offset(sp):
+            return round((sp.start - self.start) * 1000, 3) if sp.start is not None else None
+
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_ms': round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            'attrs': self.attrs,
+            'spans': [{
+                'name': sp.name,
+                'parent': sp.parent.name,
+                'depth': sp.depth,
+                'start_ms': offset(sp),
+                'duration_ms': round(sp.duration_ms, 3) if sp.duration_ms is not None else None,
+                'attrs': sp.attrs,
+            } for sp in self.spans],
+        }
+
+    def breakdown(self) -> list:
+        """按发生顺序列出各阶段耗时与占比，用于界面展示"""
+        total = self.duration_ms or 0.0
+        rows = []
+        for sp in self.spans:
+            ms = sp.duration_ms or 0.0
+            rows.append({
+                'stage': sp.name,
+                'depth': sp.depth - 1,
+                'ms': ms,
+                'share': ms / total if total else 0.0,
+                'attrs': sp.attrs,
+            })
+        return rows
+
+
+def start_trace(name: str, log_path: str = TRACE_LOG, enabled: bool = None, **attrs):
+    """
+    开始一次 Trace 并设为当前上下文，可用作 with 语句，或手动调用 finish()。
+    enabled 为 None 时按环境变量决定；未开启时返回空对象，并清除上下文中残留的 Span
+    (上一次运行被异常打断、没有结束的 Trace 不会继续收集本次的 Span)。
+    """
+    if enabled is None:
+        enabled = tracing_enabled()
+    if not enabled:
+        _current.set(None)
+        return _NOOP
+    trace = Trace(name, attrs, log_path)
+    trace.__enter__()
+    return trace
+
+
+def span(name: str, **attrs):
+    """在当前 Span 下创建子 Span；没有活动的 Trace 时返回空对象"""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    sp = Span(parent.trace, name, parent, attrs)
+    parent.trace.spans.append(sp)
+    return sp
+
+
+def stage(name: str, **attrs):
+    """
+    顺序计时：结束上一个阶段并开始新阶段，适合自上而下执行的页面脚本，
+    免去把整段代码缩进到 with 语句里。只能在 Trace 的顶层调用。
+    """
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    trace = current.trace
+    if current is not trace and current is not trace._stage:
+        return _NOOP
+    trace.end_stage()
+    sp = Span(trace, name, trace, attrs)
+    trace.spans.append(sp)
+    trace._stage = sp.__enter__()
+    return sp
+
+
+def annotate(**attrs):
+    """给当前 Span 追加统计字段 (没有活动的 Trace 时忽略)"""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def increment(key: str, n: int = 1):
+    """给当前 Span 的计数字段累加 (如同一阶段内多次缓存命中)"""
+    current = _current.get()
+    if current is not None:
+        current.attrs[key] = current.attrs.get(key, 0) + n
+
+
+def traced(name: str):
+    """函数装饰器：调用时若处于 Trace 中，则整个函数体计入一个 Span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write_log(log_path: str, record: dict):
+    """按行追加 JSON，文件超过上限时自动轮转 (RotatingFileHandler 自带线程锁)"""
+    logger = _loggers.get(log_path)
+    if logger is None:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        logger = logging.getLogger(f"quant.trace.{log_path}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=TRACE_LOG_BYTES, backupCount=TRACE_LOG_BACKUPS,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        logger = _loggers.setdefault(log_path, logger)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
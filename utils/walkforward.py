@@ -0,0 +1,287 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from utils.indicators import sma, ema, rsi, ewm_rows
+from utils.signals import shift_prev, hold_state, dual_ma_signal, macd_rsi_signal
+from utils.sweep import CHUNK_BYTES, PARALLEL_MIN_CELLS, _chunks, _daily_returns, _score
+
+# --- 滚动前推优化 (Walk-forward Optimization) ---
+# 把历史切成若干 (训练段, 测试段) 折：在训练段上全网格寻优，把最优参数原样用到紧随其后的测试段，
+# 各测试段首尾相接得到一条完全样本外 (Out-of-Sample) 的净值曲线。
+#   rolling  — 训练段固定长度，随测试段一起向前滚动
+#   anchored — 训练段起点固定在第一天，长度逐折增加
+# 指标在整段历史上只计算一次 (均线/EMA/RSI 都只依赖过去的数据，切片即是当时能看到的值)，
+# 各折在子进程中只做切片、信号与打分，折与折之间并行。
+
+# 默认训练段约两年、测试段约一个季度 (交易日)
+TRAIN_DAYS = 504
+TEST_DAYS = 63
+# 可用于选优的训练段指标
+SELECT_METRICS = ('total_return', 'win_rate')
+TRADING_DAYS_PER_YEAR = 252
+
+# 子进程共享的只读数据，由 _init_worker 注入
+_SHARED = {}
+
+
+def _init_worker(shared: dict):
+    global _SHARED
+    _SHARED = shared
+
+
+@dataclass
+class WalkForwardResult:
+    equity: pd.DataFrame     # 拼接后的样本外每日收益、策略净值、基准净值与所属折
+    folds: pd.DataFrame      # 每折的起止日期、最优参数、训练段与测试段绩效
+    stability: pd.DataFrame  # 各参数在不同折之间的稳定性统计
+    summary: dict            # 汇总绩效指标
+
+
+def make_folds(n_days: int, train_days: int = TRAIN_DAYS, test_days: int = TEST_DAYS,
+               anchored: bool = False) -> list:
+    """
+    按位置切分折，返回 [(训练起点, 测试起点, 测试终点), ...]，均为左闭右开下标。
+    测试段首尾相接、互不重叠，最后一折的测试段可能不足 test_days。
+    """
+    if train_days < 2 or test_days < 1:
+        raise ValueError("训练段至少 2 个交易日，测试段至少 1 个交易日")
+    folds = []
+    for test_start in range(train_days, n_days, test_days):
+        train_start = 0 if anchored else test_start - train_days
+        folds.append((train_start, test_start, min(test_start + test_days, n_days)))
+    return folds
+
+
+def _oos(pos: np.ndarray, test_start: int, test_end: int) -> dict:
+    """测试段上的持仓 (已延后 1 天) 与每日收益"""
+    ret = _SHARED['ret'][test_start:test_end]
+    strat = pos * ret
+    return {
+        'positions': pos,
+        'returns': strat,
+        'test_return': (np.prod(1 + strat) - 1) * 100,
+        'benchmark_return': (np.prod(1 + ret) - 1) * 100,
+        'trades': int(pos[0] + (pos[1:] > pos[:-1]).sum()),
+    }
+
+
+def _rank_values(values: np.ndarray) -> np.ndarray:
+    """选优用的一维指标，NaN (如前复权出现非正价格导致收益无法计算) 排在最后"""
+    values = values.ravel()
+    return np.where(np.isnan(values), -np.inf, values)
+
+
+def _dual_ma_fold(train_start: int, test_start: int, test_end: int) -> dict:
+    ma = _SHARED['ma']
+    shorts, longs = _SHARED['ma_short'], _SHARED['ma_long']
+    metric = _SHARED['metric']
+    a, b = train_start, test_start
+    train_ret = _SHARED['ret'][a:b]
+
+    # 训练段寻优：与全网格扫描同样的广播方式，按块控制中间数组内存
+    long_block = np.stack([ma[w][a:b] for w in longs])
+    chunk = max(1, CHUNK_BYTES // (len(longs) * (b - a) * 10))
+    best_value, best = -np.inf, None
+    for part in _chunks(shorts, chunk):
+        short_block = np.stack([ma[w][a:b] for w in part])
+        metrics = _score(dual_ma_signal(short_block[:, None, :], long_block[None, :, :]), train_ret)
+        values = _rank_values(metrics[metric])
+        idx = int(values.argmax())
+        if best is None or values[idx] > best_value:
+            i, j = divmod(idx, len(longs))
+            best_value = values[idx]
+            best = {'ma_short': part[i], 'ma_long': longs[j],
+                    'train_return': float(metrics['total_return'].ravel()[idx])}
+
+    # 测试段：持仓 = 前一天的信号
+    s, l = best['ma_short'], best['ma_long']
+    pos = dual_ma_signal(ma[s][test_start - 1:test_end - 1], ma[l][test_start - 1:test_end - 1]).astype(np.float64)
+    return {**best, **_oos(pos, test_start, test_end)}
+
+
+def _macd_rsi_fold(train_start: int, test_start: int, test_end: int) -> dict:
+    dif_table, dea_table, pairs = _SHARED['dif'], _SHARED['dea'], _SHARED['pairs']
+    rsi_table = _SHARED['rsi']
+    rsi_periods, overboughts = _SHARED['rsi_period'], _SHARED['rsi_overbought']
+    metric = _SHARED['metric']
+    a, b = train_start, test_start
+    train_ret = _SHARED['ret'][a:b]
+
+    ob = np.asarray(overboughts, dtype=np.float64)[:, None]
+    chunk = max(1, CHUNK_BYTES // (len(overboughts) * (b - a) * 16))
+    best_value, best = -np.inf, None
+    for rows in _chunks(list(range(len(pairs))), chunk):
+        dif, dea = dif_table[rows, a:b], dea_table[rows, a:b]
+        prev_dif, prev_dea = shift_prev(dif), shift_prev(dea)
+        golden = (prev_dif < prev_dea) & (dif > dea)
+        death = (prev_dif > prev_dea) & (dif < dea)
+        for p in rsi_periods:
+            r = rsi_table[p][a:b]
+            prev_r = shift_prev(r)
+            rsi_ok = r[None, :] < ob
+            rsi_drop = (prev_r[None, :] >= ob) & (r[None, :] < ob)
+            # (MACD 组合, 超买阈值, 交易日)
+            buy = golden[:, None, :] & rsi_ok[None, :, :]
+            sell = death[:, None, :] | rsi_drop[None, :, :]
+            metrics = _score(hold_state(buy, sell), train_ret)
+            values = _rank_values(metrics[metric])
+            idx = int(values.argmax())
+            if best is None or values[idx] > best_value:
+                i, j = divmod(idx, len(overboughts))
+                fast, slow = pairs[rows[i]]
+                best_value = values[idx]
+                best = {'macd_fast': fast, 'macd_slow': slow, 'rsi_period': p, 'rsi_overbought': overboughts[j],
+                        'train_return': float(metrics['total_return'].ravel()[idx]), '_row': rows[i]}
+
+    # 测试段：持仓状态机依赖历史，从训练段起点连续推演到测试段结束
+    row = best.pop('_row')
+    held = macd_rsi_signal(dif_table[row, a:test_end], dea_table[row, a:test_end],
+                           rsi_table[best['rsi_period']][a:test_end], best['rsi_overbought'])
+    pos = held[test_start - 1 - a:test_end - 1 - a].astype(np.float64)
+    return {**best, **_oos(pos, test_start, test_end)}
+
+
+def _shared_dual_ma(close: pd.Series, grid: dict) -> tuple:
+    shorts = sorted(set(int(w) for w in grid['ma_short']))
+    longs = sorted(set(int(w) for w in grid['ma_long']))
+    ma = {w: sma(close, w).to_numpy() for w in sorted(set(shorts) | set(longs))}
+    return {'ma': ma, 'ma_short': shorts, 'ma_long': longs}, len(shorts) * len(longs)
+
+
+def _shared_macd_rsi(close: pd.Series, grid: dict, signal_period: int) -> tuple:
+    fast = sorted(set(int(s) for s in grid['macd_fast']))
+    slow = sorted(set(int(s) for s in grid['macd_slow']))
+    rsi_periods = sorted(set(int(p) for p in grid['rsi_period']))
+    overboughts = sorted(set(int(b) for b in grid['rsi_overbought']))
+    ema_table = {s: ema(close, s).to_numpy() for s in sorted(set(fast) | set(slow))}
+    pairs = list(product(fast, slow))
+    dif = np.stack([ema_table[f] - ema_table[s] for f, s in pairs])
+    shared = {
+        'pairs': pairs,
+        'dif': dif,
+        'dea': ewm_rows(dif, signal_period),
+        'rsi': {p: rsi(close, p).to_numpy() for p in rsi_periods},
+        'rsi_period': rsi_periods,
+        'rsi_overbought': overboughts,
+    }
+    return shared, len(pairs) * len(rsi_periods) * len(overboughts)
+
+
+PARAM_COLUMNS = {
+    'dual_ma': ['ma_short', 'ma_long'],
+    'macd_rsi': ['macd_fast', 'macd_slow', 'rsi_period', 'rsi_overbought'],
+}
+
+
+def parameter_stability(folds: pd.DataFrame, params: list) -> pd.DataFrame:
+    """
+    各参数在不同折之间的稳定性：均值、标准差、取值范围、最常出现的取值及其占比、相邻两折的变化次数。
+    变化越少、众数占比越高，说明最优参数越稳定，越不像是对单段行情的过拟合。
+    """
+    rows = []
+    for name in params:
+        values = folds[name]
+        counts = values.value_counts()
+        rows.append({
+            'param': name,
+            'mean': float(values.mean()),
+            'std': float(values.std(ddof=0)),
+            'min': int(values.min()),
+            'max': int(values.max()),
+            'mode': int(counts.index[0]),
+            'mode_share': float(counts.iloc[0] / len(values)),
+            'changes': int((values.diff().fillna(0) != 0).sum()),
+        })
+    return pd.DataFrame(rows)
+
+
+def walk_forward(df: pd.DataFrame, strategy: str, grid: dict, train_days: int = TRAIN_DAYS,
+                 test_days: int = TEST_DAYS, anchored: bool = False, metric: str = 'total_return',
+                 signal_period: int = 9, n_jobs: int | None = None) -> WalkForwardResult:
+    """
+    滚动前推优化。
+    df: 含 time / close 列的 K 线 (与共享表切片、load_frame 同口径)
+    strategy: 'dual_ma' (网格键 ma_short, ma_long) 或 'macd_rsi'
+              (网格键 macd_fast, macd_slow, rsi_period, rsi_overbought)，与参数扫描滑块同名
+    metric: 训练段选优指标，'total_return' 或 'win_rate'
+    """
+    if strategy not in PARAM_COLUMNS:
+        raise ValueError(f"未知策略: {strategy}")
+    if metric not in SELECT_METRICS:
+        raise ValueError(f"未知选优指标: {metric}，可选 {SELECT_METRICS}")
+
+    dates = pd.DatetimeIndex(df['time'])
+    close = df['close'].reset_index(drop=True).astype(np.float64)
+    folds = make_folds(len(close), train_days, test_days, anchored)
+    if not folds:
+        raise ValueError(f"数据只有 {len(close)} 个交易日，不足以切出训练段 {train_days} 天 + 测试段")
+
+    if strategy == 'dual_ma':
+        shared, combos = _shared_dual_ma(close, grid)
+        worker = _dual_ma_fold
+    else:
+        shared, combos = _shared_macd_rsi(close, grid, signal_period)
+        worker = _macd_rsi_fold
+    shared.update({'ret': _daily_returns(close.to_numpy()), 'metric': metric})
+
+    total_cells = combos * sum(b - a for a, b, _ in folds)
+    if n_jobs is None:
+        n_jobs = (os.cpu_count() or 1) if total_cells >= PARALLEL_MIN_CELLS else 1
+    n_jobs = min(n_jobs, len(folds))
+    if n_jobs <= 1:
+        _init_worker(shared)
+        results = [worker(*fold) for fold in folds]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(shared,)) as pool:
+            results = list(pool.map(worker, *zip(*folds)))
+
+    params = PARAM_COLUMNS[strategy]
+    fold_table = pd.DataFrame([{
+        'fold': i + 1,
+        'train_start': dates[a],
+        'train_end': dates[b - 1],
+        'test_start': dates[b],
+        'test_end': dates[c - 1],
+        **{name: r[name] for name in params},
+        'train_return': r['train_return'],
+        'test_return': r['test_return'],
+        'benchmark_return': r['benchmark_return'],
+        'trades': r['trades'],
+    } for i, ((a, b, c), r) in enumerate(zip(folds, results))])
+
+    first = folds[0][1]
+    strat_ret = np.concatenate([r['returns'] for r in results])
+    bench_ret = shared['ret'][first:]
+    equity = pd.DataFrame({
+        'time': dates[first:],
+        'fold': np.repeat(fold_table['fold'].to_numpy(), [c - b for _, b, c in folds]),
+        'position': np.concatenate([r['positions'] for r in results]),
+        'daily_return': strat_ret,
+        'nav': np.cumprod(1 + strat_ret),
+        'benchmark_nav': np.cumprod(1 + bench_ret),
+    })
+
+    # 训练段/测试段年化收益之比 (Walk-forward Efficiency)，接近 1 说明样本内的优势能延续到样本外
+    def annualized(returns: pd.Series, days) -> float:
+        return float(np.mean((1 + returns / 100) ** (TRADING_DAYS_PER_YEAR / np.asarray(days)) - 1))
+
+    train_ann = annualized(fold_table['train_return'], [b - a for a, b, _ in folds])
+    test_ann = annualized(fold_table['test_return'], [c - b for _, b, c in folds])
+    summary = {
+        'oos_return': float((equity['nav'].iloc[-1] - 1) * 100),
+        'benchmark_return': float((equity['benchmark_nav'].iloc[-1] - 1) * 100),
+        'max_drawdown': float((1 - equity['nav'] / equity['nav'].cummax()).max() * 100),
+        'folds': len(folds),
+        'positive_folds': int((fold_table['test_return'] > 0).sum()),
+        'beat_benchmark_folds': int((fold_table['test_return'] > fold_table['benchmark_return']).sum()),
+        'efficiency': test_ann / train_ann if train_ann > 0 else float('nan'),
+        'combos': combos,
+        'oos_days': len(equity),
+    }
+    return WalkForwardResult(equity=equity, folds=fold_table, stability=parameter_stability(fold_table, params),
+                             summary=summary)